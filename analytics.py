@@ -0,0 +1,304 @@
+import sys
+import argparse
+from db import with_db
+
+# -----------------------------
+# Customer summary
+# -----------------------------
+
+# Customer_Summary holds one row per customer with the figures the customer
+# report shows; Customer_Product_Summary holds per-product purchase counts
+# so the favourite product and top category can be kept current without
+# rescanning a customer's history. checkout() calls record_customer_order()
+# inside its transaction; rebuild_customer_summaries() recomputes everything.
+
+_FAVOURITES_SQL = """
+    UPDATE cs
+    SET cs.FavoriteProduct = (
+            SELECT TOP 1 p.Name
+            FROM Customer_Product_Summary cps
+            JOIN Product p ON p.ProductID = cps.ProductID
+            WHERE cps.CustomerID = cs.CustomerID
+            ORDER BY cps.Quantity DESC, cps.ProductID
+        ),
+        cs.MostPurchasedCategory = (
+            SELECT TOP 1 d.Name
+            FROM Customer_Product_Summary cps
+            JOIN Product p ON p.ProductID = cps.ProductID
+            JOIN Department d ON d.DepartmentID = p.DepartmentID
+            WHERE cps.CustomerID = cs.CustomerID
+            GROUP BY d.Name
+            ORDER BY SUM(cps.Quantity) DESC, d.Name
+        )
+    FROM Customer_Summary cs
+"""
+
+def record_customer_order(cursor, customer_id, transaction_id):
+    """
+    Fold a new order into the customer's summary rows. Runs on the caller's
+    cursor so it commits or rolls back together with the order itself.
+    """
+    cursor.execute("""
+        MERGE Customer_Product_Summary WITH (HOLDLOCK) AS target
+        USING (
+            SELECT ? AS CustomerID, ProductID, SUM(Quantity) AS Quantity
+            FROM Transaction_Details
+            WHERE TransactionID = ?
+            GROUP BY ProductID
+        ) AS src
+        ON target.CustomerID = src.CustomerID AND target.ProductID = src.ProductID
+        WHEN MATCHED THEN UPDATE SET Quantity = target.Quantity + src.Quantity
+        WHEN NOT MATCHED THEN
+            INSERT (CustomerID, ProductID, Quantity)
+            VALUES (src.CustomerID, src.ProductID, src.Quantity);
+    """, (customer_id, transaction_id))
+
+    cursor.execute("""
+        MERGE Customer_Summary WITH (HOLDLOCK) AS target
+        USING (
+            SELECT CustomerID, COALESCE(TotalAmount, 0) AS TotalAmount, TransactionDate
+            FROM SalesTransaction
+            WHERE TransactionID = ? AND CustomerID = ?
+        ) AS src
+        ON target.CustomerID = src.CustomerID
+        WHEN MATCHED THEN UPDATE SET
+            TotalPurchases = target.TotalPurchases + 1,
+            TotalSpent = target.TotalSpent + src.TotalAmount,
+            LargestSingleOrder = CASE WHEN src.TotalAmount > target.LargestSingleOrder
+                                      THEN src.TotalAmount ELSE target.LargestSingleOrder END,
+            RecentPurchaseDate = CASE WHEN target.RecentPurchaseDate IS NULL
+                                        OR src.TransactionDate > target.RecentPurchaseDate
+                                      THEN src.TransactionDate ELSE target.RecentPurchaseDate END,
+            UpdatedAt = GETDATE()
+        WHEN NOT MATCHED THEN
+            INSERT (CustomerID, TotalPurchases, TotalSpent, RecentPurchaseDate, LargestSingleOrder, UpdatedAt)
+            VALUES (src.CustomerID, 1, src.TotalAmount, src.TransactionDate, src.TotalAmount, GETDATE());
+    """, (transaction_id, customer_id))
+
+    cursor.execute(_FAVOURITES_SQL + " WHERE cs.CustomerID = ?", (customer_id,))
+
+def rebuild_customer_summaries(cursor, conn):
+    """Recompute every customer's summary from SalesTransaction / Transaction_Details."""
+    autocommit_backup = conn.autocommit
+    conn.autocommit = False
+    try:
+        cursor.execute("DELETE FROM Customer_Product_Summary")
+        cursor.execute("DELETE FROM Customer_Summary")
+        cursor.execute("""
+            INSERT INTO Customer_Product_Summary (CustomerID, ProductID, Quantity)
+            SELECT st.CustomerID, td.ProductID, SUM(td.Quantity)
+            FROM Transaction_Details td
+            JOIN SalesTransaction st ON st.TransactionID = td.TransactionID
+            WHERE st.CustomerID IS NOT NULL
+            GROUP BY st.CustomerID, td.ProductID
+        """)
+        cursor.execute("""
+            INSERT INTO Customer_Summary (CustomerID, TotalPurchases, TotalSpent,
+                                          RecentPurchaseDate, LargestSingleOrder, UpdatedAt)
+            SELECT CustomerID, COUNT(*), COALESCE(SUM(TotalAmount), 0),
+                   MAX(TransactionDate), COALESCE(MAX(TotalAmount), 0), GETDATE()
+            FROM SalesTransaction
+            WHERE CustomerID IS NOT NULL
+            GROUP BY CustomerID
+        """)
+        cursor.execute(_FAVOURITES_SQL)
+        cursor.execute("SELECT COUNT(*) FROM Customer_Summary")
+        count = cursor.fetchone()[0]
+        conn.commit()
+        return count
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit_backup
+
+# -----------------------------
+# Daily sales rollup
+# -----------------------------
+
+# Daily_Sales_Rollup: line revenue, units and line count per day, department,
+# employee, payment method and order status (0 / '' stand in for NULLs).
+# Daily_Order_Rollup: order count and order totals per day, payment method and
+# order status, since an order can span several departments and employees.
+#
+# Today's rollup rows are shared by every lane, so checkout() does not touch
+# them inside its own transaction: it only adds the order to
+# Sales_Rollup_Pending, then folds it in with a short transaction of its own
+# after the commit. Orders left pending (a failed fold) are picked up by
+# `python analytics.py pending`, or by a backfill of their day.
+
+_SALES_ROLLUP_SOURCE = """
+    SELECT CAST(st.TransactionDate AS DATE) AS SaleDate,
+           ISNULL(p.DepartmentID, 0) AS DepartmentID,
+           ISNULL(td.EmployeeID, 0) AS EmployeeID,
+           ISNULL(st.PaymentMethod, '') AS PaymentMethod,
+           ISNULL(st.OrderStatus, '') AS OrderStatus,
+           SUM(ISNULL(td.Subtotal, td.Quantity * td.Price)) AS Revenue,
+           SUM(td.Quantity) AS Quantity,
+           COUNT(*) AS LineItems
+    FROM SalesTransaction st
+    JOIN Transaction_Details td ON td.TransactionID = st.TransactionID
+    LEFT JOIN Product p ON p.ProductID = td.ProductID
+    WHERE {where}
+    GROUP BY CAST(st.TransactionDate AS DATE), ISNULL(p.DepartmentID, 0), ISNULL(td.EmployeeID, 0),
+             ISNULL(st.PaymentMethod, ''), ISNULL(st.OrderStatus, '')
+"""
+
+_ORDER_ROLLUP_SOURCE = """
+    SELECT CAST(st.TransactionDate AS DATE) AS SaleDate,
+           ISNULL(st.PaymentMethod, '') AS PaymentMethod,
+           ISNULL(st.OrderStatus, '') AS OrderStatus,
+           COUNT(*) AS Orders,
+           SUM(st.TotalAmount) AS Revenue
+    FROM SalesTransaction st
+    WHERE {where}
+    GROUP BY CAST(st.TransactionDate AS DATE), ISNULL(st.PaymentMethod, ''), ISNULL(st.OrderStatus, '')
+"""
+
+def queue_sales_rollup(cursor, transaction_id):
+    """Queue a new order for the daily rollups; runs inside the order's transaction."""
+    cursor.execute("INSERT INTO Sales_Rollup_Pending (TransactionID) VALUES (?)", (transaction_id,))
+
+def record_sales_rollup(cursor, transaction_id):
+    """Add one order to the daily rollups, on the caller's cursor and transaction."""
+    cursor.execute(f"""
+        MERGE Daily_Sales_Rollup WITH (HOLDLOCK) AS target
+        USING ({_SALES_ROLLUP_SOURCE.format(where="st.TransactionID = ?")}) AS src
+        ON target.SaleDate = src.SaleDate AND target.DepartmentID = src.DepartmentID
+           AND target.EmployeeID = src.EmployeeID AND target.PaymentMethod = src.PaymentMethod
+           AND target.OrderStatus = src.OrderStatus
+        WHEN MATCHED THEN UPDATE SET
+            Revenue = target.Revenue + src.Revenue,
+            Quantity = target.Quantity + src.Quantity,
+            LineItems = target.LineItems + src.LineItems
+        WHEN NOT MATCHED THEN
+            INSERT (SaleDate, DepartmentID, EmployeeID, PaymentMethod, OrderStatus, Revenue, Quantity, LineItems)
+            VALUES (src.SaleDate, src.DepartmentID, src.EmployeeID, src.PaymentMethod, src.OrderStatus,
+                    src.Revenue, src.Quantity, src.LineItems);
+    """, (transaction_id,))
+
+    cursor.execute(f"""
+        MERGE Daily_Order_Rollup WITH (HOLDLOCK) AS target
+        USING ({_ORDER_ROLLUP_SOURCE.format(where="st.TransactionID = ?")}) AS src
+        ON target.SaleDate = src.SaleDate AND target.PaymentMethod = src.PaymentMethod
+           AND target.OrderStatus = src.OrderStatus
+        WHEN MATCHED THEN UPDATE SET
+            Orders = target.Orders + src.Orders,
+            Revenue = target.Revenue + src.Revenue
+        WHEN NOT MATCHED THEN
+            INSERT (SaleDate, PaymentMethod, OrderStatus, Orders, Revenue)
+            VALUES (src.SaleDate, src.PaymentMethod, src.OrderStatus, src.Orders, src.Revenue);
+    """, (transaction_id,))
+
+def fold_sales_rollup(cursor, conn, transaction_id):
+    """
+    Move one queued order into the daily rollups in its own transaction.
+    Returns False if it was no longer pending (already folded or backfilled).
+    """
+    autocommit_backup = conn.autocommit
+    conn.autocommit = False
+    try:
+        # Deleting the queue row first claims the order, so it is counted once
+        cursor.execute("DELETE FROM Sales_Rollup_Pending WHERE TransactionID = ?", (transaction_id,))
+        if cursor.rowcount < 1:
+            conn.rollback()
+            return False
+        record_sales_rollup(cursor, transaction_id)
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit_backup
+
+def fold_pending_sales_rollup(cursor, conn):
+    """Fold every queued order into the daily rollups; returns how many were folded."""
+    cursor.execute("SELECT TransactionID FROM Sales_Rollup_Pending ORDER BY TransactionID")
+    pending = [row[0] for row in cursor.fetchall()]
+    return sum(fold_sales_rollup(cursor, conn, tid) for tid in pending)
+
+def rebuild_sales_rollup(cursor, conn, date_from=None, date_to=None):
+    """
+    Backfill the daily rollups for SaleDate in [date_from, date_to] (either
+    end open), replacing whatever rows that range held. Returns the number
+    of Daily_Sales_Rollup rows written.
+    """
+    rollup_where, source_where, params = ["1 = 1"], ["1 = 1"], []
+    if date_from:
+        rollup_where.append("SaleDate >= ?")
+        source_where.append("st.TransactionDate >= ?")
+        params.append(date_from)
+    if date_to:
+        rollup_where.append("SaleDate <= ?")
+        source_where.append("st.TransactionDate < DATEADD(day, 1, CAST(? AS DATE))")
+        params.append(date_to)
+    rollup_where = " AND ".join(rollup_where)
+    source_where = " AND ".join(source_where)
+
+    autocommit_backup = conn.autocommit
+    conn.autocommit = False
+    try:
+        cursor.execute(f"DELETE FROM Daily_Sales_Rollup WHERE {rollup_where}", params)
+        cursor.execute(f"DELETE FROM Daily_Order_Rollup WHERE {rollup_where}", params)
+        # The backfill below counts these orders, so they must not be folded in again
+        cursor.execute(f"""
+            DELETE FROM Sales_Rollup_Pending
+            WHERE TransactionID IN (SELECT st.TransactionID FROM SalesTransaction st WHERE {source_where})
+        """, params)
+        cursor.execute(f"""
+            INSERT INTO Daily_Sales_Rollup (SaleDate, DepartmentID, EmployeeID, PaymentMethod,
+                                            OrderStatus, Revenue, Quantity, LineItems)
+            {_SALES_ROLLUP_SOURCE.format(where=source_where)}
+        """, params)
+        written = cursor.rowcount
+        cursor.execute(f"""
+            INSERT INTO Daily_Order_Rollup (SaleDate, PaymentMethod, OrderStatus, Orders, Revenue)
+            {_ORDER_ROLLUP_SOURCE.format(where=source_where)}
+        """, params)
+        conn.commit()
+        return written
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = autocommit_backup
+
+@with_db
+def _rebuild_customers(cursor, conn):
+    return rebuild_customer_summaries(cursor, conn)
+
+@with_db
+def _rebuild_sales(cursor, conn, date_from, date_to):
+    return rebuild_sales_rollup(cursor, conn, date_from, date_to)
+
+@with_db
+def _fold_pending(cursor, conn):
+    return fold_pending_sales_rollup(cursor, conn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild pre-aggregated report tables.")
+    parser.add_argument('table', choices=['customers', 'sales', 'pending'],
+                        help="which summary to rebuild; 'pending' folds queued orders into the sales rollup")
+    parser.add_argument('--from', dest='date_from', help="sales: first day to backfill (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='date_to', help="sales: last day to backfill (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    if args.table == 'customers':
+        result = _rebuild_customers()
+        if not isinstance(result, int):
+            sys.exit("Customer summary rebuild failed")
+        print(f"Rebuilt customer summaries for {result} customer(s)", flush=True)
+    elif args.table == 'sales':
+        result = _rebuild_sales(args.date_from, args.date_to)
+        if not isinstance(result, int):
+            sys.exit("Sales rollup rebuild failed")
+        print(f"Backfilled {result} daily sales rollup row(s)", flush=True)
+    elif args.table == 'pending':
+        result = _fold_pending()
+        if not isinstance(result, int):
+            sys.exit("Folding pending sales failed")
+        print(f"Folded {result} pending order(s) into the daily sales rollup", flush=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,40 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, flash
+from flask import Flask, render_template, request, jsonify, session, redirect, url_for, make_response, flash, Response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timedelta, date
 from collections import defaultdict
-from db import with_db, rows_to_dict_list, get_db_connection
-import random
-import string
+from db import with_db, rows_to_dict_list, fetch_rows, get_db_connection, warm_pool, init_app as init_db
+from cache import TTLCache
+from search import product_index, SearchIndexUnavailable
+from statements import statements
+from auth import authenticate, hash_password, verify_password, forget_login, ROLE_REDIRECTS
+from metrics import init_app as init_metrics
+from reports import report_response, stream_rows_template, rows_response, columnar_orient, columnar_response
+from analytics import record_customer_order, rebuild_customer_summaries, queue_sales_rollup, fold_sales_rollup
+from barcodes import barcode_allocator
+from imports import import_products, text_stream, IMPORT_FORMATS
+from images import cached_image, schedule_image, PLACEHOLDER_IMAGE_URL
+from catalog import get_catalog, CatalogUnavailable, bump_catalog_version, PRODUCT_SORTS, effective_price, encode_cursor, decode_cursor
 import os
 import traceback, sys
-import requests
+import zlib
+import json
+import csv
+import io
 
 app = Flask(__name__)
 CORS(app)
 app.secret_key = os.environ.get('SECRET_KEY','dev_secret_123!@#')
 
+# One pooled DB connection per request, shared by routes, context processors
+# and nested with_db helpers; released on teardown
+init_db(app)
+
+# Request timing (total / DB / template), slow-request log and /metrics
+init_metrics(app)
+
+# Open pooled DB connections up front so the first requests skip the handshake
+warm_pool()
+
 def get_bag_owner_from_session():
     role = session.get('role')
     uid  = session.get('user_id')
@@ -22,72 +44,78 @@ def get_bag_owner_from_session():
         return {'CustomerID': None, 'EmployeeID': uid}
     return None
 
-@app.context_processor
+# -----------------------------
+# Bag count cache
+# -----------------------------
+
+# Bag badge counts keyed by owner. The bag endpoints and checkout keep this
+# current; the TTL only bounds staleness from writes made outside this process.
+BAG_COUNT_TTL = int(os.environ.get('BAG_COUNT_TTL', 300))
+bag_counts = TTLCache(ttl=BAG_COUNT_TTL)
+
+def _bag_cache_key(owner):
+    if owner['CustomerID'] is not None:
+        return ('customer', owner['CustomerID'])
+    return ('employee', owner['EmployeeID'])
+
+BAG_COUNT_CUSTOMER = statements.declare("bag_count_customer",
+    "SELECT COALESCE(SUM(Quantity),0) FROM dbo.Bag WHERE CustomerID = ? AND EmployeeID IS NULL")
+BAG_COUNT_EMPLOYEE = statements.declare("bag_count_employee",
+    "SELECT COALESCE(SUM(Quantity),0) FROM dbo.Bag WHERE EmployeeID = ? AND CustomerID IS NULL")
+
 @with_db
-def inject_bag_count(cursor, conn):
+def _query_bag_count(cursor, conn, owner):
+    if owner['CustomerID'] is not None:
+        row = BAG_COUNT_CUSTOMER.fetchone(cursor, (owner['CustomerID'],))
+    else:
+        row = BAG_COUNT_EMPLOYEE.fetchone(cursor, (owner['EmployeeID'],))
+    return int(row[0] or 0) if row else 0
+
+def get_bag_count(owner):
+    key = _bag_cache_key(owner)
+    count = bag_counts.get(key)
+    if count is None:
+        count = _query_bag_count(owner)
+        if not isinstance(count, int):
+            # with_db returned an error response; show an empty badge, don't cache it
+            return 0
+        bag_counts.set(key, count)
+    return count
+
+def set_bag_count(owner, count):
+    bag_counts.set(_bag_cache_key(owner), count)
+
+def bump_bag_count(owner, delta):
+    bag_counts.incr(_bag_cache_key(owner), delta)
+
+def invalidate_bag_count(owner):
+    bag_counts.delete(_bag_cache_key(owner))
+
+@app.context_processor
+def inject_bag_count():
     owner = get_bag_owner_from_session()
-    count = 0
-    if owner:
-        if owner['CustomerID'] is not None:
-            cursor.execute("SELECT COALESCE(SUM(Quantity),0) FROM dbo.Bag WHERE CustomerID = ? AND EmployeeID IS NULL", (owner['CustomerID'],))
-        else:
-            cursor.execute("SELECT COALESCE(SUM(Quantity),0) FROM dbo.Bag WHERE EmployeeID = ? AND CustomerID IS NULL", (owner['EmployeeID'],))
-        row = cursor.fetchone()
-        count = int(row[0] or 0) if row else 0
-    return {'bag_count': count}
-    
+    return {'bag_count': get_bag_count(owner) if owner else 0}
+
 # -----------------------------
 # Routes
 # -----------------------------
 
+# Storefront paging: the home page renders the first page, /api/products the rest
+STOREFRONT_SORT = 'name'
+STOREFRONT_PAGE_SIZE = int(os.environ.get('STOREFRONT_PAGE_SIZE', 48))
+PRODUCTS_API_MAX_LIMIT = 200
+
 @app.route('/')
 @with_db
 def home(cursor, conn):
-    # Fetch active products including DepartmentID
-    cursor.execute("""
-        SELECT ProductID, Name, Description, Price, QuantityInStock, DepartmentID, ImageURL, OnSale
-        FROM Product
-        WHERE IsActive = 1
-    """)
-    products = rows_to_dict_list(cursor)
-
-    # Fetch active holiday sale
-    cursor.execute("""
-        SELECT SaleID, SaleName, StartDate, EndDate, DiscountPercent, DepartmentID, IsActive
-        FROM Holiday_Sales
-        WHERE IsActive = 1
-        AND GETDATE() BETWEEN StartDate AND EndDate
-    """)
-    holiday_sale = cursor.fetchone()
-
-    sale_info = None
-    if holiday_sale:
-        sale_info = {
-            'SaleID': holiday_sale[0],
-            'SaleName': holiday_sale[1],
-            'StartDate': holiday_sale[2],
-            'EndDate': holiday_sale[3],
-            'DiscountPercent': holiday_sale[4],
-            'DepartmentID': holiday_sale[5],
-            'IsActive': holiday_sale[6]
-        }
-
-        # Calculate sale prices for products marked OnSale
-        # If DepartmentID is set, only apply to that department
-        for product in products:
-            if product.get('OnSale'):
-                # Check if sale applies to this product's department
-                if sale_info['DepartmentID'] is None or product['DepartmentID'] == sale_info['DepartmentID']:
-                    original_price = float(product['Price'])
-                    discount = float(sale_info['DiscountPercent'])
-                    sale_price = original_price * (1 - discount / 100)
-                    product['SalePrice'] = round(sale_price, 2)
-                    product['OriginalPrice'] = original_price
-                    product['Savings'] = round(original_price - sale_price, 2)
-
-    # Fetch all departments
-    cursor.execute("SELECT DepartmentID,Name FROM Department")
-    departments = rows_to_dict_list(cursor)
+    # Products (with sale prices applied), departments and the active sale
+    # come from the shared catalog snapshot; it only hits SQL when stale.
+    # Only the first page is rendered; the rest loads from /api/products.
+    catalog = get_catalog()
+    products, next_key = catalog.page(STOREFRONT_SORT, limit=STOREFRONT_PAGE_SIZE)
+    next_cursor = encode_cursor(next_key) if next_key else None
+    departments = catalog.departments
+    sale_info = catalog.sale_info
 
     # Determine user info based on role
     user = None
@@ -112,12 +140,177 @@ def home(cursor, conn):
             user = {'Name': record[0], 'role': 'employee'}
 
     # Pass products, departments, and sale info to template
-    return render_template('index.html', products=products, departments=departments, user=user, sale_info=sale_info)
+    return render_template('index.html', products=products, departments=departments, user=user,
+                           sale_info=sale_info, next_cursor=next_cursor)
+
+@app.get('/api/products')
+def api_products():
+    """
+    Storefront product listing with keyset pagination.
+    Query params: department, on_sale, min_price, max_price, sort
+    (name | price_asc | price_desc | newest), limit, cursor.
+    """
+    args = request.args
+    sort = args.get('sort') or STOREFRONT_SORT
+    if sort not in PRODUCT_SORTS:
+        return jsonify({"message": f"Unknown sort '{sort}'"}), 400
+
+    try:
+        limit = min(max(int(args.get('limit') or STOREFRONT_PAGE_SIZE), 1), PRODUCTS_API_MAX_LIMIT)
+        department = args.get('department')
+        department = int(department) if department and department != 'all' else None
+        min_price = float(args['min_price']) if args.get('min_price') else None
+        max_price = float(args['max_price']) if args.get('max_price') else None
+        after = decode_cursor(args['cursor']) if args.get('cursor') else None
+    except ValueError:
+        return jsonify({"message": "Invalid query parameters"}), 400
+    on_sale = (args.get('on_sale') or '').lower() in ('1', 'true', 'yes')
+
+    try:
+        catalog = get_catalog()
+    except CatalogUnavailable:
+        return jsonify({"message": "Catalog unavailable"}), 503
+
+    # The snapshot build id changes whenever the catalog does, so it plus the
+    # query string identifies the response body
+    etag = f"{catalog.build_id}-{zlib.crc32(request.query_string):08x}"
+    if request.if_none_match.contains(etag):
+        resp = make_response('', 304)
+        resp.set_etag(etag)
+        return resp
+
+    def matches(p):
+        if department is not None and p['DepartmentID'] != department:
+            return False
+        if on_sale and not p.get('SalePrice'):
+            return False
+        price = effective_price(p)
+        if min_price is not None and price < min_price:
+            return False
+        if max_price is not None and price > max_price:
+            return False
+        return True
+
+    try:
+        products, next_key = catalog.page(sort, after=after, limit=limit, predicate=matches)
+    except TypeError:
+        # cursor was issued for a different sort order
+        return jsonify({"message": "Invalid cursor"}), 400
+
+    names = catalog.department_names
+    resp = jsonify({
+        "products": [dict(p, DepartmentName=names.get(p['DepartmentID'])) for p in products],
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    })
+    resp.set_etag(etag)
+    return resp
+
+@app.get('/api/products/search')
+def api_product_search():
+    """Storefront search over the product index. Query params: q, department, limit."""
+    q = (request.args.get('q') or '').strip()
+    try:
+        limit = min(max(int(request.args.get('limit') or STOREFRONT_PAGE_SIZE), 1), PRODUCTS_API_MAX_LIMIT)
+        department = request.args.get('department')
+        department = int(department) if department and department != 'all' else None
+    except ValueError:
+        return jsonify({"message": "Invalid query parameters"}), 400
+    if not q:
+        return jsonify({"products": []})
+
+    try:
+        catalog = get_catalog()
+        product_index.ensure_loaded()
+    except CatalogUnavailable:
+        return jsonify({"message": "Catalog unavailable"}), 503
+    except SearchIndexUnavailable:
+        return jsonify({"message": "Search unavailable"}), 503
+    names = catalog.department_names
+    products = []
+    for pid in product_index.search(q, department_id=department, limit=limit):
+        p = catalog.by_id.get(pid)
+        if p is not None:
+            products.append(dict(p, DepartmentName=names.get(p['DepartmentID'])))
+    return jsonify({"products": products})
+
+# -----------------------------
+# Register barcode scans
+# -----------------------------
+SCAN_BATCH_MAX = int(os.environ.get('SCAN_BATCH_MAX', 200))
+
+@app.post('/api/scan')
+@with_db
+def api_scan(cursor, conn):
+    """
+    Resolve a burst of scanned barcodes in one call.
+    Body: {"barcodes": ["...", ...]} or {"barcode": "..."}; results keep scan order.
+    Barcodes resolve against the catalog snapshot (sale prices applied); stock
+    is read live for the matched products in a single query.
+    """
+    if 'user_id' not in session or session.get('role') not in ('admin', 'employee'):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    payload = request.get_json(silent=True) or {}
+    barcodes = payload.get('barcodes')
+    if barcodes is None and payload.get('barcode') is not None:
+        barcodes = [payload['barcode']]
+    if not isinstance(barcodes, list) or not barcodes:
+        return jsonify({"message": "No barcodes supplied."}), 400
+    if len(barcodes) > SCAN_BATCH_MAX:
+        return jsonify({"message": f"At most {SCAN_BATCH_MAX} barcodes per scan."}), 400
+
+    try:
+        catalog = get_catalog()
+    except CatalogUnavailable:
+        return jsonify({"message": "Catalog unavailable"}), 503
+    hits = [catalog.by_barcode.get(str(b).strip()) for b in barcodes]
+
+    stock = {}
+    ids = sorted({p['ProductID'] for p in hits if p is not None})
+    if ids:
+        cursor.execute("""
+            SELECT ProductID, QuantityInStock
+            FROM Product
+            WHERE ProductID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+        """, (json.dumps(ids),))
+        stock = {pid: qty or 0 for pid, qty in cursor.fetchall()}
+
+    results = []
+    for barcode, p in zip(barcodes, hits):
+        if p is None:
+            results.append({"barcode": barcode, "found": False})
+            continue
+        results.append({
+            "barcode": barcode,
+            "found": True,
+            "ProductID": p['ProductID'],
+            "Name": p['Name'],
+            "Price": float(p['Price']),
+            "SalePrice": p.get('SalePrice'),
+            "EffectivePrice": effective_price(p),
+            "QuantityInStock": stock.get(p['ProductID'], p['QuantityInStock'] or 0),
+            "ImageURL": p.get('ImageURL')
+        })
+    return jsonify({"results": results})
 
 @app.route("/api/status", methods=["GET"])
 def status():
     return jsonify({"message": "Flask API is running and connected to Azure SQL!"})
 
+@app.get("/api/admin/statements")
+def statement_stats():
+    """Execution stats for the registered statements, most total time first."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    return jsonify({"statements": statements.stats()})
+
+@app.post("/api/admin/statements/reset")
+def statement_stats_reset():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    statements.reset()
+    return jsonify({"message": "Statement stats reset"})
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
@@ -130,32 +323,15 @@ def login():
 
         @with_db
         def check_credentials(cursor, conn):
-            cursor.execute("SELECT * FROM Administrator WHERE Username = ? AND Password = ?", (user_id, password))
-            admin = cursor.fetchone()
-
-            cursor.execute("SELECT * FROM Employee WHERE Username = ? AND Password = ?", (user_id, password))
-            emp = cursor.fetchone()
-
-            cursor.execute("SELECT * FROM Customer WHERE username = ? AND password = ?", (user_id, password))
-            cust = cursor.fetchone()
-
-            if admin:
-                session['user_id'] = admin[0]
-                session['role'] = 'admin'
-                return jsonify({"success": True, "role": "admin", "redirectUrl": "/admin"})
-
-            elif emp:
-                session['user_id'] = emp[0]
-                session['role'] = 'employee'
-                return jsonify({"success": True, "role": "employee", "redirectUrl": "/employee"})
-
-            elif cust:
-                session['user_id'] = cust[0]
-                session['role'] = 'customer'
-                return jsonify({"success": True, "role": "customer", "redirectUrl": "/customer"})
-            else:
+            account = authenticate(cursor, conn, user_id, password)
+            if account is None:
                 return jsonify({"success": False, "message": "Invalid ID or Password"}), 401
 
+            role, account_id = account
+            session['user_id'] = account_id
+            session['role'] = role
+            return jsonify({"success": True, "role": role, "redirectUrl": ROLE_REDIRECTS[role]})
+
         return check_credentials()
 
     return render_template('login.html')
@@ -187,7 +363,7 @@ def register():
                 INSERT INTO Customer (username, Name, Phone, Email, password)
                 VALUES (?, ?, ?, ?, ?)
             """
-            cursor.execute(insert_query, (username, name, phone, email, password))
+            cursor.execute(insert_query, (username, name, phone, email, hash_password(password)))
             conn.commit()
             return jsonify({"success": True, "message": "Registration successful!"}), 201
 
@@ -205,12 +381,11 @@ def admin_dashboard(cursor, conn):
     cursor.execute("SELECT COUNT(*) FROM Customer")
     total_customers = cursor.fetchone()[0]
 
-    cursor.execute("SELECT SUM(TotalAmount) FROM SalesTransaction WHERE CAST(TransactionDate AS DATE) = CAST(GETDATE() AS DATE)")
-    todays_revenue = cursor.fetchone()[0] or 0
-
-    # Orders today
-    cursor.execute("SELECT COUNT(*) FROM SalesTransaction WHERE CAST(TransactionDate AS DATE) = CAST(GETDATE() AS DATE)")
-    orders_today = cursor.fetchone()[0] or 0
+    # Today's revenue and orders, from the daily rollup
+    cursor.execute("SELECT SUM(Revenue), SUM(Orders) FROM Daily_Order_Rollup WHERE SaleDate = CAST(GETDATE() AS DATE)")
+    row = cursor.fetchone()
+    todays_revenue = row[0] or 0
+    orders_today = row[1] or 0
 
     # Employee list
     cursor.execute("SELECT EmployeeID, Name, Email, DepartmentID FROM Employee WHERE IsActive = 1")
@@ -266,9 +441,17 @@ def manage_products(cursor, conn):
     params = []
     
     if search:
-        query += " AND (p.Name LIKE ? OR p.Description LIKE ? OR p.Barcode LIKE ?)"
-        search_param = f"%{search}%"
-        params.extend([search_param, search_param, search_param])
+        # Resolve the search through the in-memory index instead of
+        # leading-wildcard LIKEs, then fetch just the matching rows
+        try:
+            product_index.ensure_loaded()
+            matched_ids = product_index.search(search)
+            query += " AND p.ProductID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))"
+            params.append(json.dumps(matched_ids))
+        except SearchIndexUnavailable:
+            query += " AND (p.Name LIKE ? OR p.Description LIKE ? OR p.Barcode LIKE ?)"
+            search_param = f"%{search}%"
+            params.extend([search_param, search_param, search_param])
     
     if department:
         query += " AND p.DepartmentID = ?"
@@ -277,7 +460,7 @@ def manage_products(cursor, conn):
     query += " ORDER BY p.Name"
     
     cursor.execute(query, params)
-    products = rows_to_dict_list(cursor)
+    products = fetch_rows(cursor)
     
     # Get departments for filter
     cursor.execute("SELECT DepartmentID, Name FROM Department ORDER BY Name")
@@ -336,9 +519,11 @@ def edit_product(cursor, conn, product_id):
             flash("Quantity must be a valid non-negative integer.", "danger")
             return redirect(url_for('edit_product', product_id=product_id))
 
-        # --- Handle image generation if missing ---
+        # --- Handle image generation if missing: placeholder now, stock photo later ---
+        image_pending = False
         if not image_url:
-            image_url = generate_product_image(name) or "https://via.placeholder.com/400?text=Product+Image"
+            image_url = cached_image(name) or PLACEHOLDER_IMAGE_URL
+            image_pending = image_url == PLACEHOLDER_IMAGE_URL
 
         # --- Update the product ---
         cursor.execute("""
@@ -349,6 +534,10 @@ def edit_product(cursor, conn, product_id):
         """, (name, description, price, department_id, quantity_in_stock, image_url, product_id))
 
         conn.commit()
+        bump_catalog_version()
+        product_index.refresh(cursor, product_id)
+        if image_pending:
+            schedule_image(product_id, name)
         flash(f"Product '{name}' updated successfully!", "success")
         return redirect(url_for('manage_products'))
 
@@ -394,6 +583,8 @@ def delete_product(cursor, conn, product_id):
         # Soft delete - just mark as inactive
         cursor.execute("UPDATE Product SET IsActive = 0 WHERE ProductID = ?", (product_id,))
         conn.commit()
+        bump_catalog_version()
+        product_index.remove(product_id)
         
         return jsonify({"message": f"Product '{product_name}' has been deactivated"}), 200
     except Exception as e:
@@ -435,7 +626,154 @@ def update_stock(cursor, conn):
 
     cursor.execute("UPDATE Product SET QuantityInStock = ? WHERE ProductID = ?", (new_stock, pid))
     conn.commit()
+    bump_catalog_version()
     return jsonify({"message": "Stock updated successfully"}), 200
+
+# -----------------------------
+# Batch stock adjustments
+# -----------------------------
+STOCK_BATCH_MAX = int(os.environ.get('STOCK_BATCH_MAX', 5000))
+
+def _stock_line(item):
+    """Validate one adjustment line; returns (product_id, barcode, mode, quantity) or an error message."""
+    if not isinstance(item, dict):
+        return "Each item must be an object"
+    product_id, barcode = item.get('product_id'), item.get('barcode')
+    if product_id is not None:
+        try:
+            product_id = int(product_id)
+        except (TypeError, ValueError):
+            return "product_id must be an integer"
+        barcode = None
+    elif barcode is not None and str(barcode).strip():
+        barcode = str(barcode).strip()
+    else:
+        return "product_id or barcode is required"
+
+    modes = [m for m in ('quantity', 'delta') if item.get(m) is not None]
+    if len(modes) != 1:
+        return "Give exactly one of quantity (absolute) or delta"
+    mode = modes[0]
+    try:
+        value = int(item[mode])
+    except (TypeError, ValueError):
+        return f"{mode} must be an integer"
+    if mode == 'quantity' and value < 0:
+        return "quantity cannot be negative"
+    return product_id, barcode, mode, value
+
+@app.post("/api/stock/adjustments")
+@with_db
+def adjust_stock_batch(cursor, conn):
+    """
+    Apply many stock changes in one transaction, e.g. a receiving scan session
+    or a cycle count. Body: {"items": [{"product_id": 1, "delta": 12},
+    {"barcode": "...", "quantity": 40}, ...], "atomic": false}.
+    Lines apply in order, so several lines for one product add up. A line that
+    would take stock below zero, or names an unknown product, is rejected on
+    its own unless "atomic" is set, in which case nothing is applied.
+    """
+    if 'user_id' not in session or session.get('role') not in ('admin', 'employee'):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('items')
+    atomic = bool(payload.get('atomic'))
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "No items supplied"}), 400
+    if len(items) > STOCK_BATCH_MAX:
+        return jsonify({"error": f"At most {STOCK_BATCH_MAX} items per batch"}), 400
+
+    lines = [_stock_line(item) for item in items]
+    ids = sorted({line[0] for line in lines if isinstance(line, tuple) and line[0] is not None})
+    barcodes = sorted({line[1] for line in lines if isinstance(line, tuple) and line[1] is not None})
+
+    autocommit_backup = conn.autocommit
+    conn.autocommit = False
+    try:
+        # Lock every product the batch touches in one statement
+        cursor.execute("""
+            SELECT p.ProductID, p.Barcode, p.QuantityInStock
+            FROM Product p WITH (UPDLOCK, ROWLOCK)
+            WHERE p.ProductID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+               OR p.Barcode IN (SELECT value FROM OPENJSON(?))
+        """, (json.dumps(ids), json.dumps(barcodes)))
+        stock, by_barcode = {}, {}
+        for pid, barcode, qty in cursor.fetchall():
+            stock[pid] = qty or 0
+            if barcode:
+                by_barcode[barcode.strip()] = pid
+        original = dict(stock)
+
+        results = []
+        for n, line in enumerate(lines):
+            result = {"line": n}
+            if isinstance(line, str):
+                result.update(status="invalid", error=line)
+                results.append(result)
+                continue
+            product_id, barcode, mode, value = line
+            pid = product_id if product_id is not None else by_barcode.get(barcode)
+            result["product_id"] = pid
+            if barcode is not None:
+                result["barcode"] = barcode
+            if pid not in stock:
+                result.update(status="not_found", error="Product not found")
+            else:
+                new_stock = value if mode == 'quantity' else stock[pid] + value
+                if new_stock < 0:
+                    result.update(status="rejected", error=f"Stock would go negative (in stock: {stock[pid]})",
+                                  previous=stock[pid])
+                else:
+                    result.update(status="applied", previous=stock[pid], quantity=new_stock)
+                    stock[pid] = new_stock
+            results.append(result)
+
+        failed = sum(1 for r in results if r["status"] != "applied")
+        changes = [{"product_id": pid, "quantity": qty} for pid, qty in stock.items() if qty != original[pid]]
+
+        if atomic and failed:
+            conn.rollback()
+            conn.autocommit = autocommit_backup
+            for r in results:
+                if r["status"] == "applied":
+                    r["status"] = "not_applied"
+            return jsonify({"applied": 0, "failed": failed, "results": results}), 409
+
+        if changes:
+            changes_json = json.dumps(changes)
+            # One set-based update, so the Product triggers fire once for the batch
+            cursor.execute("""
+                UPDATE p
+                SET p.QuantityInStock = s.Quantity
+                FROM Product p
+                JOIN OPENJSON(?) WITH (ProductID INT '$.product_id', Quantity INT '$.quantity') s
+                  ON p.ProductID = s.ProductID
+            """, (changes_json,))
+            # Restocked past the low-stock threshold: close their pending alerts
+            cursor.execute("""
+                UPDATE ra
+                SET ra.AlertStatus = 'COMPLETED'
+                FROM Reorder_Alerts ra
+                JOIN OPENJSON(?) WITH (ProductID INT '$.product_id', Quantity INT '$.quantity') s
+                  ON ra.ProductID = s.ProductID
+                JOIN Inventory inv ON inv.ProductID = s.ProductID
+                WHERE ra.AlertStatus = 'PENDING'
+                  AND s.Quantity > inv.ReorderLevel * 1.2
+            """, (changes_json,))
+
+        conn.commit()
+        conn.autocommit = autocommit_backup
+        if changes:
+            bump_catalog_version()
+        return jsonify({"applied": len(results) - failed, "failed": failed, "results": results}), 200
+
+    except Exception as e:
+        print("DB error (/api/stock/adjustments):", e)
+        traceback.print_exc()
+        conn.rollback()
+        conn.autocommit = autocommit_backup
+        return jsonify({"error": "Database error"}), 500
 @app.route('/apply_sales', methods=['POST'])
 @with_db
 def apply_sales(cursor, conn):
@@ -448,6 +786,7 @@ def apply_sales(cursor, conn):
             SET Price = Price * 0.8
         """)
         conn.commit()
+        bump_catalog_version()
         return jsonify({"message": "Seasonal sale prices applied!"}), 200
     except Exception as e:
         print("Error executing sale trigger:", e)
@@ -536,6 +875,7 @@ def restock_product(cursor, conn, alert_id):
     """, (alert_id,))
 
     conn.commit()
+    bump_catalog_version()
 
     return jsonify({"message": "Product restocked successfully", "quantity": restock_quantity})
 
@@ -607,16 +947,14 @@ def add_product(cursor, conn):
         except (ValueError, TypeError):
             return jsonify({"success": False, "error": "Please select a valid department."}), 400
 
-        # --- Generate unique 12-digit barcode ---
-        while True:
-            barcode = ''.join(random.choices(string.digits, k=12))
-            cursor.execute("SELECT 1 FROM Product WHERE Barcode = ?", (barcode,))
-            if not cursor.fetchone():
-                break
+        # --- Allocate a barcode from the store sequence ---
+        barcode = barcode_allocator.allocate(cursor)
 
-        # --- Ensure image URL is set ---
+        # --- Ensure image URL is set: placeholder now, stock photo later ---
+        image_pending = False
         if not image_url:
-            image_url = generate_product_image(name) or "https://via.placeholder.com/400?text=Product+Image"
+            image_url = cached_image(name) or PLACEHOLDER_IMAGE_URL
+            image_pending = image_url == PLACEHOLDER_IMAGE_URL
 
         # --- Set initial inventory values ---
         quantity_in_stock = int(data.get("QuantityInStock") or 0)
@@ -645,13 +983,18 @@ def add_product(cursor, conn):
             VALUES (?, ?, ?)
         """, (product_id, quantity_available, reorder_level))
         conn.commit()
+        bump_catalog_version()
+        product_index.refresh(cursor, product_id)
+        if image_pending:
+            schedule_image(product_id, name)
 
         # --- Return JSON for AJAX ---
         if request.headers.get("X-Requested-With") == "XMLHttpRequest":
             return jsonify({
                 "success": True,
                 "product_name": name,
-                "image_url": image_url
+                "image_url": image_url,
+                "image_pending": image_pending
             })
 
         flash(f"Product '{name}' added successfully!", "success")
@@ -662,38 +1005,29 @@ def add_product(cursor, conn):
     departments = rows_to_dict_list(cursor)
     return render_template('add_product.html', departments=departments)
 
-def generate_product_image(product_name: str) -> str:
+@app.post("/api/products/import")
+@with_db
+def import_products_api(cursor, conn):
     """
-    Generates or fetches a product image based on the product name.
-    Returns the URL of the generated/fetched image.
+    Bulk create/update products from CSV (header row) or JSON Lines, sent as
+    the request body or as a 'file' upload. The body is read as a stream.
     """
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
 
-    # --- Option 1: Fetch a stock image from Unsplash ---
-    # You need to get an API key from Unsplash and set it in your environment
-    UNSPLASH_ACCESS_KEY = "4YRk506nTWf9lbL1hkJmmXEqG3qtACKUBAWVouGzY5Y"
-
-    if not UNSPLASH_ACCESS_KEY:
-        # fallback if no key is set
-        return "https://via.placeholder.com/400?text=Product+Image"
+    upload = request.files.get('file')
+    fmt = request.args.get('format')
+    if not fmt:
+        mimetype = upload.mimetype if upload else request.mimetype
+        filename = (upload.filename or '') if upload else ''
+        is_jsonl = mimetype in ('application/x-ndjson', 'application/jsonl') or filename.lower().endswith(('.jsonl', '.ndjson'))
+        fmt = 'jsonl' if is_jsonl else 'csv'
+    if fmt not in IMPORT_FORMATS:
+        return jsonify({"error": f"format must be one of: {', '.join(IMPORT_FORMATS)}"}), 400
 
-    try:
-        response = requests.get(
-            "https://api.unsplash.com/photos/random",
-            params={
-                "query": product_name,
-                "orientation": "squarish",
-                "client_id": UNSPLASH_ACCESS_KEY
-            },
-            timeout=5
-        )
-        response.raise_for_status()
-        data = response.json()
-        # return the regular-sized image URL
-        return data.get("urls", {}).get("regular") or "https://via.placeholder.com/400?text=Product+Image"
-    except Exception as e:
-        print("Error fetching image:", e)
-        # fallback placeholder if anything fails
-        return "https://via.placeholder.com/400?text=Product+Image"
+    stream = upload.stream if upload else request.stream
+    result = import_products(cursor, conn, text_stream(stream), fmt)
+    return jsonify(result.to_dict()), 200
 
 @app.route('/employees')
 @with_db
@@ -713,7 +1047,7 @@ def manage_employees(cursor, conn):
 @with_db
 def get_employee(cursor, conn, emp_id):
     cursor.execute("""
-        SELECT EmployeeID, Name, Phone, Email, JobTitle, HireDate, DepartmentID, AdminID, Username, Password
+        SELECT EmployeeID, Name, Phone, Email, JobTitle, HireDate, DepartmentID, AdminID, Username
         FROM Employee
         WHERE EmployeeID = ? AND IsActive = 1
     """, (emp_id,))
@@ -761,7 +1095,7 @@ def add_employee(cursor, conn):
         department_id,
         session.get("user_id"),  # logged-in admin
         data.get("Username"),
-        data.get("Password")
+        hash_password(data.get("Password") or "")
     ))
     conn.commit()
     return jsonify({"message": "Employee added successfully!"}), 201
@@ -771,16 +1105,20 @@ def add_employee(cursor, conn):
 def edit_employee(cursor, conn, emp_id):
     data = request.get_json()
 
-    # Fetch current hire date
-    cursor.execute("SELECT HireDate FROM Employee WHERE EmployeeID = ?", (emp_id,))
-    current_hiredate = cursor.fetchone()[0]
+    # Fetch current hire date and username
+    cursor.execute("SELECT HireDate, Username FROM Employee WHERE EmployeeID = ?", (emp_id,))
+    current_hiredate, current_username = cursor.fetchone()
 
     # If no new hire date provided, keep current
     hiredate = data.get("HireDate") or current_hiredate
 
-    cursor.execute("""
+    # A blank password keeps the current one
+    password = data.get("Password")
+    password_sql = ", Password = ?" if password else ""
+
+    cursor.execute(f"""
         UPDATE Employee
-        SET Name = ?, Phone = ?, Email = ?, JobTitle = ?, HireDate = ?, DepartmentID = ?, Username = ?, Password = ?
+        SET Name = ?, Phone = ?, Email = ?, JobTitle = ?, HireDate = ?, DepartmentID = ?, Username = ?{password_sql}
         WHERE EmployeeID = ?
     """, (
         data.get("Name"),
@@ -790,10 +1128,12 @@ def edit_employee(cursor, conn, emp_id):
         hiredate,
         data.get("DepartmentID"),
         data.get("Username"),
-        data.get("Password"),
+        *((hash_password(password),) if password else ()),
         emp_id
     ))
     conn.commit()
+    forget_login(current_username)
+    forget_login(data.get("Username"))
     return jsonify({"message": "Employee updated successfully!"}), 200
 
 @app.delete("/api/employees/delete/<int:emp_id>")
@@ -812,21 +1152,17 @@ def employee_dashboard(cursor, conn):
     cursor.execute("SELECT * FROM Employee WHERE EmployeeID = ?", (user_id,))
     user = cursor.fetchone()
 
-    # 1. Number of orders employee processed today
+    # 1-2. Order lines processed and revenue generated by employee today (daily
+    # rollup). Days follow the order's TransactionDate, which is also what
+    # trg_AutoFill_TransactionDetails stamps on each line's datetime.
     cursor.execute("""
-        SELECT COUNT(*) 
-        FROM Transaction_Details
-        WHERE EmployeeID = ? AND CAST(datetime AS DATE) = CAST(GETDATE() AS DATE)
+        SELECT SUM(LineItems), SUM(Revenue)
+        FROM Daily_Sales_Rollup
+        WHERE EmployeeID = ? AND SaleDate = CAST(GETDATE() AS DATE)
     """, (user_id,))
-    orders_today = cursor.fetchone()[0]
-
-    # 2. Revenue generated by employee today
-    cursor.execute("""
-        SELECT SUM(Subtotal) 
-        FROM Transaction_Details
-        WHERE EmployeeID = ? AND CAST(datetime AS DATE) = CAST(GETDATE() AS DATE)
-    """, (user_id,))
-    revenue_today = cursor.fetchone()[0] or 0
+    row = cursor.fetchone()
+    orders_today = row[0] or 0
+    revenue_today = row[1] or 0
 
     # 3. Low-stock products in employee's department
     cursor.execute("""
@@ -882,6 +1218,37 @@ def _iso_date(s):
             continue
     return None
 
+# /reports/query grouping: (select list, GROUP BY list) per dimension
+REPORT_DIMENSIONS = {
+    "product": ("p.ProductID AS DimID, p.Name AS DimName", "p.ProductID, p.Name"),
+    "department": ("d.DepartmentID AS DimID, d.Name AS DimName", "d.DepartmentID, d.Name"),
+    "employee": ("e.EmployeeID AS DimID, COALESCE(NULLIF(LTRIM(RTRIM(e.Name)), ''), e.Username) AS DimName",
+                 "e.EmployeeID, COALESCE(NULLIF(LTRIM(RTRIM(e.Name)), ''), e.Username)"),
+}
+
+def _reports_query_sql(group_by):
+    select_dim, group_dim = REPORT_DIMENSIONS[group_by]
+    sql_parts = [
+        "SELECT",
+        f"  {select_dim},",
+        "  SUM(td.Quantity) AS UnitsSold,",
+        "  SUM(CAST(td.Quantity * p.Price AS DECIMAL(18,4))) AS GrossRevenue",
+        "FROM SalesTransaction AS st",
+        "JOIN Transaction_Details AS td ON td.TransactionID = st.TransactionID",
+        "JOIN Product AS p              ON p.ProductID       = td.ProductID",
+        "LEFT JOIN Department_Product AS dp ON dp.ProductID   = p.ProductID",
+        "LEFT JOIN Department AS d          ON d.DepartmentID = dp.DepartmentID",
+        "LEFT JOIN Employee  AS e           ON e.EmployeeID   = st.EmployeeID",
+        "WHERE st.TransactionDate >= ?",
+        "  AND st.TransactionDate < DATEADD(day, 1, ?)",
+        "  AND ( ? IS NULL OR d.DepartmentID = ? )",
+        "  AND ( ? IS NULL OR e.EmployeeID   = ? )",
+        f"GROUP BY {group_dim}",
+        "HAVING ( ? IS NULL OR SUM(td.Quantity) >= ? )",
+        f"ORDER BY {group_dim}",
+    ]
+    return "\n".join(sql_parts)
+
 @app.post("/reports/query")
 @with_db
 def reports_query(cur, conn):
@@ -910,40 +1277,9 @@ def reports_query(cur, conn):
     except Exception:
         min_val = None
 
-    if group_by == "product":
-        select_dim = "p.ProductID AS DimID, p.Name AS DimName"
-        group_dim  = "p.ProductID, p.Name"
-    elif group_by == "department":
-        select_dim = "d.DepartmentID AS DimID, d.Name AS DimName"
-        group_dim  = "d.DepartmentID, d.Name"
-    elif group_by == "employee":
-        select_dim = "e.EmployeeID AS DimID, COALESCE(NULLIF(LTRIM(RTRIM(e.Name)), ''), e.Username) AS DimName"
-        group_dim  = "e.EmployeeID, COALESCE(NULLIF(LTRIM(RTRIM(e.Name)), ''), e.Username)"
-    else:
-        select_dim = "p.ProductID AS DimID, p.Name AS DimName"
-        group_dim  = "p.ProductID, p.Name"
-
-    sql_parts = [
-        "SELECT",
-        f"  {select_dim},",
-        "  SUM(td.Quantity) AS UnitsSold,",
-        "  SUM(CAST(td.Quantity * p.Price AS DECIMAL(18,4))) AS GrossRevenue",
-        "FROM SalesTransaction AS st",
-        "JOIN Transaction_Details AS td ON td.TransactionID = st.TransactionID",
-        "JOIN Product AS p              ON p.ProductID       = td.ProductID",
-        "LEFT JOIN Department_Product AS dp ON dp.ProductID   = p.ProductID",
-        "LEFT JOIN Department AS d          ON d.DepartmentID = dp.DepartmentID",
-        "LEFT JOIN Employee  AS e           ON e.EmployeeID   = st.EmployeeID",
-        "WHERE st.TransactionDate >= ?",
-        "  AND st.TransactionDate < DATEADD(day, 1, ?)",
-        "  AND ( ? IS NULL OR d.DepartmentID = ? )",
-        "  AND ( ? IS NULL OR e.EmployeeID   = ? )",
-        f"GROUP BY {group_dim}",
-        "HAVING ( ? IS NULL OR SUM(td.Quantity) >= ? )",
-        f"ORDER BY {group_dim}",
-    ]
-    
-    sql = "\n".join(sql_parts)
+    if group_by not in REPORT_DIMENSIONS:
+        group_by = "product"
+    stmt = statements.variant("reports_query", group_by, lambda: _reports_query_sql(group_by))
     
     params = [
         date_from, date_to,
@@ -953,8 +1289,7 @@ def reports_query(cur, conn):
     ]
 
     try:
-        cur.execute(sql, params)
-        rows = cur.fetchall()
+        rows = stmt.fetchall(cur, params)
     except Exception as e:
         print("DB error in /reports/query:", e)
         return "Could not load report. Please check parameter values and try again.", 500
@@ -1050,7 +1385,7 @@ def customer_settings(cursor, conn):
             return jsonify({"success": False, "message": "Name and email are required"}), 400
 
         # Verify current customer
-        cursor.execute("SELECT password FROM Customer WHERE CustomerID = ?", (customer_id,))
+        cursor.execute("SELECT password, username FROM Customer WHERE CustomerID = ?", (customer_id,))
         record = cursor.fetchone()
         if not record:
             return jsonify({"success": False, "message": "Customer not found"}), 404
@@ -1063,7 +1398,7 @@ def customer_settings(cursor, conn):
         # Update customer information
         if new_password and current_password:
             # Verify current password
-            if record[0] != current_password:
+            if not verify_password(record[0], current_password):
                 return jsonify({"success": False, "message": "Current password is incorrect"}), 401
 
             # Update with new password
@@ -1071,7 +1406,8 @@ def customer_settings(cursor, conn):
                 UPDATE Customer
                 SET Name = ?, Email = ?, Phone = ?, password = ?
                 WHERE CustomerID = ?
-            """, (name, email, phone, new_password, customer_id))
+            """, (name, email, phone, hash_password(new_password), customer_id))
+            forget_login(record[1])
         else:
             # Update without changing password
             cursor.execute("""
@@ -1094,6 +1430,43 @@ def customer_settings(cursor, conn):
 
     return render_template('customer_settings.html', customer=customer)
 
+# Orders list paging; each order card previews its first few items
+ORDERS_PAGE_SIZE = int(os.environ.get('ORDERS_PAGE_SIZE', 25))
+ORDER_ITEMS_PREVIEW = 3
+
+def load_order_summaries(cursor, orders, preview=ORDER_ITEMS_PREVIEW):
+    """
+    Attach the first `preview` items to each order, and fill in a missing
+    TotalAmount from its line items, using one query for the whole batch.
+    """
+    for o in orders:
+        o['items'] = []
+    if not orders:
+        return orders
+
+    by_id = {o['TransactionID']: o for o in orders}
+    cursor.execute("""
+        SELECT x.TransactionID, x.ProductID, x.Name, x.Quantity, x.ComputedTotal
+        FROM (
+            SELECT td.TransactionID, td.ProductID, p.Name, td.Quantity,
+                   ROW_NUMBER() OVER (PARTITION BY td.TransactionID ORDER BY td.ProductID) AS rn,
+                   SUM(td.Quantity * p.Price) OVER (PARTITION BY td.TransactionID) AS ComputedTotal
+            FROM Transaction_Details td
+            JOIN Product p ON p.ProductID = td.ProductID
+            WHERE td.TransactionID IN (SELECT CAST(value AS INT) FROM OPENJSON(?))
+        ) x
+        WHERE x.rn <= ?
+        ORDER BY x.TransactionID, x.rn
+    """, (json.dumps(list(by_id)), preview))
+
+    for tid, product_id, name, quantity, computed_total in cursor.fetchall():
+        o = by_id[tid]
+        o['items'].append({'ProductID': product_id, 'Name': name, 'Quantity': quantity})
+        # Ensure TotalAmount is set
+        if not o['TotalAmount']:
+            o['TotalAmount'] = float(computed_total or 0)
+    return orders
+
 @app.route('/customer/orders')
 @with_db
 def customer_orders(cursor, conn):
@@ -1101,8 +1474,9 @@ def customer_orders(cursor, conn):
         return redirect(url_for('login'))
 
     customer_id = session['user_id']
+    page = max(request.args.get('page', 1, type=int), 1)
 
-    # Fetch orders
+    # Fetch one page of orders (plus one row to tell whether there is a next page)
     cursor.execute("""
         SELECT
             st.TransactionID,
@@ -1114,38 +1488,33 @@ def customer_orders(cursor, conn):
             COALESCE(st.ShippingAddress, '') AS ShippingAddress
         FROM SalesTransaction AS st
         WHERE st.CustomerID = ?
-        ORDER BY st.TransactionDate DESC
-    """, (customer_id,))
+        ORDER BY st.TransactionDate DESC, st.TransactionID DESC
+        OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+    """, (customer_id, (page - 1) * ORDERS_PAGE_SIZE, ORDERS_PAGE_SIZE + 1))
     cols = [c[0] for c in cursor.description]
     orders = [dict(zip(cols, r)) for r in cursor.fetchall()]
 
-    for o in orders:
-        # Ensure TotalAmount is set
-        if not o['TotalAmount']:
-            cursor.execute("""
-                SELECT SUM(td.Quantity * p.Price)
-                FROM Transaction_Details td
-                JOIN Product p ON p.ProductID = td.ProductID
-                WHERE td.TransactionID = ?
-            """, (o['TransactionID'],))
-            o['TotalAmount'] = float(cursor.fetchone()[0] or 0)
+    has_next = len(orders) > ORDERS_PAGE_SIZE
+    orders = load_order_summaries(cursor, orders[:ORDERS_PAGE_SIZE])
 
-        # Fetch first 3 items for inline summary
-        cursor.execute("""
-            SELECT TOP 3 td.ProductID, p.Name, td.Quantity
-            FROM Transaction_Details td
-            JOIN Product p ON p.ProductID = td.ProductID
-            WHERE td.TransactionID = ?
-            ORDER BY td.ProductID
-        """, (o['TransactionID'],))
-        item_cols = [c[0] for c in cursor.description]
-        o['items'] = [dict(zip(item_cols, r)) for r in cursor.fetchall()]
+    return render_template('customer_orders.html', orders=orders, page=page, has_next=has_next)
+
+ORDERS_JSON_MAX_LIMIT = 100
 
-    return render_template('customer_orders.html', orders=orders)
+def contains_pattern(text):
+    """LIKE pattern (used with ESCAPE '\\') matching `text` as a plain substring."""
+    for ch in ('\\', '%', '_', '['):
+        text = text.replace(ch, '\\' + ch)
+    return f"%{text}%"
 
 @app.route('/customer/orders/json')
 @with_db
 def customer_orders_json(cursor, conn):
+    """
+    Filtered order history, one page at a time.
+    Query params: start_date, end_date, status, min_amount, max_amount,
+    keyword (product name), limit, offset. Returns {"orders": [...], "next_offset"}.
+    """
     if 'user_id' not in session or session.get('role') != 'customer':
         return jsonify({"error": "Unauthorized"}), 401
 
@@ -1158,66 +1527,93 @@ def customer_orders_json(cursor, conn):
     min_amount = request.args.get('min_amount')
     max_amount = request.args.get('max_amount')
     keyword = request.args.get('keyword', '').strip()
+    limit = min(max(request.args.get('limit', ORDERS_PAGE_SIZE, type=int), 1), ORDERS_JSON_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
 
-    query = """
-        SELECT
-            st.TransactionID,
-            st.TransactionDate,
-            COALESCE(st.TotalAmount, 0) AS TotalAmount,
-            COALESCE(st.OrderStatus, '') AS OrderStatus,
-            COALESCE(st.PaymentMethod, '') AS PaymentMethod,
-            COALESCE(st.OrderDiscount, 0) AS OrderDiscount,
-            COALESCE(st.ShippingAddress, '') AS ShippingAddress
-        FROM SalesTransaction st
-        WHERE st.CustomerID = ?
-    """
+    order_filters = ["st.CustomerID = ?"]
     params = [customer_id]
 
     # Dynamic filters
     if start_date:
-        query += " AND st.TransactionDate >= ?"
+        order_filters.append("st.TransactionDate >= ?")
         params.append(start_date)
     if end_date:
-        query += " AND st.TransactionDate <= ?"
+        order_filters.append("st.TransactionDate <= ?")
         params.append(end_date)
     if status:
-        query += " AND st.OrderStatus = ?"
+        order_filters.append("st.OrderStatus = ?")
         params.append(status)
     if min_amount:
-        query += " AND COALESCE(st.TotalAmount,0) >= ?"
+        order_filters.append("COALESCE(st.TotalAmount,0) >= ?")
         params.append(min_amount)
     if max_amount:
-        query += " AND COALESCE(st.TotalAmount,0) <= ?"
+        order_filters.append("COALESCE(st.TotalAmount,0) <= ?")
         params.append(max_amount)
 
-    query += " ORDER BY st.TransactionDate DESC"
-
+    # Only orders with at least one (matching) item are listed
+    item_filter = ""
+    if keyword:
+        item_filter = "AND p.Name LIKE ? ESCAPE '\\'"
+        keyword_pattern = contains_pattern(keyword)
+    order_filters.append(f"""EXISTS (
+                SELECT 1 FROM Transaction_Details td
+                JOIN Product p ON p.ProductID = td.ProductID
+                WHERE td.TransactionID = st.TransactionID {item_filter}
+            )""")
+    if keyword:
+        params.append(keyword_pattern)
+
+    # One page of orders (plus one to detect a next page) joined to their items
+    query = f"""
+        WITH page AS (
+            SELECT
+                st.TransactionID,
+                st.TransactionDate,
+                COALESCE(st.OrderStatus, '') AS OrderStatus,
+                COALESCE(st.PaymentMethod, '') AS PaymentMethod,
+                COALESCE(st.OrderDiscount, 0) AS OrderDiscount,
+                COALESCE(st.ShippingAddress, '') AS ShippingAddress
+            FROM SalesTransaction st
+            WHERE {" AND ".join(order_filters)}
+            ORDER BY st.TransactionDate DESC, st.TransactionID DESC
+            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+        )
+        SELECT pg.TransactionID, pg.TransactionDate, pg.OrderStatus, pg.PaymentMethod,
+               pg.OrderDiscount, pg.ShippingAddress,
+               td.ProductID, p.Name, td.Quantity, p.Price, (td.Quantity * p.Price) AS Subtotal
+        FROM page pg
+        JOIN Transaction_Details td ON td.TransactionID = pg.TransactionID
+        JOIN Product p ON p.ProductID = td.ProductID
+        WHERE 1 = 1 {item_filter}
+        ORDER BY pg.TransactionDate DESC, pg.TransactionID DESC, td.ProductID
+    """
+    params += [offset, limit + 1]
+    if keyword:
+        params.append(keyword_pattern)
     cursor.execute(query, tuple(params))
-    cols = [c[0] for c in cursor.description]
-    orders = [dict(zip(cols, r)) for r in cursor.fetchall()]
-
-    # Fetch items for each order and apply keyword filtering
-    for o in orders:
-        cursor.execute("""
-            SELECT td.ProductID, p.Name, td.Quantity, p.Price, (td.Quantity * p.Price) AS Subtotal
-            FROM Transaction_Details td
-            JOIN Product p ON p.ProductID = td.ProductID
-            WHERE td.TransactionID = ?
-        """, (o['TransactionID'],))
-        item_cols = [c[0] for c in cursor.description]
-        items = [dict(zip(item_cols, r)) for r in cursor.fetchall()]
-
-        # Filter items by keyword
-        if keyword:
-            items = [it for it in items if keyword.lower() in it['Name'].lower()]
-
-        o['items'] = items
-        # Recalculate total amount based on filtered items
-        o['TotalAmount'] = sum(it['Subtotal'] or 0 for it in items)
 
-    orders = [o for o in orders if o['items']]
+    orders = []
+    for row in cursor.fetchall():
+        tid, tdate, ostatus, payment, discount, address, product_id, name, quantity, price, subtotal = row
+        if not orders or orders[-1]['TransactionID'] != tid:
+            orders.append({
+                'TransactionID': tid,
+                'TransactionDate': tdate,
+                'TotalAmount': 0,
+                'OrderStatus': ostatus,
+                'PaymentMethod': payment,
+                'OrderDiscount': discount,
+                'ShippingAddress': address,
+                'items': []
+            })
+        o = orders[-1]
+        o['items'].append({'ProductID': product_id, 'Name': name, 'Quantity': quantity,
+                           'Price': price, 'Subtotal': subtotal})
+        # Total reflects the (keyword-filtered) items shown
+        o['TotalAmount'] += subtotal or 0
 
-    return jsonify(orders)
+    next_offset = offset + limit if len(orders) > limit else None
+    return jsonify({"orders": orders[:limit], "next_offset": next_offset})
 
 @app.route('/customer/orders/<int:transaction_id>')
 @with_db
@@ -1260,8 +1656,7 @@ def customer_order_detail(cursor, conn, transaction_id):
         WHERE td.TransactionID = ?
         ORDER BY td.ProductID
     """, (transaction_id,))
-    item_cols = [c[0] for c in cursor.description]
-    items = [dict(zip(item_cols, r)) for r in cursor.fetchall()]
+    items = fetch_rows(cursor)
 
     if not order['TotalAmount']:
         gross = sum((it['Subtotal'] or 0) for it in items)
@@ -1292,10 +1687,7 @@ def customer_order_items_json(cursor, conn, transaction_id):
         ORDER BY td.ProductID
     """, (transaction_id, customer_id))
 
-    cols = [c[0] for c in cursor.description]
-    items = [dict(zip(cols, r)) for r in cursor.fetchall()]
-
-    return jsonify(items)
+    return jsonify(fetch_rows(cursor))
 
 @app.route('/department')
 @with_db
@@ -1336,8 +1728,7 @@ def get_transactions(cursor, conn):
         base_query += " ORDER BY t.TotalAmount DESC"
 
     cursor.execute(base_query, params)
-    transactions = rows_to_dict_list(cursor)
-    return jsonify(transactions)
+    return rows_response(cursor)
 
 @app.route('/admin/inventory-report', methods=['GET', 'POST'])
 @with_db
@@ -1368,7 +1759,7 @@ def inventory_report(cursor, conn):
             params.append(stock_status)
 
         cursor.execute(query, params)
-        inventory_data = rows_to_dict_list(cursor)
+        inventory_data = fetch_rows(cursor)
 
         return render_template('admin_inventory_report.html', 
                                departments=departments, 
@@ -1406,6 +1797,18 @@ def bag(cursor, conn):
 
     return render_template('bag.html', user=user)
 
+_BAG_ITEMS_SQL = """
+    SELECT b.BagID, b.ProductID, p.Name, p.Price, b.Quantity, b.AddedAt
+    FROM dbo.Bag b
+    JOIN dbo.Product p ON p.ProductID = b.ProductID
+    WHERE {owner}
+    ORDER BY b.AddedAt DESC
+"""
+BAG_ITEMS_CUSTOMER = statements.declare("bag_items_customer",
+    _BAG_ITEMS_SQL.format(owner="b.CustomerID = ? AND b.EmployeeID IS NULL"))
+BAG_ITEMS_EMPLOYEE = statements.declare("bag_items_employee",
+    _BAG_ITEMS_SQL.format(owner="b.EmployeeID = ? AND b.CustomerID IS NULL"))
+
 @app.get("/api/bag")
 @with_db
 def api_get_bag(cursor, conn):
@@ -1414,25 +1817,11 @@ def api_get_bag(cursor, conn):
         return jsonify({"message": "Login required"}), 401
 
     if owner['CustomerID'] is not None:
-        cursor.execute("""
-            SELECT b.BagID, b.ProductID, p.Name, p.Price, b.Quantity, b.AddedAt
-            FROM dbo.Bag b
-            JOIN dbo.Product p ON p.ProductID = b.ProductID
-            WHERE b.CustomerID = ? AND b.EmployeeID IS NULL
-            ORDER BY b.AddedAt DESC
-        """, (owner['CustomerID'],))
+        BAG_ITEMS_CUSTOMER.execute(cursor, (owner['CustomerID'],))
     else:
-        cursor.execute("""
-            SELECT b.BagID, b.ProductID, p.Name, p.Price, b.Quantity, b.AddedAt
-            FROM dbo.Bag b
-            JOIN dbo.Product p ON p.ProductID = b.ProductID
-            WHERE b.EmployeeID = ? AND b.CustomerID IS NULL
-            ORDER BY b.AddedAt DESC
-        """, (owner['EmployeeID'],))
+        BAG_ITEMS_EMPLOYEE.execute(cursor, (owner['EmployeeID'],))
 
-    rows = cursor.fetchall()
-    cols = [c[0] for c in cursor.description]
-    return jsonify([dict(zip(cols, r)) for r in rows])
+    return rows_response(cursor)
 
 
 @app.post("/api/bag")
@@ -1477,6 +1866,7 @@ def api_add_to_bag(cursor, conn):
         """, (owner['EmployeeID'], pid, qty, qty))
 
     conn.commit()
+    bump_bag_count(owner, qty)
     return jsonify({"message": "Added"}), 201
 
 
@@ -1509,6 +1899,7 @@ def api_set_bag_qty(cursor, conn, bag_id):
     if cursor.rowcount == 0:
         return jsonify({"message": "Not found"}), 404
     conn.commit()
+    invalidate_bag_count(owner)
     return jsonify({"message": "Updated"})
 
 
@@ -1533,6 +1924,7 @@ def api_delete_bag_item(cursor, conn, bag_id):
     if cursor.rowcount == 0:
         return jsonify({"message": "Not found"}), 404
     conn.commit()
+    invalidate_bag_count(owner)
     return jsonify({"message": "Deleted"})
 
 @app.delete("/api/bag")
@@ -1549,6 +1941,7 @@ def api_clear_bag(cursor, conn):
         cursor.execute("DELETE FROM dbo.Bag WHERE EmployeeID = ? AND CustomerID IS NULL",
                        (owner['EmployeeID'],))
     conn.commit()
+    set_bag_count(owner, 0)
     return jsonify({"message": "Cleared"})
 
 # ---------- Shopping Lists ----------
@@ -1610,7 +2003,7 @@ def api_lists_all(cursor, conn):
         GROUP BY l.ListID, l.Name, l.IsDefault
         ORDER BY l.IsDefault DESC, CreatedAt ASC
     """, (cid,))
-    return jsonify(rows_to_dict_list(cursor))
+    return rows_response(cursor)
 
 @app.post('/api/lists')
 @with_db
@@ -1655,7 +2048,7 @@ def api_list_items(cursor, conn, list_id):
         WHERE i.ListID=?
         ORDER BY i.AddedAt DESC
     """, (list_id,))
-    return jsonify(rows_to_dict_list(cursor))
+    return rows_response(cursor)
 
 @app.post('/api/lists/<int:list_id>/items')
 @with_db
@@ -1759,6 +2152,7 @@ def api_list_add_to_bag(cursor, conn, list_id):
     cursor.execute("DELETE FROM dbo.ShoppingListItem WHERE ListID=?", (list_id,))
 
     conn.commit()
+    invalidate_bag_count({'CustomerID': cid, 'EmployeeID': None})
     return jsonify({"message": "Added to cart and cleared list"})
 
 #DATA REPORTS theres three of them
@@ -1831,6 +2225,9 @@ def employee_report(cursor, conn):
         avg_tenure_years=avg_tenure_years
     )
 
+# Cell kinds for the streamed employee report rows (see reports.report_response)
+EMPLOYEE_REPORT_CELLS = ('text', 'text', 'text', 'text', 'date', 'money', 'number', 'money')
+
 @app.post("/api/employee_report")
 @with_db
 def employee_report_filter(cursor, conn):
@@ -1922,27 +2319,17 @@ def employee_report_filter(cursor, conn):
 
     sql = "\n".join(sql_parts)
     cursor.execute(sql, params)
-    rows = cursor.fetchall()
-
-    html = ""
-    for r in rows:
-        html += "<tr>"
-        for val in r:
-            if isinstance(val, float):
-                html += f"<td>${val:,.2f}</td>"
-            elif isinstance(val, datetime):
-                html += f"<td>{val.strftime('%Y-%m-%d')}</td>"
-            else:
-                html += f"<td>{val}</td>"
-        html += "</tr>"
-
-    return jsonify({"html": html})
+    return report_response(cursor, EMPLOYEE_REPORT_CELLS)
 
 @app.route('/product_report')
 @with_db
 def product_report(cursor, conn):
-    # Fetch products as before
-    cursor.execute("""
+    # Fetch all departments for the filter
+    cursor.execute("SELECT Name FROM Department ORDER BY Name")
+    departments = [row[0] for row in cursor.fetchall()]
+
+    # Product rows are streamed into the template straight off the cursor
+    return stream_rows_template('product_report.html', 'products', cursor, """
         SELECT 
             p.ProductID,
             p.Name AS ProductName,
@@ -1968,14 +2355,61 @@ def product_report(cursor, conn):
             p.ProductID, p.Name, d.Name, p.Price, p.SalePrice, 
             i.QuantityAvailable, i.ReorderLevel, i.LastRestockDate, p.OnSale
         ORDER BY p.Name
+    """, departments=departments)
+
+PRODUCT_REPORT_CELLS = ('text', 'text', 'text', 'money', 'money', 'text',
+                        'text', 'text', 'date', 'text', 'money', 'number')
+
+# /api/product_report filters; each request's query is the base plus the
+# filters in use, in this order
+PRODUCT_REPORT_FILTERS = {
+    "department": "AND d.Name IN (SELECT value FROM OPENJSON(?))",
+    "product_name": "AND p.Name LIKE ?",
+    "in_stock": "AND i.QuantityAvailable > i.ReorderLevel",
+    "low_stock": "AND i.QuantityAvailable <= i.ReorderLevel AND i.QuantityAvailable > 0",
+    "out_of_stock": "AND i.QuantityAvailable <= 0",
+    "on_sale": "AND p.OnSale = ?",
+    "min_price": "AND p.Price >= ?",
+    "max_price": "AND p.Price <= ?",
+    "qty_min": "AND i.QuantityAvailable >= ?",
+    "qty_max": "AND i.QuantityAvailable <= ?",
+    "restock_from": "AND i.LastRestockDate >= ?",
+    "restock_to": "AND i.LastRestockDate <= ?",
+}
+
+def _product_report_sql(filters, order_by):
+    sql_parts = [
+        "SELECT",
+        "  p.ProductID,",
+        "  p.Name AS ProductName,",
+        "  d.Name AS Department,",
+        "  p.Price,",
+        "  p.SalePrice,",
+        "  i.QuantityAvailable,",
+        "  CASE",
+        "      WHEN i.QuantityAvailable <= 0 THEN 'Out of Stock'",
+        "      WHEN i.QuantityAvailable <= i.ReorderLevel THEN 'Low Stock'",
+        "      ELSE 'In Stock'",
+        "  END AS StockStatus,",
+        "  i.ReorderLevel,",
+        "  i.LastRestockDate,",
+        "  CASE WHEN p.OnSale = 1 THEN 'Yes' ELSE 'No' END AS OnSale,",
+        "  COALESCE(SUM(td.Quantity * td.Price), 0) AS TotalRevenue,",
+        "  COUNT(td.TransactionID) AS NumberOfSales",
+        "FROM Product p",
+        "LEFT JOIN Department d ON p.DepartmentID = d.DepartmentID",
+        "LEFT JOIN Inventory i ON p.ProductID = i.ProductID",
+        "LEFT JOIN Transaction_Details td ON td.ProductID = p.ProductID",
+        "WHERE 1=1"
+    ]
+    sql_parts.extend(PRODUCT_REPORT_FILTERS[name] for name in filters)
+    sql_parts.append("""
+        GROUP BY 
+            p.ProductID, p.Name, d.Name, p.Price, p.SalePrice, 
+            i.QuantityAvailable, i.ReorderLevel, i.LastRestockDate, p.OnSale
     """)
-    products = rows_to_dict_list(cursor)
-
-    # Fetch all departments for the filter
-    cursor.execute("SELECT Name FROM Department ORDER BY Name")
-    departments = [row[0] for row in cursor.fetchall()]
-
-    return render_template('product_report.html', products=products, departments=departments)
+    sql_parts.append(f"ORDER BY {order_by}")
+    return "\n".join(sql_parts)
 
 @app.post("/api/product_report")
 @with_db
@@ -2002,112 +2436,60 @@ def product_report_filter(cursor, conn):
         "LastRestockDate","OnSale","TotalRevenue","NumberOfSales"
     ]
 
-    sql_parts = [
-        "SELECT",
-        "  p.ProductID,",
-        "  p.Name AS ProductName,",
-        "  d.Name AS Department,",
-        "  p.Price,",
-        "  p.SalePrice,",
-        "  i.QuantityAvailable,",
-        "  CASE",
-        "      WHEN i.QuantityAvailable <= 0 THEN 'Out of Stock'",
-        "      WHEN i.QuantityAvailable <= i.ReorderLevel THEN 'Low Stock'",
-        "      ELSE 'In Stock'",
-        "  END AS StockStatus,",
-        "  i.ReorderLevel,",
-        "  i.LastRestockDate,",
-        "  CASE WHEN p.OnSale = 1 THEN 'Yes' ELSE 'No' END AS OnSale,",
-        "  COALESCE(SUM(td.Quantity * td.Price), 0) AS TotalRevenue,",
-        "  COUNT(td.TransactionID) AS NumberOfSales",
-        "FROM Product p",
-        "LEFT JOIN Department d ON p.DepartmentID = d.DepartmentID",
-        "LEFT JOIN Inventory i ON p.ProductID = i.ProductID",
-        "LEFT JOIN Transaction_Details td ON td.ProductID = p.ProductID",
-        "WHERE 1=1"
-    ]
-
+    filters = []
     params = []
 
     # Filters
-    # if department is a list
+    # department may be a single name or a list
     if department:
-        if isinstance(department, list):
-            placeholders = ", ".join(["?"] * len(department))
-            sql_parts.append(f"AND d.Name IN ({placeholders})")
-            params.extend(department)
-        else:
-            sql_parts.append("AND d.Name = ?")
-            params.append(department)
+        filters.append("department")
+        params.append(json.dumps(department if isinstance(department, list) else [department]))
 
     if product_name:
-        sql_parts.append("AND p.Name LIKE ?")
+        filters.append("product_name")
         params.append(f"%{product_name}%")
 
     if stock_status and stock_status.lower() != "all":
-        if stock_status.lower() == "in stock":
-            sql_parts.append("AND i.QuantityAvailable > i.ReorderLevel")
-        elif stock_status.lower() == "low stock":
-            sql_parts.append("AND i.QuantityAvailable <= i.ReorderLevel AND i.QuantityAvailable > 0")
-        elif stock_status.lower() == "out of stock":
-            sql_parts.append("AND i.QuantityAvailable <= 0")
+        status_filter = stock_status.lower().replace(" ", "_")
+        if status_filter in ("in_stock", "low_stock", "out_of_stock"):
+            filters.append(status_filter)
 
     if on_sale and on_sale.lower() != "all":
-        sql_parts.append("AND p.OnSale = ?")
+        filters.append("on_sale")
         params.append(1 if on_sale.lower() == "yes" else 0)
 
     if min_price not in (None, ""):
-        sql_parts.append("AND p.Price >= ?")
+        filters.append("min_price")
         params.append(float(min_price))
     if max_price not in (None, ""):
-        sql_parts.append("AND p.Price <= ?")
+        filters.append("max_price")
         params.append(float(max_price))
 
     if qty_min not in (None, ""):
-        sql_parts.append("AND i.QuantityAvailable >= ?")
+        filters.append("qty_min")
         params.append(int(qty_min))
     if qty_max not in (None, ""):
-        sql_parts.append("AND i.QuantityAvailable <= ?")
+        filters.append("qty_max")
         params.append(int(qty_max))
 
     if restock_from not in (None, ""):
-        sql_parts.append("AND i.LastRestockDate >= ?")
+        filters.append("restock_from")
         params.append(restock_from)
     if restock_to not in (None, ""):
-        sql_parts.append("AND i.LastRestockDate <= ?")
+        filters.append("restock_to")
         params.append(restock_to)
 
-    # Grouping
-    sql_parts.append("""
-        GROUP BY 
-            p.ProductID, p.Name, d.Name, p.Price, p.SalePrice, 
-            i.QuantityAvailable, i.ReorderLevel, i.LastRestockDate, p.OnSale
-    """)
-
     # Sorting
     if sort_column in allowed_columns:
         sort_direction = "DESC" if sort_direction == "DESC" else "ASC"
-        sql_parts.append(f"ORDER BY {sort_column} {sort_direction}")
+        order_by = f"{sort_column} {sort_direction}"
     else:
-        sql_parts.append("ORDER BY p.Name ASC")  # default sort
-
-    sql = "\n".join(sql_parts)
-    cursor.execute(sql, params)
-    rows = cursor.fetchall()
-
-    html = ""
-    for r in rows:
-        html += "<tr>"
-        for val in r:
-            if isinstance(val, float):
-                html += f"<td>${val:,.2f}</td>"
-            elif isinstance(val, datetime):
-                html += f"<td>{val.strftime('%Y-%m-%d')}</td>"
-            else:
-                html += f"<td>{val}</td>"
-        html += "</tr>"
+        order_by = "p.Name ASC"  # default sort
 
-    return jsonify({"html": html})
+    key = "+".join(filters) + ":" + order_by
+    stmt = statements.variant("product_report", key, lambda: _product_report_sql(filters, order_by))
+    stmt.execute(cursor, params)
+    return report_response(cursor, PRODUCT_REPORT_CELLS)
 
 @app.route('/api/product_kpis')
 @with_db
@@ -2149,61 +2531,29 @@ def product_kpis(cursor, conn):
         "low_stock": [{"name": r[0], "qty": r[1], "reorder": r[2]} for r in low_stock]
     })
 
+# Customer report columns, read from the Customer_Summary table kept by analytics.py
+CUSTOMER_REPORT_COLUMNS = """
+    c.CustomerID,
+    c.Name,
+    c.Email,
+    COALESCE(cs.TotalPurchases, 0) AS TotalPurchases,
+    COALESCE(cs.TotalSpent, 0) AS TotalSpent,
+    COALESCE(cs.FavoriteProduct, 'N/A') AS FavoriteProduct,
+    COALESCE(CONVERT(VARCHAR, cs.RecentPurchaseDate, 23), 'N/A') AS RecentPurchaseDate,
+    COALESCE(cs.LargestSingleOrder, 0) AS LargestSingleOrder,
+    COALESCE(cs.MostPurchasedCategory, 'N/A') AS MostPurchasedCategory
+"""
+
 @app.route('/customer_report')
 @with_db
 def customer_report(cursor, conn):
-    cursor.execute("""
-        SELECT
-            c.CustomerID,
-            c.Name,
-            c.Email,
-            COUNT(DISTINCT st.TransactionID) AS TotalPurchases,
-            COALESCE(SUM(st.TotalAmount), 0) AS TotalSpent,
-            
-            -- Favorite product
-            COALESCE((
-                SELECT TOP 1 p.Name
-                FROM Transaction_Details td2
-                JOIN Product p ON td2.ProductID = p.ProductID
-                JOIN SalesTransaction st2 ON td2.TransactionID = st2.TransactionID
-                WHERE st2.CustomerID = c.CustomerID
-                GROUP BY p.ProductID, p.Name
-                ORDER BY SUM(td2.Quantity) DESC
-            ), 'N/A') AS FavoriteProduct,
-            
-            -- Recent purchase (correlated subquery)
-            COALESCE((
-                SELECT TOP 1 CONVERT(VARCHAR, st2.TransactionDate, 23)
-                FROM SalesTransaction st2
-                WHERE st2.CustomerID = c.CustomerID
-                ORDER BY st2.TransactionDate DESC
-            ), 'N/A') AS RecentPurchaseDate,
-            
-            -- Largest single order per customer
-            COALESCE((
-                SELECT MAX(st2.TotalAmount)
-                FROM SalesTransaction st2
-                WHERE st2.CustomerID = c.CustomerID
-            ), 0) AS LargestSingleOrder,
-            
-            -- Most purchased category (using Department)
-            COALESCE((
-                SELECT TOP 1 d.Name
-                FROM Transaction_Details td2
-                JOIN Product p ON td2.ProductID = p.ProductID
-                JOIN Department d ON p.DepartmentID = d.DepartmentID
-                JOIN SalesTransaction st2 ON td2.TransactionID = st2.TransactionID
-                WHERE st2.CustomerID = c.CustomerID
-                GROUP BY d.Name
-                ORDER BY SUM(td2.Quantity) DESC
-            ), 'N/A') AS MostPurchasedCategory
-
+    cursor.execute(f"""
+        SELECT {CUSTOMER_REPORT_COLUMNS}
         FROM Customer c
-        LEFT JOIN SalesTransaction st ON c.CustomerID = st.CustomerID
-        GROUP BY c.CustomerID, c.Name, c.Email
+        LEFT JOIN Customer_Summary cs ON cs.CustomerID = c.CustomerID
         ORDER BY c.Name
     """)
-    customers = rows_to_dict_list(cursor)
+    customers = fetch_rows(cursor)
 
     # Compute overall largest single order across all customers
     overall_largest_order = max(c['LargestSingleOrder'] for c in customers) if customers else 0
@@ -2214,6 +2564,8 @@ def customer_report(cursor, conn):
         overall_largest_order=overall_largest_order
     )
 
+CUSTOMER_REPORT_CELLS = ('text', 'text', 'text', 'number', 'money', 'text', 'text', 'money', 'text')
+
 @app.post("/api/customer_report")
 @with_db
 def customer_report_filter(cursor, conn):
@@ -2230,41 +2582,40 @@ def customer_report_filter(cursor, conn):
     total_purchases_min = payload.get("total_purchases_min")
     total_purchases_max = payload.get("total_purchases_max")
 
-    sql_parts = [
-        "SELECT",
-        "  c.CustomerID,",
-        "  c.Name,",
-        "  c.Email,",
-        "  COUNT(DISTINCT st.TransactionID) AS TotalPurchases,",
-        "  COALESCE(SUM(st.TotalAmount), 0) AS TotalSpent,",
-        "  COALESCE((SELECT TOP 1 p.Name",
-        "           FROM Transaction_Details td2",
-        "           JOIN Product p ON td2.ProductID = p.ProductID",
-        "           JOIN SalesTransaction st2 ON td2.TransactionID = st2.TransactionID",
-        "           WHERE st2.CustomerID = c.CustomerID",
-        "           GROUP BY p.ProductID, p.Name",
-        "           ORDER BY SUM(td2.Quantity) DESC), 'N/A') AS FavoriteProduct,",
-        "  COALESCE((SELECT TOP 1 CONVERT(VARCHAR, st2.TransactionDate, 23)",
-        "           FROM SalesTransaction st2",
-        "           WHERE st2.CustomerID = c.CustomerID",
-        "           ORDER BY st2.TransactionDate DESC), 'N/A') AS RecentPurchaseDate,",
-        "  COALESCE((SELECT MAX(st2.TotalAmount)",
-        "           FROM SalesTransaction st2",
-        "           WHERE st2.CustomerID = c.CustomerID), 0) AS LargestSingleOrder,",
-        "  COALESCE((SELECT TOP 1 d.Name",
-        "           FROM Transaction_Details td2",
-        "           JOIN Product p ON td2.ProductID = p.ProductID",
-        "           JOIN Department d ON p.DepartmentID = d.DepartmentID",
-        "           JOIN SalesTransaction st2 ON td2.TransactionID = st2.TransactionID",
-        "           WHERE st2.CustomerID = c.CustomerID",
-        "           GROUP BY d.Name",
-        "           ORDER BY SUM(td2.Quantity) DESC), 'N/A') AS MostPurchasedCategory",
-        "FROM Customer c",
-        "LEFT JOIN SalesTransaction st ON c.CustomerID = st.CustomerID",
-        "WHERE 1=1"
-    ]
-
     params = []
+    if date_from or date_to:
+        # Purchase count and spend are limited to the date range (customers
+        # with no purchases in it drop out); the other columns stay all-time
+        range_filters = ["CustomerID IS NOT NULL"]
+        if date_from:
+            range_filters.append("TransactionDate >= ?")
+            params.append(date_from)
+        if date_to:
+            range_filters.append("TransactionDate <= ?")
+            params.append(date_to)
+        purchases, spent = "r.TotalPurchases", "r.TotalSpent"
+        sql_parts = [
+            "SELECT",
+            CUSTOMER_REPORT_COLUMNS.replace("COALESCE(cs.TotalPurchases, 0)", purchases)
+                                   .replace("COALESCE(cs.TotalSpent, 0)", spent),
+            "FROM Customer c",
+            "JOIN (SELECT CustomerID, COUNT(*) AS TotalPurchases,",
+            "             COALESCE(SUM(TotalAmount), 0) AS TotalSpent",
+            "      FROM SalesTransaction",
+            "      WHERE " + " AND ".join(range_filters),
+            "      GROUP BY CustomerID) r ON r.CustomerID = c.CustomerID",
+            "LEFT JOIN Customer_Summary cs ON cs.CustomerID = c.CustomerID",
+            "WHERE 1=1"
+        ]
+    else:
+        purchases, spent = "COALESCE(cs.TotalPurchases, 0)", "COALESCE(cs.TotalSpent, 0)"
+        sql_parts = [
+            "SELECT",
+            CUSTOMER_REPORT_COLUMNS,
+            "FROM Customer c",
+            "LEFT JOIN Customer_Summary cs ON cs.CustomerID = c.CustomerID",
+            "WHERE 1=1"
+        ]
 
     if customer_name:
         sql_parts.append("AND c.Name LIKE ?")
@@ -2272,32 +2623,19 @@ def customer_report_filter(cursor, conn):
     if email:
         sql_parts.append("AND c.Email LIKE ?")
         params.append(f"%{email}%")
-    if date_from:
-        sql_parts.append("AND st.TransactionDate >= ?")
-        params.append(date_from)
-    if date_to:
-        sql_parts.append("AND st.TransactionDate <= ?")
-        params.append(date_to)
-
-    sql_parts.append("GROUP BY c.CustomerID, c.Name, c.Email")
-
-    having_conditions = []
     if total_spent_min:
-        having_conditions.append("COALESCE(SUM(st.TotalAmount), 0) >= ?")
+        sql_parts.append(f"AND {spent} >= ?")
         params.append(float(total_spent_min))
     if total_spent_max:
-        having_conditions.append("COALESCE(SUM(st.TotalAmount), 0) <= ?")
+        sql_parts.append(f"AND {spent} <= ?")
         params.append(float(total_spent_max))
     if total_purchases_min:
-        having_conditions.append("COUNT(DISTINCT st.TransactionID) >= ?")
+        sql_parts.append(f"AND {purchases} >= ?")
         params.append(int(total_purchases_min))
     if total_purchases_max:
-        having_conditions.append("COUNT(DISTINCT st.TransactionID) <= ?")
+        sql_parts.append(f"AND {purchases} <= ?")
         params.append(int(total_purchases_max))
 
-    if having_conditions:
-        sql_parts.append("HAVING " + " AND ".join(having_conditions))
-
     allowed_columns = ["CustomerID","Name","Email","TotalPurchases","TotalSpent",
                        "FavoriteProduct","RecentPurchaseDate","LargestSingleOrder","MostPurchasedCategory"]
     if sort_column in allowed_columns:
@@ -2308,54 +2646,155 @@ def customer_report_filter(cursor, conn):
 
     sql = "\n".join(sql_parts)
     cursor.execute(sql, params)
-    rows = rows_to_dict_list(cursor)
-
-    html = ""
-    for r in rows:
-        html += "<tr>"
-        html += f"<td>{r['CustomerID'] or 'N/A'}</td>"
-        html += f"<td>{r['Name'] or 'N/A'}</td>"
-        html += f"<td>{r['Email'] or 'N/A'}</td>"
-        html += f"<td>{r['TotalPurchases'] or 0}</td>"
-        html += f"<td>${r['TotalSpent']:.2f}</td>"
-        html += f"<td>{r['FavoriteProduct'] or 'N/A'}</td>"
-        html += f"<td>{r['RecentPurchaseDate'] or 'N/A'}</td>"
-        html += f"<td>${r['LargestSingleOrder']:.2f}</td>"
-        html += f"<td>{r['MostPurchasedCategory'] or 'N/A'}</td>"
-        html += "</tr>"
-
-    return jsonify({"html": html})
+    return report_response(cursor, CUSTOMER_REPORT_CELLS, missing='N/A')
 
-@app.route('/revenue_report')
+@app.post("/api/customer_report/rebuild")
 @with_db
-def revenue_report(cursor, conn):
-    # Fetch initial revenue transactions
-    cursor.execute("""
-        SELECT st.TransactionID, st.TransactionDate, c.Name AS CustomerName,
-            st.PaymentMethod, st.OrderStatus, st.TotalAmount
+def customer_report_rebuild(cursor, conn):
+    """Recompute Customer_Summary from scratch (also: python analytics.py customers)."""
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+    count = rebuild_customer_summaries(cursor, conn)
+    return jsonify({"message": f"Rebuilt summaries for {count} customer(s)", "customers": count})
+
+# -----------------------------
+# Revenue report
+# -----------------------------
+
+REVENUE_PAGE_SIZE = int(os.environ.get('REVENUE_PAGE_SIZE', 100))
+REVENUE_EXPORT_CHUNK = int(os.environ.get('REVENUE_EXPORT_CHUNK', 1000))
+
+# Keyset sort columns: column -> (expression, cursor cast type, nullable).
+# TransactionID breaks ties so every position in the order is unique. Sorting
+# on the bare columns lets IX_SalesTransaction_Date_ID / _Amount_ID serve each page.
+REVENUE_SORTS = {
+    'TransactionDate': ("st.TransactionDate", 'DATETIME', True),
+    'TotalAmount': ("st.TotalAmount", 'DECIMAL(10, 2)', False),
+    'TransactionID': ("st.TransactionID", 'INT', False),
+}
+
+REVENUE_COLUMNS = ["TransactionID", "TransactionDate", "CustomerName", "PaymentMethod", "OrderStatus", "TotalAmount"]
+
+def revenue_filters(source):
+    """WHERE clause and params for the revenue report filters in a payload or query string."""
+    where, params = ["1=1"], []
+    start_date = source.get("start_date")
+    end_date = source.get("end_date")
+    payment_method = source.get("payment_method")
+    order_status = source.get("order_status")
+
+    if start_date:
+        where.append("st.TransactionDate >= ?")
+        params.append(start_date)
+    if end_date:
+        # Convert to datetime and add 1 day for inclusive comparison
+        end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
+        where.append("st.TransactionDate < ?")
+        params.append(end_dt.strftime("%Y-%m-%d"))
+    if payment_method and payment_method.lower() != "all":
+        where.append("st.PaymentMethod = ?")
+        params.append(payment_method)
+    if order_status and order_status.lower() != "all":
+        where.append("st.OrderStatus = ?")
+        params.append(order_status)
+    return " AND ".join(where), params
+
+def revenue_kpis(cursor, where, params):
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM(st.TotalAmount), 0)
+        FROM SalesTransaction st
+        WHERE {where}
+    """, params)
+    total_orders, total_revenue = cursor.fetchone()
+    total_revenue = float(total_revenue)
+    return {
+        "totalRevenue": total_revenue,
+        "totalOrders": total_orders,
+        "avgOrderValue": total_revenue / total_orders if total_orders else 0
+    }
+
+def _format_transaction_date(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        # sometimes already string
+        return value.split("T")[0].split(" ")[0]
+    return value.strftime("%Y-%m-%d")
+
+def _revenue_cursor_value(value):
+    # datetime only keeps milliseconds, and SQL Server rejects longer fractions
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%S.") + f"{value.microsecond // 1000:03d}"
+    if isinstance(value, (int, float, str)):
+        return value
+    return str(value)
+
+def load_revenue_page(cursor, where, params, sort="TransactionDate", descending=True, after=None,
+                      limit=REVENUE_PAGE_SIZE):
+    """
+    Keyset pagination over SalesTransaction. Returns the description of the
+    REVENUE_COLUMNS, up to `limit` raw rows that sort after the key `after`,
+    and the key to resume from (None on the last page).
+    """
+    expr, cast_type, nullable = REVENUE_SORTS[sort]
+    direction, op = ("DESC", "<") if descending else ("ASC", ">")
+    where = [where]
+    params = list(params)
+    if after:
+        value, last_id = after
+        # SQL Server sorts NULLs first ascending and last descending
+        if value is None:
+            clause = f"({expr} IS NULL AND st.TransactionID {op} ?)"
+            if not descending:
+                clause = f"({clause} OR {expr} IS NOT NULL)"
+            where.append(clause)
+            params.append(last_id)
+        else:
+            clause = (f"{expr} {op} CAST(? AS {cast_type}) OR "
+                      f"({expr} = CAST(? AS {cast_type}) AND st.TransactionID {op} ?)")
+            if nullable and descending:
+                clause += f" OR {expr} IS NULL"
+            where.append(f"({clause})")
+            params.extend([value, value, last_id])
+
+    cursor.execute(f"""
+        SELECT TOP (?) st.TransactionID, st.TransactionDate, c.Name AS CustomerName,
+            st.PaymentMethod, st.OrderStatus, st.TotalAmount, {expr} AS SortKey
         FROM SalesTransaction st
         LEFT JOIN Customer c ON st.CustomerID = c.CustomerID
-        ORDER BY st.TransactionDate DESC
-    """)
+        WHERE {" AND ".join(where)}
+        ORDER BY {expr} {direction}, st.TransactionID {direction}
+    """, [limit + 1] + params)
     rows = cursor.fetchall()
 
-    transactions = []
-    for r in rows:
-        transaction_date = r[1]
-        if isinstance(transaction_date, str):
-            # sometimes already string
-            date_str = transaction_date.split("T")[0]
-        else:
-            date_str = transaction_date.strftime("%Y-%m-%d")
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = [_revenue_cursor_value(rows[-1][6]), rows[-1][0]]
+
+    # Drop the SortKey column
+    width = len(REVENUE_COLUMNS)
+    return cursor.description[:width], [r[:width] for r in rows], next_key
+
+def revenue_dicts(rows):
+    return [{
+        "TransactionID": r[0],
+        "TransactionDate": _format_transaction_date(r[1]),
+        "CustomerName": r[2],
+        "PaymentMethod": r[3],
+        "OrderStatus": r[4],
+        "TotalAmount": r[5]
+    } for r in rows]
 
-        transactions.append({
-            "TransactionID": r[0],
-            "TransactionDate": date_str,
-            "CustomerName": r[2],
-            "PaymentMethod": r[3],
-            "OrderStatus": r[4],
-            "TotalAmount": r[5]
-        })
+@app.route('/revenue_report')
+@with_db
+def revenue_report(cursor, conn):
+    # First page and the KPIs; the table loads further pages on demand
+    where, params = revenue_filters({})
+    _, rows, next_key = load_revenue_page(cursor, where, params)
+    kpis = revenue_kpis(cursor, where, params)
 
     # Fetch unique payment methods and order statuses for filters
     cursor.execute("SELECT DISTINCT PaymentMethod FROM SalesTransaction")
@@ -2370,7 +2809,9 @@ def revenue_report(cursor, conn):
 
     return render_template(
         'revenue_report.html',
-        transactions=transactions,
+        transactions=revenue_dicts(rows),
+        kpis=kpis,
+        next_cursor=encode_cursor(next_key) if next_key else None,
         payment_methods=payment_methods,
         order_statuses=order_statuses,
         departments=departments
@@ -2379,72 +2820,76 @@ def revenue_report(cursor, conn):
 @app.post("/api/revenue_report")
 @with_db
 def revenue_report_filter(cursor, conn):
+    """
+    One page of the filtered revenue table. Pass back `cursor` from the
+    previous response for the next page; KPIs come with the first page only.
+    The transactions can be requested in the columnar format (columnar_orient).
+    """
     payload = request.get_json() or {}
-    start_date = payload.get("start_date")
-    end_date = payload.get("end_date")
-    payment_method = payload.get("payment_method")
-    order_status = payload.get("order_status")
-
-    sql_parts = [
-        "SELECT st.TransactionID, st.TransactionDate, c.Name AS CustomerName,",
-        "st.PaymentMethod, st.OrderStatus, st.TotalAmount",
-        "FROM SalesTransaction st",
-        "LEFT JOIN Customer c ON st.CustomerID = c.CustomerID",
-        "WHERE 1=1"
-    ]
-    params = []
-
-    # Filters
-    if start_date:
-        sql_parts.append("AND st.TransactionDate >= ?")
-        params.append(start_date)
-    if end_date:
-        # Convert to datetime and add 1 day for inclusive comparison
-        end_dt = datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)
-        sql_parts.append("AND st.TransactionDate < ?")
-        params.append(end_dt.strftime("%Y-%m-%d"))
-    if payment_method and payment_method.lower() != "all":
-        sql_parts.append("AND st.PaymentMethod = ?")
-        params.append(payment_method)
-    if order_status and order_status.lower() != "all":
-        sql_parts.append("AND st.OrderStatus = ?")
-        params.append(order_status)
-
-    # Sorting
-    sort_column = payload.get("sort_column", "TransactionDate")
-    sort_direction = "DESC" if payload.get("sort_direction", "DESC").upper() == "DESC" else "ASC"
-    sql_parts.append(f"ORDER BY {sort_column} {sort_direction}")
+    where, params = revenue_filters(payload)
 
-    sql = "\n".join(sql_parts)
-    cursor.execute(sql, params)
-    rows = cursor.fetchall()
+    sort_column = payload.get("sort_column") or "TransactionDate"
+    if sort_column not in REVENUE_SORTS:
+        return jsonify({"message": "Invalid sort_column"}), 400
+    descending = (payload.get("sort_direction") or "DESC").upper() == "DESC"
+    try:
+        after = decode_cursor(payload["cursor"]) if payload.get("cursor") else None
+        if after is not None and len(after) != 2:
+            raise ValueError("Invalid cursor")
+    except ValueError:
+        return jsonify({"message": "Invalid cursor"}), 400
+    limit = min(max(int(payload.get("limit") or REVENUE_PAGE_SIZE), 1), REVENUE_PAGE_SIZE)
 
-    # Calculate KPIs
-    total_revenue = sum(r[5] for r in rows)
-    total_orders = len(rows)
-    avg_order_value = total_revenue / total_orders if total_orders else 0
+    description, rows, next_key = load_revenue_page(cursor, where, params, sort_column, descending, after, limit)
+    result = {"next_cursor": encode_cursor(next_key) if next_key else None}
+    if after is None:
+        result.update(revenue_kpis(cursor, where, params))
 
-    # Build transactions list
-    transactions = []
-    for r in rows:
-        transaction_date = r[1]
-        if isinstance(transaction_date, str):
-            transaction_date = datetime.strptime(transaction_date, "%Y-%m-%d")
-        transactions.append({
-            "TransactionID": r[0],
-            "TransactionDate": transaction_date.strftime("%Y-%m-%d"),
-            "CustomerName": r[2],
-            "PaymentMethod": r[3],
-            "OrderStatus": r[4],
-            "TotalAmount": r[5]
-        })
+    orient = columnar_orient()
+    if orient:
+        return columnar_response(description, rows, orient, **result)
+    result["transactions"] = revenue_dicts(rows)
+    return jsonify(result)
 
-    return jsonify({
-        "transactions": transactions,
-        "totalRevenue": total_revenue,
-        "totalOrders": total_orders,
-        "avgOrderValue": avg_order_value
-    })
+@app.get("/api/revenue_report/export")
+@with_db
+def revenue_report_export(cursor, conn):
+    """
+    Stream the filtered revenue table as CSV, REVENUE_EXPORT_CHUNK rows at a
+    time. Takes the same filters as /api/revenue_report as query parameters.
+    """
+    if 'user_id' not in session or session.get('role') not in ('admin', 'employee'):
+        return jsonify({"error": "Unauthorized"}), 403
+    where, params = revenue_filters(request.args)
+    cursor.execute(f"""
+        SELECT st.TransactionID, st.TransactionDate, c.Name AS CustomerName,
+            st.PaymentMethod, st.OrderStatus, st.TotalAmount
+        FROM SalesTransaction st
+        LEFT JOIN Customer c ON st.CustomerID = c.CustomerID
+        WHERE {where}
+        ORDER BY st.TransactionDate DESC, st.TransactionID DESC
+    """, params)
+
+    def generate():
+        # The request's connection stays checked out until the stream ends
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(REVENUE_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(REVENUE_EXPORT_CHUNK)
+            if not rows:
+                break
+            for r in rows:
+                writer.writerow([r[0], _format_transaction_date(r[1]), r[2], r[3], r[4], r[5]])
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    response = Response(stream_with_context(generate()), mimetype='text/csv')
+    response.headers['Content-Disposition'] = 'attachment; filename="revenue_report.csv"'
+    return response
 
 @app.post("/api/revenue_report_chart")
 @with_db
@@ -2459,15 +2904,14 @@ def revenue_report_chart(cursor, conn):
         start_date = datetime(today.year, today.month, 1).date()
     end_date = payload.get("end_date") or datetime.today().date()
 
+    # Answered from the daily rollup rather than the transaction history
     sql_parts = [
-        "SELECT d.Name AS Department, CAST(st.TransactionDate AS DATE) AS TransactionDate,",
-        "SUM(td.Subtotal) AS Revenue",
-        "FROM SalesTransaction st",
-        "LEFT JOIN Transaction_Details td ON st.TransactionID = td.TransactionID",
-        "LEFT JOIN Product p ON td.ProductID = p.ProductID",
-        "LEFT JOIN Department d ON p.DepartmentID = d.DepartmentID",
-        "WHERE st.OrderStatus = 'Completed'",
-        "AND CAST(st.TransactionDate AS DATE) BETWEEN ? AND ?"
+        "SELECT d.Name AS Department, r.SaleDate AS TransactionDate,",
+        "SUM(r.Revenue) AS Revenue",
+        "FROM Daily_Sales_Rollup r",
+        "LEFT JOIN Department d ON r.DepartmentID = d.DepartmentID",
+        "WHERE r.OrderStatus = 'Completed'",
+        "AND r.SaleDate BETWEEN ? AND ?"
     ]
     params = [start_date, end_date]
 
@@ -2476,7 +2920,7 @@ def revenue_report_chart(cursor, conn):
         sql_parts.append(f"AND d.Name IN ({placeholders})")
         params.extend(departments)
 
-    sql_parts.append("GROUP BY d.Name, CAST(st.TransactionDate AS DATE)")
+    sql_parts.append("GROUP BY d.Name, r.SaleDate")
     sql_parts.append("ORDER BY TransactionDate ASC")
     sql = "\n".join(sql_parts)
 
@@ -2552,6 +2996,13 @@ def checkout(cursor, conn):
             return jsonify({"message": f"Invalid item: {it}"}), 400
         clean.append((pid, qty))
 
+    # One line per product (Transaction_Details is keyed on TransactionID, ProductID);
+    # dict keeps the basket order for error reporting
+    basket = {}
+    for pid, qty in clean:
+        basket[pid] = basket.get(pid, 0) + qty
+    basket_json = json.dumps([{"product_id": pid, "quantity": qty} for pid, qty in basket.items()])
+
     role = session.get('role')
     cust_id = session.get('user_id') if role == 'customer' else None
     emp_id  = session.get('user_id') if role == 'employee' else None
@@ -2562,29 +3013,28 @@ def checkout(cursor, conn):
     autocommit_backup = conn.autocommit
     conn.autocommit = False
     try:
-        grand_total = 0.0
-        line_items = []
+        # Validate and lock every basket row in one statement
+        cursor.execute("""
+            SELECT p.ProductID, p.Price, p.QuantityInStock
+            FROM Product p WITH (UPDLOCK, ROWLOCK)
+            WHERE p.ProductID IN (
+                SELECT ProductID FROM OPENJSON(?) WITH (ProductID INT '$.product_id')
+            )
+        """, (basket_json,))
+        locked = {int(r[0]): (r[1], r[2] or 0) for r in cursor.fetchall()}
 
-        for pid, qty in clean:
-            cursor.execute("""
-                SELECT TOP 1 ProductID, Price, QuantityInStock
-                FROM Product WITH (UPDLOCK, ROWLOCK)
-                WHERE ProductID = ?
-            """, (pid,))
-            row = cursor.fetchone()
-            if not row:
+        grand_total = 0.0
+        for pid, qty in basket.items():
+            if pid not in locked:
                 conn.rollback(); conn.autocommit = autocommit_backup
                 return jsonify({"message": f"Product {pid} not found."}), 404
 
-            _, price, stock = row
-            stock = stock or 0
+            price, stock = locked[pid]
             if stock < qty:
                 conn.rollback(); conn.autocommit = autocommit_backup
                 return jsonify({"message": f"Insufficient stock for ProductID {pid}. In stock: {stock}, requested: {qty}"}), 409
 
-            subtotal = float(price) * qty
-            grand_total += subtotal
-            line_items.append((pid, qty, float(price), subtotal))
+            grand_total += float(price) * qty
 
         cursor.execute("""
             INSERT INTO SalesTransaction (
@@ -2595,26 +3045,41 @@ def checkout(cursor, conn):
         """, (cust_id, grand_total, 'Cash', 'Completed'))
         new_tid = cursor.fetchone()[0]
 
-        for pid, qty, price, subtotal in line_items:
-            cursor.execute("""
-                INSERT INTO Transaction_Details (TransactionID, ProductID, Quantity, Price, EmployeeID)
-                VALUES (?, ?, ?, ?, ?)
-            """, (new_tid, pid, qty, price, emp_id)) 
-            cursor.execute("""
-                UPDATE Product
-                SET QuantityInStock = QuantityInStock - ?
-                WHERE ProductID = ?
-            """, (qty, pid))
+        # Prices come from the rows locked above, so they match grand_total
+        cursor.execute("""
+            INSERT INTO Transaction_Details (TransactionID, ProductID, Quantity, Price, EmployeeID)
+            SELECT ?, b.ProductID, b.Quantity, p.Price, ?
+            FROM OPENJSON(?) WITH (ProductID INT '$.product_id', Quantity INT '$.quantity') b
+            JOIN Product p ON p.ProductID = b.ProductID
+        """, (new_tid, emp_id, basket_json))
+        cursor.execute("""
+            UPDATE p
+            SET p.QuantityInStock = p.QuantityInStock - b.Quantity
+            FROM Product p
+            JOIN OPENJSON(?) WITH (ProductID INT '$.product_id', Quantity INT '$.quantity') b
+              ON p.ProductID = b.ProductID
+        """, (basket_json,))
 
         if cust_id is not None:
+            record_customer_order(cursor, cust_id, new_tid)
             cursor.execute("DELETE FROM dbo.Bag WHERE CustomerID = ? AND EmployeeID IS NULL",
                            (cust_id,))
         elif emp_id is not None:
             cursor.execute("DELETE FROM dbo.Bag WHERE EmployeeID = ? AND CustomerID IS NULL",
                            (emp_id,))
 
+        # Today's rollup rows are shared by every checkout, so only queue the
+        # order here and fold it in after the commit
+        queue_sales_rollup(cursor, new_tid)
+
         conn.commit()
         conn.autocommit = autocommit_backup
+        set_bag_count({'CustomerID': cust_id, 'EmployeeID': emp_id}, 0)
+        try:
+            fold_sales_rollup(cursor, conn, new_tid)
+        except Exception as e:
+            # The order stays queued for `analytics.py pending`
+            print("Sales rollup deferred (/checkout):", e, flush=True)
         return jsonify({"transaction_id": new_tid, "total_amount": grand_total}), 201
 
     except Exception as e:
@@ -2703,18 +3168,16 @@ def dismiss_all_notifications(cursor, conn):
         print(f"Error dismissing all notifications: {e}")
         return jsonify({"message": "Error dismissing notifications"}), 500
 
-@app.route('/receipts_report')
-@with_db
-def receipts_report(cursor, conn):
-    if session.get('role') != 'admin':
-        return redirect(url_for('login'))
-
-    start_date = request.args.get('date_from') or None
-    end_date = request.args.get('date_to') or None
-    payment_method = request.args.get('payment_method') or None
-    order_status = request.args.get('order_status') or None
-    employee_id = request.args.get('employee_id') or None
+# /receipts_report filters, appended in this order
+RECEIPTS_REPORT_FILTERS = {
+    "start_date": " AND st.TransactionDate >= ?",
+    "end_date": " AND st.TransactionDate < DATEADD(day,1,?)",
+    "payment_method": " AND st.PaymentMethod = ?",
+    "order_status": " AND st.OrderStatus = ?",
+    "employee_id": " AND e.EmployeeID = ?",
+}
 
+def _receipts_report_sql(filters):
     sql = """
         SELECT
             st.TransactionID,
@@ -2739,29 +3202,7 @@ def receipts_report(cursor, conn):
         LEFT JOIN dbo.Transaction_Details td ON td.TransactionID = st.TransactionID
         WHERE 1 = 1
     """
-
-    params = []
-
-    if start_date:
-        sql += " AND st.TransactionDate >= ?"
-        params.append(start_date)
-
-    if end_date:
-        sql += " AND st.TransactionDate < DATEADD(day,1,?)"
-        params.append(end_date)
-
-    if payment_method:
-        sql += " AND st.PaymentMethod = ?"
-        params.append(payment_method)
-
-    if order_status:
-        sql += " AND st.OrderStatus = ?"
-        params.append(order_status)
-
-    if employee_id:
-        sql += " AND e.EmployeeID = ?"
-        params.append(employee_id)
-
+    sql += "".join(RECEIPTS_REPORT_FILTERS[name] for name in filters)
     sql += """
         GROUP BY
             st.TransactionID,
@@ -2774,9 +3215,31 @@ def receipts_report(cursor, conn):
             st.TotalAmount
         ORDER BY st.TransactionDate DESC
     """
+    return sql
 
-    cursor.execute(sql, tuple(params))
-    rows = cursor.fetchall()
+@app.route('/receipts_report')
+@with_db
+def receipts_report(cursor, conn):
+    if session.get('role') != 'admin':
+        return redirect(url_for('login'))
+
+    start_date = request.args.get('date_from') or None
+    end_date = request.args.get('date_to') or None
+    payment_method = request.args.get('payment_method') or None
+    order_status = request.args.get('order_status') or None
+    employee_id = request.args.get('employee_id') or None
+
+    filters = []
+    params = []
+    for name, value in (("start_date", start_date), ("end_date", end_date),
+                        ("payment_method", payment_method), ("order_status", order_status),
+                        ("employee_id", employee_id)):
+        if value:
+            filters.append(name)
+            params.append(value)
+
+    stmt = statements.variant("receipts_report", "+".join(filters), lambda: _receipts_report_sql(filters))
+    rows = stmt.fetchall(cursor, params)
 
     receipts = []
     for r in rows:
@@ -2860,8 +3323,7 @@ def api_receipt_details(cursor, conn, transaction_id):
         WHERE td.TransactionID = ?
         ORDER BY p.Name
     """, (transaction_id,))
-    cols = [col[0] for col in cursor.description]
-    items = [dict(zip(cols, row)) for row in cursor.fetchall()]
+    items = fetch_rows(cursor)
 
     total_items = len(items)
     total_units = sum(i["Quantity"] for i in items)
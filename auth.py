@@ -0,0 +1,98 @@
+import os
+import hmac
+import hashlib
+import secrets
+from werkzeug.security import generate_password_hash, check_password_hash
+from cache import TTLCache
+from statements import statements
+
+# -----------------------------
+# Credentials
+# -----------------------------
+
+# How long a verified login is remembered, and how many are kept. Password
+# changes made through this process drop the entry at once; the TTL bounds
+# how long another process can keep accepting an old password.
+LOGIN_CACHE_TTL = int(os.environ.get('LOGIN_CACHE_TTL', 900))
+LOGIN_CACHE_SIZE = int(os.environ.get('LOGIN_CACHE_SIZE', 5000))
+
+ROLE_REDIRECTS = {'admin': '/admin', 'employee': '/employee', 'customer': '/customer'}
+
+# Where each role's password lives, for upgrading legacy plaintext rows
+_PASSWORD_COLUMNS = {
+    'admin': ("Administrator", "Password", "AdminID"),
+    'employee': ("Employee", "Password", "EmployeeID"),
+    'customer': ("Customer", "password", "CustomerID"),
+}
+
+# One round-trip for all three account tables; rank keeps the old
+# admin > employee > customer precedence when a username is reused
+IDENTITY_LOOKUP = statements.declare("identity_lookup", """
+    SELECT ID, Role, StoredPassword
+    FROM (
+        SELECT AdminID AS ID, 'admin' AS Role, Password AS StoredPassword, 1 AS RoleRank
+        FROM Administrator WHERE Username = ?
+        UNION ALL
+        SELECT EmployeeID, 'employee', Password, 2
+        FROM Employee WHERE Username = ?
+        UNION ALL
+        SELECT CustomerID, 'customer', password, 3
+        FROM Customer WHERE username = ?
+    ) AS accounts
+    ORDER BY RoleRank
+""")
+
+_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+def hash_password(password):
+    return generate_password_hash(password)
+
+def is_password_hash(stored):
+    return bool(stored) and stored.startswith(_HASH_PREFIXES)
+
+def verify_password(stored, password):
+    """Check a password against a stored salted hash, or a legacy plaintext value."""
+    if not stored or not password:
+        return False
+    if is_password_hash(stored):
+        return check_password_hash(stored, password)
+    return hmac.compare_digest(stored.encode(), password.encode())
+
+# username -> (role, user_id, proof). The proof is a keyed digest of the
+# password that was verified, so a repeat login skips both the database and
+# the deliberately slow hash check. The key never leaves this process.
+_verified = TTLCache(ttl=LOGIN_CACHE_TTL, max_entries=LOGIN_CACHE_SIZE)
+_proof_key = secrets.token_bytes(32)
+
+def _cache_key(username):
+    # Usernames compare case-insensitively and ignore trailing spaces in SQL Server
+    return username.rstrip().lower()
+
+def _proof(username, password):
+    return hmac.new(_proof_key, f"{_cache_key(username)}\0{password}".encode(), hashlib.sha256).digest()
+
+def forget_login(username):
+    """Drop a cached login; call whenever that account's password changes."""
+    if username:
+        _verified.delete(_cache_key(username))
+
+def authenticate(cursor, conn, username, password):
+    """
+    Return (role, user_id) for a valid username/password, or None.
+    Legacy plaintext passwords are rehashed in place on first use.
+    """
+    proof = _proof(username, password)
+    cached = _verified.get(_cache_key(username))
+    if cached is not None and hmac.compare_digest(cached[2], proof):
+        return cached[0], cached[1]
+
+    for user_id, role, stored in IDENTITY_LOOKUP.fetchall(cursor, (username, username, username)):
+        if not verify_password(stored, password):
+            continue
+        if not is_password_hash(stored):
+            table, column, key = _PASSWORD_COLUMNS[role]
+            cursor.execute(f"UPDATE {table} SET {column} = ? WHERE {key} = ?", (hash_password(password), user_id))
+            conn.commit()
+        _verified.set(_cache_key(username), (role, user_id, proof))
+        return role, user_id
+    return None
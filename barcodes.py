@@ -0,0 +1,110 @@
+import os
+import json
+import threading
+
+# -----------------------------
+# Barcode allocation
+# -----------------------------
+
+# New products get EAN-13 codes: BARCODE_PREFIX, then a number drawn from
+# the Product_Barcode_Seq sequence, then the GS1 check digit. Prefix 20 is
+# the GS1 range for in-store numbering, so these never clash with supplier
+# GTINs or with the older 12-digit random codes. Sequence values are handed
+# out in blocks; a block that is never used just leaves a gap. script.sql
+# starts the sequence past the prefix-20 codes already in Product, but an
+# import can still bring in such a code later, so drawn codes are checked
+# against Product and re-drawn if taken; UX_Product_Barcode rejects any
+# duplicate that slips through between the check and the insert.
+
+BARCODE_PREFIX = os.environ.get('BARCODE_PREFIX', '20')
+BARCODE_BLOCK_SIZE = int(os.environ.get('BARCODE_BLOCK_SIZE', 50))
+
+GTIN_LENGTH = 13
+_SEQUENCE_WIDTH = GTIN_LENGTH - 1 - len(BARCODE_PREFIX)
+
+_RESERVE_RANGE_SQL = """
+    SET NOCOUNT ON;
+    DECLARE @first sql_variant;
+    EXEC sys.sp_sequence_get_range
+        @sequence_name = N'dbo.Product_Barcode_Seq',
+        @range_size = ?,
+        @range_first_value = @first OUTPUT;
+    SELECT CAST(@first AS bigint);
+"""
+
+_TAKEN_SQL = """
+    SELECT Barcode FROM Product
+    WHERE Barcode IN (SELECT value FROM OPENJSON(?))
+"""
+
+def gtin_check_digit(digits):
+    """GS1 check digit for a string of digits (the code without its last digit)."""
+    total = sum(int(d) * (3 if i % 2 == 0 else 1) for i, d in enumerate(reversed(digits)))
+    return str((10 - total % 10) % 10)
+
+def is_valid_gtin(code):
+    code = (code or "").strip()
+    return code.isdigit() and len(code) in (8, 12, 13, 14) and gtin_check_digit(code[:-1]) == code[-1]
+
+def make_gtin(value):
+    """Build the barcode for sequence number `value`."""
+    body = f"{BARCODE_PREFIX}{value:0{_SEQUENCE_WIDTH}d}"
+    if len(body) != GTIN_LENGTH - 1:
+        raise ValueError("Barcode sequence exhausted")
+    return body + gtin_check_digit(body)
+
+class BarcodeAllocator:
+    """
+    Hands out barcodes from Product_Barcode_Seq. Single codes come from a
+    block kept in memory; reserve(n) takes a fresh range of n in one call.
+    Sequence ranges are not transactional, so a rolled-back insert can
+    never cause the same code to be handed out twice.
+    """
+
+    def __init__(self, block_size=BARCODE_BLOCK_SIZE):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0   # exclusive
+
+    def _reserve_range(self, cursor, count):
+        cursor.execute(_RESERVE_RANGE_SQL, (count,))
+        return int(cursor.fetchone()[0])
+
+    def _taken(self, cursor, codes):
+        cursor.execute(_TAKEN_SQL, (json.dumps(codes),))
+        return {row[0].strip() for row in cursor.fetchall()}
+
+    def _draw(self, cursor):
+        with self._lock:
+            if self._next >= self._end:
+                self._next = self._reserve_range(cursor, self.block_size)
+                self._end = self._next + self.block_size
+            value = self._next
+            self._next += 1
+        return make_gtin(value)
+
+    def allocate(self, cursor):
+        """Return one unused barcode."""
+        while True:
+            code = self._draw(cursor)
+            if not self._taken(cursor, [code]):
+                return code
+
+    def reserve(self, cursor, count, exclude=()):
+        """
+        Return `count` unused barcodes; one round-trip for the range, one to
+        check it. Codes in `exclude` (e.g. ones an import is about to add)
+        are skipped as well.
+        """
+        codes = []
+        while len(codes) < count:
+            need = count - len(codes)
+            first = self._reserve_range(cursor, need)
+            drawn = [make_gtin(v) for v in range(first, first + need)]
+            taken = self._taken(cursor, drawn)
+            taken.update(code for code in drawn if code in exclude)
+            codes.extend(code for code in drawn if code not in taken)
+        return codes
+
+barcode_allocator = BarcodeAllocator()
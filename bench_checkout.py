@@ -0,0 +1,170 @@
+"""
+Checkout throughput benchmark.
+
+Drives the Flask app in-process with concurrent simulated shoppers against
+the SQLite stand-in in sql_standin.py. Each shopper loads the storefront,
+fills a bag through /api/bag and checks it out through /checkout.
+
+    python bench_checkout.py --shoppers 16 --orders 50 --items 8
+
+Reports p50/p95/p99 latency per endpoint, throughput, and lock conflicts.
+Numbers are only comparable between runs on the same machine; the stand-in
+has a single writer lock, so treat lock counts as relative, not absolute.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from collections import defaultdict
+
+import sql_standin
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+def seed(path, products, customers, stock, rng):
+    conn = sql_standin.create_schema(path)
+    conn.executemany("INSERT INTO Department (DepartmentID, Name) VALUES (?, ?)",
+                     [(d, f"Department {d}") for d in range(1, 9)])
+    conn.executemany("INSERT INTO Customer (CustomerID, Name, Email, Username, Password) VALUES (?, ?, ?, ?, ?)",
+                     [(c, f"Shopper {c}", f"shopper{c}@example.com", f"shopper{c}", "x")
+                      for c in range(1, customers + 1)])
+    conn.executemany("""
+        INSERT INTO Product (ProductID, Name, Description, Price, Barcode, DepartmentID,
+                             QuantityInStock, OnSale, IsActive)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 0, 1)
+    """, [(p, f"Product {p}", "", round(rng.uniform(0.5, 40), 2), f"{p:012d}",
+           p % 8 + 1, stock) for p in range(1, products + 1)])
+    conn.commit()
+    conn.close()
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, name, seconds, status):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            self.statuses[name][status] += 1
+
+def shopper(app, customer_id, args, recorder, rng, start_gate):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s['user_id'] = customer_id
+        s['role'] = 'customer'
+
+    def timed(name, method, url, **kwargs):
+        t0 = time.perf_counter()
+        resp = getattr(client, method)(url, **kwargs)
+        recorder.record(name, time.perf_counter() - t0, resp.status_code)
+        return resp
+
+    # Hot set: a small slice of the catalog every shopper keeps buying,
+    # which is where lanes contend for the same rows
+    hot = max(1, int(args.products * args.hot_fraction))
+    start_gate.wait()
+    for _ in range(args.orders):
+        if args.browse:
+            timed('home', 'get', '/')
+        for _ in range(args.items):
+            if rng.random() < args.hot_share:
+                pid = rng.randint(1, hot)
+            else:
+                pid = rng.randint(1, args.products)
+            timed('add_to_bag', 'post', '/api/bag', json={'product_id': pid, 'quantity': rng.randint(1, 3)})
+        timed('checkout', 'post', '/checkout', json={})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--shoppers', type=int, default=8, help='concurrent simulated shoppers')
+    parser.add_argument('--orders', type=int, default=25, help='checkouts per shopper')
+    parser.add_argument('--items', type=int, default=8, help='bag adds per order')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--stock', type=int, default=1000000, help='starting stock per product')
+    parser.add_argument('--hot-fraction', type=float, default=0.01, help='share of the catalog that is "hot"')
+    parser.add_argument('--hot-share', type=float, default=0.5, help='share of bag adds that hit the hot set')
+    parser.add_argument('--no-browse', dest='browse', action='store_false', help='skip the storefront GET')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--db', help='SQLite file to use (default: a temporary file)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    tmpdir = None
+    path = args.db
+    if path is None:
+        tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(tmpdir.name, 'bench.db')
+    seed(path, args.products, args.shoppers, args.stock, rng)
+
+    # The app reads its settings at import time: route pyodbc to the
+    # stand-in and size the pool so every shopper can hold a connection
+    sql_standin.configure(path)
+    sys.modules['pyodbc'] = sql_standin
+    for key in ('DB_HOST', 'DB_USER', 'DB_PASSWORD', 'DB_NAME'):
+        os.environ.setdefault(key, 'bench')
+    os.environ.setdefault('DB_POOL_MAX_SIZE', str(args.shoppers + 2))
+    from app import app
+
+    recorder = Recorder()
+    start_gate = threading.Barrier(args.shoppers + 1)
+    threads = [threading.Thread(target=shopper,
+                                args=(app, c, args, recorder, random.Random(args.seed * 1000 + c), start_gate))
+               for c in range(1, args.shoppers + 1)]
+    for t in threads:
+        t.start()
+    sql_standin.reset_stats()
+    start_gate.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    report = {
+        "shoppers": args.shoppers,
+        "elapsed_seconds": round(elapsed, 3),
+        "endpoints": {},
+        "db": sql_standin.stats(),
+    }
+    total = 0
+    for name, values in recorder.latencies.items():
+        values.sort()
+        total += len(values)
+        report["endpoints"][name] = {
+            "count": len(values),
+            "per_second": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "status": dict(recorder.statuses[name]),
+        }
+    report["requests_per_second"] = round(total / elapsed, 1)
+    report["db"]["lock_wait_seconds"] = round(report["db"]["lock_wait_seconds"], 3)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"\n{args.shoppers} shoppers, {elapsed:.2f}s, {report['requests_per_second']} req/s")
+        print(f"{'endpoint':<12} {'count':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  status")
+        for name, e in report["endpoints"].items():
+            print(f"{name:<12} {e['count']:>7} {e['per_second']:>8} {e['p50_ms']:>8} {e['p95_ms']:>8} "
+                  f"{e['p99_ms']:>8} {e['max_ms']:>8}  {e['status']}")
+        db = report["db"]
+        print(f"lock conflicts: {db['lock_conflicts']}  lock wait: {db['lock_wait_seconds']}s  "
+              f"statements: {db['statements']}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+if __name__ == '__main__':
+    main()
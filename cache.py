@@ -0,0 +1,62 @@
+import time
+import threading
+from collections import OrderedDict
+
+# -----------------------------
+# In-process cache
+# -----------------------------
+
+class TTLCache:
+    """
+    Thread-safe in-process key/value cache.
+    Entries expire after `ttl` seconds; once `max_entries` is reached the
+    least recently used entry is evicted.
+    """
+
+    def __init__(self, ttl, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()   # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def incr(self, key, delta):
+        """Adjust a cached number in place. Does nothing if the key is not cached."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                return None
+            value = entry[0] + delta
+            self._data[key] = (value, entry[1])
+            return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,216 @@
+import os
+import json
+import time
+import base64
+import bisect
+import itertools
+import threading
+from datetime import datetime, date
+from db import with_db
+
+# -----------------------------
+# Storefront catalog snapshot
+# -----------------------------
+
+# Safety net: rebuild at least this often even if nothing bumped the version
+# (covers edits made by other processes and stock moved by checkouts).
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 600))
+
+class FrozenDict(dict):
+    """A dict that refuses mutation, so a shared snapshot row can't be edited in place."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("catalog snapshot rows are read-only")
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+def effective_price(product):
+    return float(product.get('SalePrice') or product['Price'])
+
+# Keyset sort orders: each key ends with ProductID so it is unique and stable
+PRODUCT_SORTS = {
+    'name': lambda p: ((p['Name'] or '').lower(), p['ProductID']),
+    'price_asc': lambda p: (effective_price(p), p['ProductID']),
+    'price_desc': lambda p: (-effective_price(p), p['ProductID']),
+    'newest': lambda p: (-p['ProductID'],),
+}
+
+_build_ids = itertools.count(1)
+
+class CatalogSnapshot:
+    """Immutable view of the active catalog, with sale prices already applied."""
+
+    def __init__(self, version, products, departments, sale_info, valid_until):
+        self.version = version
+        self.build_id = next(_build_ids)   # changes on every rebuild; used for ETags
+        self.products = tuple(FrozenDict(p) for p in products)
+        self.departments = tuple(FrozenDict(d) for d in departments)
+        self.sale_info = FrozenDict(sale_info) if sale_info else None
+        self.valid_until = valid_until   # time.monotonic() deadline
+
+        self.by_id = {p['ProductID']: p for p in self.products}
+        self.by_barcode = {p['Barcode'].strip(): p for p in self.products if p.get('Barcode')}
+        self.department_names = {d['DepartmentID']: d['Name'] for d in self.departments}
+        by_department = {}
+        for p in self.products:
+            by_department.setdefault(p['DepartmentID'], []).append(p)
+        self.products_by_department = {k: tuple(v) for k, v in by_department.items()}
+
+        self._sorted = {}
+
+    def is_fresh(self, version):
+        return self.version == version and time.monotonic() < self.valid_until
+
+    def sorted_by(self, sort):
+        """Return (keys, products) for a PRODUCT_SORTS order, computed once per snapshot."""
+        ordered = self._sorted.get(sort)
+        if ordered is None:
+            key = PRODUCT_SORTS[sort]
+            products = sorted(self.products, key=key)
+            ordered = self._sorted[sort] = ([key(p) for p in products], products)
+        return ordered
+
+    def page(self, sort, after=None, limit=50, predicate=None):
+        """
+        Keyset pagination: return up to `limit` products that sort after the
+        key `after`, plus the key to resume from (None on the last page).
+        """
+        keys, products = self.sorted_by(sort)
+        start = bisect.bisect_right(keys, tuple(after)) if after else 0
+        items = []
+        last = None
+        for i in range(start, len(products)):
+            p = products[i]
+            if predicate is None or predicate(p):
+                if len(items) == limit:
+                    return items, keys[last]
+                items.append(p)
+                last = i
+        return items, None
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """Inverse of encode_cursor. Raises ValueError on a malformed token."""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or not key:
+        raise ValueError("Invalid cursor")
+    return key
+
+class CatalogUnavailable(RuntimeError):
+    """No snapshot has been built yet and the database could not provide one."""
+
+_version = 0
+_snapshot = None
+_lock = threading.Lock()           # guards _version only; never held across a query
+_rebuild_lock = threading.Lock()   # one rebuild at a time; writers never wait on it
+
+def catalog_version():
+    return _version
+
+def bump_catalog_version():
+    """Mark the snapshot stale; the next get_catalog() call rebuilds it."""
+    global _version
+    with _lock:
+        _version += 1
+
+def get_catalog():
+    """Return the current catalog snapshot, rebuilding it if it is stale."""
+    global _snapshot
+    snap = _snapshot
+    if snap is not None and snap.is_fresh(_version):
+        return snap
+
+    with _rebuild_lock:
+        snap = _snapshot
+        version = _version
+        if snap is not None and snap.is_fresh(version):
+            return snap
+        fresh = _rebuild(version)
+        if isinstance(fresh, CatalogSnapshot):
+            _snapshot = fresh
+            return fresh
+
+    # with_db returned an error response: keep serving the old snapshot if we have one
+    if snap is None:
+        raise CatalogUnavailable("Catalog is unavailable")
+    print("Catalog rebuild failed; serving the previous snapshot", flush=True)
+    return snap
+
+@with_db
+def _rebuild(cursor, conn, version):
+    return _build_snapshot(cursor, version)
+
+def _seconds_until(boundary, now):
+    # Sale dates are DATE columns compared against GETDATE(), so a boundary
+    # falls at midnight of that day in database time.
+    if isinstance(boundary, date) and not isinstance(boundary, datetime):
+        boundary = datetime(boundary.year, boundary.month, boundary.day)
+    return (boundary - now).total_seconds()
+
+def _build_snapshot(cursor, version):
+    cursor.execute("""
+        SELECT ProductID, Name, Description, Price, QuantityInStock, DepartmentID, ImageURL, OnSale, Barcode
+        FROM Product
+        WHERE IsActive = 1
+    """)
+    columns = [col[0] for col in cursor.description]
+    products = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # Fetch active holiday sale
+    cursor.execute("""
+        SELECT SaleID, SaleName, StartDate, EndDate, DiscountPercent, DepartmentID, IsActive
+        FROM Holiday_Sales
+        WHERE IsActive = 1
+        AND GETDATE() BETWEEN StartDate AND EndDate
+    """)
+    holiday_sale = cursor.fetchone()
+
+    sale_info = None
+    if holiday_sale:
+        sale_info = {
+            'SaleID': holiday_sale[0],
+            'SaleName': holiday_sale[1],
+            'StartDate': holiday_sale[2],
+            'EndDate': holiday_sale[3],
+            'DiscountPercent': holiday_sale[4],
+            'DepartmentID': holiday_sale[5],
+            'IsActive': holiday_sale[6]
+        }
+
+        # Calculate sale prices for products marked OnSale
+        # If DepartmentID is set, only apply to that department
+        discount = float(sale_info['DiscountPercent'])
+        for product in products:
+            if product.get('OnSale'):
+                if sale_info['DepartmentID'] is None or product['DepartmentID'] == sale_info['DepartmentID']:
+                    original_price = float(product['Price'])
+                    sale_price = original_price * (1 - discount / 100)
+                    product['SalePrice'] = round(sale_price, 2)
+                    product['OriginalPrice'] = original_price
+                    product['Savings'] = round(original_price - sale_price, 2)
+
+    cursor.execute("SELECT DepartmentID,Name FROM Department")
+    columns = [col[0] for col in cursor.description]
+    departments = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    # Expire the snapshot at the next sale-window boundary (current sale
+    # ending or the next one starting), measured on the database clock.
+    cursor.execute("""
+        SELECT GETDATE(),
+               (SELECT MIN(StartDate) FROM Holiday_Sales
+                WHERE IsActive = 1 AND StartDate > GETDATE())
+    """)
+    db_now, next_start = cursor.fetchone()
+
+    ttl = CATALOG_MAX_AGE
+    for boundary in (sale_info['EndDate'] if sale_info else None, next_start):
+        if boundary is not None:
+            ttl = min(ttl, max(_seconds_until(boundary, db_now), 1))
+
+    return CatalogSnapshot(version, products, departments, sale_info, time.monotonic() + ttl)
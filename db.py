@@ -1,9 +1,17 @@
 import os
 import sys
+import time
+import atexit
 import pyodbc
+import threading
 import traceback
-from functools import wraps
-from flask import jsonify
+from decimal import Decimal
+from datetime import datetime, date
+from collections import deque, namedtuple
+from functools import wraps, lru_cache
+from collections.abc import Mapping
+from flask import jsonify, g, has_app_context
+from flask.json.provider import DefaultJSONProvider
 
 # Database credentials
 DB_HOST = os.environ.get('DB_HOST')
@@ -14,29 +22,43 @@ DB_NAME = os.environ.get('DB_NAME')
 if not all([DB_HOST, DB_USER, DB_PASSWORD, DB_NAME]):
     raise RuntimeError("Database credentials are not fully set in environment variables.")
 
+# Connection pool tuning
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 15))       # seconds to wait for a free connection
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))    # seconds before an idle connection is closed
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', 30)) # idle seconds before checkout runs a health check
+
+# Rows per fetchmany() call when iterating a result
+DB_FETCH_SIZE = int(os.environ.get('DB_FETCH_SIZE', 500))
+
 # -----------------------------
 # Database connection
 # -----------------------------
 
-def get_db_connection():
-    # List of ODBC drivers to try, in order of preference
-    drivers = [
-        'ODBC Driver 18 for SQL Server',
-        'ODBC Driver 17 for SQL Server',
-        'ODBC Driver 13 for SQL Server',
-        'ODBC Driver 11 for SQL Server',
-        'FreeTDS',
-    ]
-
-    # Get available drivers
+# ODBC drivers to try, in order of preference
+PREFERRED_DRIVERS = [
+    'ODBC Driver 18 for SQL Server',
+    'ODBC Driver 17 for SQL Server',
+    'ODBC Driver 13 for SQL Server',
+    'ODBC Driver 11 for SQL Server',
+    'FreeTDS',
+]
+
+DB_CONNECT_TIMEOUT = int(os.environ.get('DB_CONNECT_TIMEOUT', 30))  # login timeout, seconds
+DB_QUERY_TIMEOUT = int(os.environ.get('DB_QUERY_TIMEOUT', 0))       # per-statement timeout, 0 = none
+
+ConnectionProfile = namedtuple('ConnectionProfile', ['driver', 'conn_str', 'connect_timeout', 'query_timeout'])
+
+_profile = None
+_profile_lock = threading.Lock()
+
+def resolve_connection_profile():
+    """Probe the installed ODBC drivers and build the connection string. Returns None if no driver fits."""
     available_drivers = pyodbc.drivers()
-    print(f"Available ODBC drivers: {available_drivers}", flush=True)
-    sys.stderr.write(f"Available ODBC drivers: {available_drivers}\n")
-    sys.stderr.flush()
 
-    # Find the first available driver from our preferred list
     driver_to_use = None
-    for driver in drivers:
+    for driver in PREFERRED_DRIVERS:
         if driver in available_drivers:
             driver_to_use = driver
             break
@@ -48,26 +70,48 @@ def get_db_connection():
         sys.stderr.flush()
         return None
 
-    try:
-        msg = f"Connecting to DB at {DB_HOST} as {DB_USER}, database {DB_NAME} using driver: {driver_to_use}"
-        print(msg, flush=True)
-        sys.stderr.write(msg + "\n")
-        sys.stderr.flush()
+    msg = f"Using DB at {DB_HOST} as {DB_USER}, database {DB_NAME} with driver: {driver_to_use}"
+    print(msg, flush=True)
+    sys.stderr.write(msg + "\n")
+    sys.stderr.flush()
 
-        conn_str = (
-            f"Driver={{{driver_to_use}}};"
-            f"Server=tcp:{DB_HOST},1433;"
-            f"Database={DB_NAME};"
-            f"Uid={DB_USER};"
-            f"Pwd={DB_PASSWORD};"
-            "Encrypt=yes;"
-            "TrustServerCertificate=yes;"
-            "Connection Timeout=30;"
-        )
-        conn = pyodbc.connect(conn_str)
-        print("Connection successful!", flush=True)
-        sys.stderr.write("Connection successful!\n")
-        sys.stderr.flush()
+    conn_str = (
+        f"Driver={{{driver_to_use}}};"
+        f"Server=tcp:{DB_HOST},1433;"
+        f"Database={DB_NAME};"
+        f"Uid={DB_USER};"
+        f"Pwd={DB_PASSWORD};"
+        "Encrypt=yes;"
+        "TrustServerCertificate=yes;"
+        f"Connection Timeout={DB_CONNECT_TIMEOUT};"
+    )
+    return ConnectionProfile(driver_to_use, conn_str, DB_CONNECT_TIMEOUT, DB_QUERY_TIMEOUT)
+
+def get_connection_profile():
+    """Return the cached connection profile, resolving it on first use."""
+    global _profile
+    if _profile is None:
+        with _profile_lock:
+            if _profile is None:
+                _profile = resolve_connection_profile()
+    return _profile
+
+def refresh_connection_profile():
+    """Re-probe the ODBC drivers, e.g. after a driver install or upgrade."""
+    global _profile
+    with _profile_lock:
+        _profile = resolve_connection_profile()
+    return _profile
+
+def get_db_connection():
+    profile = get_connection_profile()
+    if profile is None:
+        return None
+
+    try:
+        conn = pyodbc.connect(profile.conn_str)
+        if profile.query_timeout:
+            conn.timeout = profile.query_timeout
         return conn
     except Exception as e:
         msg = f"ERROR: Failed to connect to SQL Server - {type(e).__name__}: {str(e)}"
@@ -77,24 +121,436 @@ def get_db_connection():
         sys.stderr.flush()
         return None
 
+# -----------------------------
+# Connection pool
+# -----------------------------
+
+_NEW_SLOT = object()
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of database connections.
+    Connections are handed out most-recently-used first, health checked on
+    checkout when they have been idle for a while, and closed once they sit
+    unused longer than max_idle (never shrinking below min_size).
+    """
+
+    def __init__(self, connect, max_size=DB_POOL_MAX_SIZE, min_size=DB_POOL_MIN_SIZE,
+                 timeout=DB_POOL_TIMEOUT, max_idle=DB_POOL_MAX_IDLE, ping_after=DB_POOL_PING_AFTER):
+        self.connect = connect
+        self.max_size = max(1, max_size)
+        self.min_size = max(0, min(min_size, self.max_size))
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._idle = deque()   # (conn, last_used); oldest on the left
+        self._size = 0         # open connections, idle or checked out
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """Borrow a connection, opening one if the pool has room. Returns None on failure."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            checked_out = self._checkout(deadline)
+            if checked_out is None:
+                return None
+            if checked_out is _NEW_SLOT:
+                conn = self.connect()
+                if conn is None:
+                    self._forget()
+                return conn
+
+            conn, last_used = checked_out
+            if time.monotonic() - last_used < self.ping_after or self._is_healthy(conn):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """Return a borrowed connection, rolling back anything left uncommitted."""
+        try:
+            conn.rollback()
+            conn.autocommit = False
+        except Exception as e:
+            sys.stderr.write(f"Discarding pooled connection after failed reset: {e}\n")
+            sys.stderr.flush()
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def warm_up(self):
+        """Open connections until min_size are idle. Returns how many were opened."""
+        opened = 0
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    break
+                self._size += 1
+            conn = self.connect()
+            if conn is None:
+                self._forget()
+                break
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+            opened += 1
+        return opened
+
+    def close_all(self):
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        with self._cond:
+            return {"size": self._size, "idle": len(self._idle), "max_size": self.max_size}
+
+    def _checkout(self, deadline):
+        # Returns an idle (conn, last_used) pair, _NEW_SLOT when the caller may
+        # open a new connection, or None when the wait timed out.
+        expired = []
+        try:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    while (self._idle and self._size > self.min_size
+                           and now - self._idle[0][1] > self.max_idle):
+                        expired.append(self._idle.popleft()[0])
+                        self._size -= 1
+
+                    if self._idle:
+                        return self._idle.pop()
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return _NEW_SLOT
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        sys.stderr.write("ERROR: Timed out waiting for a pooled database connection\n")
+                        sys.stderr.flush()
+                        return None
+                    self._cond.wait(remaining)
+        finally:
+            for conn in expired:
+                self._close(conn)
+
+    def _is_healthy(self, conn):
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            return True
+        except Exception:
+            return False
+        finally:
+            if cursor:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def _discard(self, conn):
+        self._close(conn)
+        self._forget()
+
+    def _forget(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+pool = ConnectionPool(get_db_connection)
+atexit.register(pool.close_all)
+
+def warm_pool():
+    """Pre-open the minimum number of pooled connections at process start."""
+    try:
+        opened = pool.warm_up()
+        print(f"Database pool warmed with {opened} connection(s)", flush=True)
+    except Exception as e:
+        sys.stderr.write(f"Database pool warm-up failed: {e}\n")
+        sys.stderr.flush()
+
+# -----------------------------
+# Result rows
+# -----------------------------
+
+@lru_cache(maxsize=1024)
+def _column_map(names):
+    return {name: i for i, name in enumerate(names)}
+
+def column_map(description):
+    """Column name -> index for a cursor description, shared by every result of the same shape."""
+    return _column_map(tuple(col[0] for col in description))
+
+class RowView(Mapping):
+    """
+    Read-only view over a pyodbc Row: row['Name'] and row.Name both index the
+    underlying tuple, so no per-row dict is built. Use to_dict() for a copy
+    that can be modified.
+    """
+
+    __slots__ = ('_row', '_columns')
+
+    def __init__(self, row, columns):
+        self._row = row
+        self._columns = columns
+
+    def __getitem__(self, key):
+        return self._row[self._columns[key]]
+
+    def __getattr__(self, name):
+        try:
+            return self._row[self._columns[name]]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __repr__(self):
+        return f"RowView({self.to_dict()!r})"
+
+    def to_dict(self):
+        return dict(zip(self._columns, self._row))
+
+def iter_batches(cursor, batch_size=None):
+    """Yield the rows of an executed cursor as lists of up to batch_size (DB_FETCH_SIZE) rows."""
+    batch_size = batch_size or DB_FETCH_SIZE
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+def iter_rows(cursor, batch_size=None):
+    """Yield a RowView per row of an executed cursor, fetching batch_size rows at a time."""
+    columns = column_map(cursor.description)
+    for rows in iter_batches(cursor, batch_size):
+        for row in rows:
+            yield RowView(row, columns)
+
+class RowJSONProvider(DefaultJSONProvider):
+    """Serializes RowViews the same way as the dicts they replace."""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, RowView):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+def fetch_rows(cursor):
+    """All rows of an executed cursor as RowViews."""
+    columns = column_map(cursor.description)
+    return [RowView(row, columns) for row in cursor.fetchall()]
+
+def fetch_row(cursor):
+    """The next row as a RowView, or None."""
+    row = cursor.fetchone()
+    return RowView(row, column_map(cursor.description)) if row is not None else None
+
 def rows_to_dict_list(cursor):
+    """All rows as plain dicts; prefer fetch_rows/iter_rows unless the rows get modified."""
     columns = [col[0] for col in cursor.description]
     return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
+# Per-type conversions for the columnar format, picked once per column from
+# cursor.description rather than checked on every value
+_COLUMNAR_CONVERTERS = {
+    Decimal: float,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+}
+
+def rows_to_columnar(description, rows, orient='rows'):
+    """
+    Build {"columns": [...], "data": [...]} straight from a cursor description
+    and its row tuples, without a dict per row. orient='rows' gives one array
+    per row, orient='columns' one array per column.
+    """
+    columns = [col[0] for col in description]
+    converters = [_COLUMNAR_CONVERTERS.get(col[1]) for col in description]
+    if orient == 'columns':
+        data = [list(values) for values in zip(*rows)] if rows else [[] for _ in columns]
+        for i, convert in enumerate(converters):
+            if convert is not None:
+                data[i] = [None if v is None else convert(v) for v in data[i]]
+    else:
+        if any(converters):
+            data = [[v if v is None or convert is None else convert(v)
+                     for v, convert in zip(row, converters)] for row in rows]
+        else:
+            data = [list(row) for row in rows]
+    return {"columns": columns, "data": data}
+
+# -----------------------------
+# Request-scoped connection
+# -----------------------------
+
+# Callbacks run as fn(seconds, executed, sql, rows, error) after every
+# execute/fetch call on a with_db cursor. `executed` is True for
+# execute/executemany, `sql` is the text of the statement the call belongs to
+# (the last one executed), `rows` is the number of rows fetched, or affected
+# for DML, and `error` is True if the call raised. See metrics.py and
+# statements.py.
+_query_observers = []
+
+def add_query_observer(fn):
+    _query_observers.append(fn)
+
+# Rows per fetchmany() when a timed cursor is iterated directly
+TIMED_ITER_BATCH = 100
+
+def _result_rows(result, cursor):
+    if isinstance(result, list):
+        return len(result)
+    if result is cursor:
+        return max(cursor.rowcount, 0)   # affected rows for DML, -1 for SELECT
+    if isinstance(result, bool):          # nextset()
+        return 0
+    return int(result is not None)
+
+class TimedCursor:
+    """Cursor proxy that reports the time and rows of each database call to the query observers."""
+
+    __slots__ = ('_cursor', '_sql')
+
+    def __init__(self, cursor):
+        object.__setattr__(self, '_cursor', cursor)
+        object.__setattr__(self, '_sql', None)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+    def __iter__(self):
+        # Iterate in batches so rows read with `for row in cursor` are timed too
+        while True:
+            rows = self.fetchmany(TIMED_ITER_BATCH)
+            if not rows:
+                return
+            yield from rows
+
+    def _timed(self, method, executed, args):
+        if executed and args:
+            object.__setattr__(self, '_sql', args[0])
+        start = time.perf_counter()
+        rows = 0
+        error = True
+        try:
+            result = getattr(self._cursor, method)(*args)
+            rows = _result_rows(result, self._cursor)
+            error = False
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            for fn in _query_observers:
+                fn(elapsed, executed, self._sql, rows, error)
+
+    def execute(self, *args):
+        result = self._timed('execute', True, args)
+        return self if result is self._cursor else result
+
+    def executemany(self, *args):
+        return self._timed('executemany', True, args)
+
+    def fetchone(self):
+        return self._timed('fetchone', False, ())
+
+    def fetchmany(self, *args):
+        return self._timed('fetchmany', False, args)
+
+    def fetchall(self):
+        return self._timed('fetchall', False, ())
+
+    def nextset(self):
+        return self._timed('nextset', False, ())
+
+def _observed(cursor):
+    return TimedCursor(cursor) if _query_observers else cursor
+
+def get_request_db():
+    """
+    Return the (conn, cursor) pair shared by every with_db call in the current
+    request, borrowing it from the pool on first use. Returns None if the pool
+    could not hand out a connection.
+    """
+    db = g.get('_db')
+    if db is None:
+        conn = pool.acquire()
+        if conn is None:
+            return None
+        cursor = _observed(conn.cursor())
+        db = g._db = (conn, cursor)
+    return db
+
+def release_request_db(exc=None):
+    """Teardown hook: give the request's connection back to the pool."""
+    db = g.pop('_db', None)
+    if db is None:
+        return
+    conn, cursor = db
+    try:
+        cursor.close()
+    except Exception:
+        pass
+    pool.release(conn)
+
+def init_app(app):
+    app.json = RowJSONProvider(app)
+    app.teardown_appcontext(release_request_db)
+
+def _db_failure(message, shared):
+    # Routes get a JSON error response; outside an app context (CLI scripts,
+    # worker threads) jsonify is unavailable, so callers get None instead
+    if shared:
+        return jsonify({"message": message}), 500
+    return None
+
 def with_db(f):
+    """
+    Call f(cursor, conn, *args). On a database failure, returns a
+    (JSON response, 500) pair inside an app context and None outside one.
+    """
     @wraps(f)
     def decorated(*args, **kwargs):
+        # Inside a request every decorated function (routes, context processors,
+        # nested helpers) shares one connection; it is released on teardown.
+        shared = has_app_context()
         conn = None
         cursor = None
         try:
-            conn = get_db_connection()
+            if shared:
+                db = get_request_db()
+                if db is not None:
+                    conn, cursor = db
+            else:
+                conn = pool.acquire()
+                if conn is not None:
+                    cursor = _observed(conn.cursor())
             if conn is None:
                 msg = "ERROR: Failed to establish database connection"
                 print(msg, flush=True)
                 sys.stderr.write(msg + "\n")
                 sys.stderr.flush()
-                return jsonify({"message": "Database connection failed"}), 500
-            cursor = conn.cursor()
+                return _db_failure("Database connection failed", shared)
             return f(cursor, conn, *args, **kwargs)
         except Exception as e:
             msg = f"DB error: {e}"
@@ -102,10 +558,16 @@ def with_db(f):
             sys.stderr.write(msg + "\n")
             traceback.print_exc(file=sys.stderr)
             sys.stderr.flush()
-            return jsonify({"message": "Database error"}), 500
+            if shared and conn:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+            return _db_failure("Database error", shared)
         finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
+            if not shared:
+                if cursor:
+                    cursor.close()
+                if conn:
+                    pool.release(conn)
     return decorated
@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from db import with_db
+from catalog import bump_catalog_version
+from search import product_index
+
+# -----------------------------
+# Product image resolution
+# -----------------------------
+
+# Products are saved with the placeholder straight away; a worker thread
+# looks up a stock photo afterwards and swaps it in, so a slow image API
+# never holds up an admin request or its pooled connection.
+
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/400?text=Product+Image"
+
+# Get an access key from Unsplash and set it in your environment; without
+# one, products simply keep the placeholder image
+UNSPLASH_ACCESS_KEY = os.environ.get('UNSPLASH_ACCESS_KEY', '')
+UNSPLASH_API_URL = os.environ.get('UNSPLASH_API_URL', "https://api.unsplash.com/photos/random")
+IMAGE_FETCH_TIMEOUT = float(os.environ.get('IMAGE_FETCH_TIMEOUT', 5))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+# name -> URL cache file; found images are kept until the file is removed
+IMAGE_CACHE_PATH = os.environ.get('IMAGE_CACHE_PATH',
+                                  os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_cache.json'))
+# After a failed lookup, don't ask the API about that name again for this long
+IMAGE_NEGATIVE_TTL = int(os.environ.get('IMAGE_NEGATIVE_TTL', 3600))
+
+class ImageCache:
+    """
+    Persistent product name -> image URL map, stored as JSON.
+    Failures are cached too (URL None) and expire after IMAGE_NEGATIVE_TTL.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None   # key -> {"url": str | None, "at": epoch seconds}
+
+    @staticmethod
+    def key(name):
+        return " ".join((name or "").lower().split())
+
+    def _load(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as fh:
+                    self._entries = json.load(fh)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w') as fh:
+                json.dump(self._entries, fh)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print("Could not save image cache:", e, flush=True)
+
+    def lookup(self, name):
+        """Return (hit, url): url is None for a cached failure that has not expired."""
+        with self._lock:
+            entry = self._load().get(self.key(name))
+        if entry is None:
+            return False, None
+        if entry["url"] is None and time.time() - entry["at"] > IMAGE_NEGATIVE_TTL:
+            return False, None
+        return True, entry["url"]
+
+    def store(self, name, url):
+        with self._lock:
+            self._load()[self.key(name)] = {"url": url, "at": time.time()}
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+image_cache = ImageCache(IMAGE_CACHE_PATH)
+
+def fetch_stock_image(product_name):
+    """Ask Unsplash for a photo matching the product name. Returns a URL or None."""
+    if not UNSPLASH_ACCESS_KEY:
+        return None
+    try:
+        response = requests.get(
+            UNSPLASH_API_URL,
+            params={
+                "query": product_name,
+                "orientation": "squarish",
+                "client_id": UNSPLASH_ACCESS_KEY
+            },
+            timeout=IMAGE_FETCH_TIMEOUT
+        )
+        response.raise_for_status()
+        # return the regular-sized image URL
+        return response.json().get("urls", {}).get("regular")
+    except Exception as e:
+        print("Error fetching image:", e, flush=True)
+        return None
+
+def resolve_image(product_name):
+    """Cached lookup of a stock image URL; None if there isn't one (yet)."""
+    hit, url = image_cache.lookup(product_name)
+    if hit:
+        return url
+    url = fetch_stock_image(product_name)
+    image_cache.store(product_name, url)
+    return url
+
+def cached_image(product_name):
+    """The cached URL for this name, without calling the API; None on a miss."""
+    return image_cache.lookup(product_name)[1]
+
+_executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS, thread_name_prefix='product-image')
+
+@with_db
+def _apply_image(cursor, conn, product_id, url):
+    # Only replace the placeholder: an image set by hand in the meantime wins
+    cursor.execute("UPDATE Product SET ImageURL = ? WHERE ProductID = ? AND ImageURL = ?",
+                   (url, product_id, PLACEHOLDER_IMAGE_URL))
+    updated = cursor.rowcount
+    conn.commit()
+    if updated:
+        bump_catalog_version()
+        product_index.refresh(cursor, product_id)
+    return updated
+
+def _resolve_job(product_id, product_name):
+    try:
+        url = resolve_image(product_name)
+        if url:
+            _apply_image(product_id, url)
+    except Exception as e:
+        print(f"Image resolution failed for product {product_id}: {e}", flush=True)
+
+def schedule_image(product_id, product_name):
+    """Queue a background lookup for a product saved with the placeholder image."""
+    return _executor.submit(_resolve_job, product_id, product_name)
@@ -0,0 +1,389 @@
+import io
+import os
+import csv
+import sys
+import json
+import argparse
+import pyodbc
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from db import with_db
+from barcodes import barcode_allocator
+from catalog import bump_catalog_version, CATALOG_MAX_AGE
+from search import product_index, SEARCH_INDEX_MAX_AGE
+from images import PLACEHOLDER_IMAGE_URL
+
+# -----------------------------
+# Bulk product import
+# -----------------------------
+
+# Rows are read one at a time from CSV (with a header row) or JSON Lines,
+# validated, and applied IMPORT_CHUNK_SIZE at a time: the chunk is loaded
+# into a #ProductImport staging table with fast_executemany, then Product
+# and Inventory are updated and inserted with set-based statements, so the
+# Product/Inventory triggers fire once per chunk rather than once per row.
+# Rows are matched to existing products by Barcode; rows without one are
+# new products and get a barcode from the allocator. Each chunk commits on
+# its own. If a chunk fails it is retried row by row so one bad row is
+# reported instead of sinking its neighbours. When run from the command
+# line, a running server is not notified: it shows the imported products
+# once its catalog snapshot and search index reach their maximum age.
+
+IMPORT_CHUNK_SIZE = int(os.environ.get('IMPORT_CHUNK_SIZE', 1000))
+# Per-row errors listed in the summary; the rest are only counted
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 500))
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+DEFAULT_REORDER_LEVEL = 10
+MAX_PRICE = Decimal('100000000')   # Product.Price is decimal(10, 2)
+
+_STAGE_COLUMNS = ("RowNo", "Barcode", "Name", "Description", "Price", "DepartmentID",
+                  "QuantityInStock", "ReorderLevel", "ImageURL", "IsActive")
+
+_CREATE_STAGE_SQL = """
+    IF OBJECT_ID('tempdb..#ProductImport') IS NOT NULL DROP TABLE #ProductImport;
+    CREATE TABLE #ProductImport (
+        RowNo int NOT NULL PRIMARY KEY,
+        Barcode nvarchar(50) NOT NULL,
+        Name nvarchar(100) NOT NULL,
+        Description nvarchar(4000) NULL,
+        Price decimal(10, 2) NOT NULL,
+        DepartmentID int NOT NULL,
+        QuantityInStock int NULL,
+        ReorderLevel int NULL,
+        ImageURL nvarchar(500) NULL,
+        IsActive bit NULL,
+        ProductID int NULL
+    );
+"""
+
+_STAGE_INSERT_SQL = (f"INSERT INTO #ProductImport ({', '.join(_STAGE_COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(_STAGE_COLUMNS))})")
+
+# Blank optional fields keep the product's current value
+_APPLY_SQL = ("""
+    UPDATE s SET s.ProductID = p.ProductID
+    FROM #ProductImport s
+    JOIN Product p ON p.Barcode = s.Barcode
+""", """
+    UPDATE p
+    SET p.Name = s.Name,
+        p.Description = COALESCE(s.Description, p.Description),
+        p.Price = s.Price,
+        p.DepartmentID = s.DepartmentID,
+        p.QuantityInStock = COALESCE(s.QuantityInStock, p.QuantityInStock),
+        p.ImageURL = COALESCE(s.ImageURL, p.ImageURL),
+        p.IsActive = COALESCE(s.IsActive, p.IsActive)
+    FROM Product p
+    JOIN #ProductImport s ON s.ProductID = p.ProductID
+""", f"""
+    INSERT INTO Product (Name, Description, Price, DepartmentID, Barcode, QuantityInStock,
+                         SalePrice, OnSale, ImageURL, IsActive)
+    SELECT s.Name, COALESCE(s.Description, ''), s.Price, s.DepartmentID, s.Barcode,
+           COALESCE(s.QuantityInStock, 0), NULL, 0,
+           COALESCE(s.ImageURL, '{PLACEHOLDER_IMAGE_URL}'), COALESCE(s.IsActive, 1)
+    FROM #ProductImport s
+    WHERE s.ProductID IS NULL
+    ORDER BY s.RowNo
+""", """
+    INSERT INTO Inventory (ProductID, QuantityAvailable, ReorderLevel)
+    SELECT p.ProductID, p.QuantityInStock, COALESCE(s.ReorderLevel, ?)
+    FROM #ProductImport s
+    JOIN Product p ON p.Barcode = s.Barcode
+    WHERE NOT EXISTS (SELECT 1 FROM Inventory i WHERE i.ProductID = p.ProductID)
+""", """
+    UPDATE i
+    SET i.ReorderLevel = COALESCE(s.ReorderLevel, ?)
+    FROM Inventory i
+    JOIN Product p ON p.ProductID = i.ProductID
+    JOIN #ProductImport s ON s.Barcode = p.Barcode
+    WHERE s.ReorderLevel IS NOT NULL OR s.ProductID IS NULL
+""")
+
+class ImportRowError(ValueError):
+    pass
+
+# ---- parsing ----
+
+def parse_rows(stream, fmt):
+    """
+    Yield (row number, record) for each data row of a text stream. A record
+    is a dict, or an ImportRowError for a line that could not be parsed.
+    """
+    if fmt == 'csv':
+        for n, record in enumerate(csv.DictReader(stream), 1):
+            yield n, record
+    elif fmt == 'jsonl':
+        n = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            n += 1
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                record = ImportRowError(f"Invalid JSON: {e}")
+            else:
+                if not isinstance(record, dict):
+                    record = ImportRowError("Each line must be a JSON object")
+            yield n, record
+    else:
+        raise ValueError(f"Unknown import format '{fmt}'")
+
+def _field(record, name):
+    value = record.get(name)
+    if isinstance(value, str):
+        value = value.strip()
+    return None if value in (None, '') else value
+
+def _int_field(record, name, label):
+    value = _field(record, name)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ImportRowError(f"{label} must be a whole number")
+    if value < 0:
+        raise ImportRowError(f"{label} must not be negative")
+    return value
+
+def _bool_field(record, name):
+    value = _field(record, name)
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).lower()
+    if text in ('1', 'true', 'yes', 'y'):
+        return True
+    if text in ('0', 'false', 'no', 'n'):
+        return False
+    raise ImportRowError(f"{name} must be true or false")
+
+def validate_row(row_no, record, departments):
+    """
+    Check one parsed record and return its staging tuple (Barcode may be
+    None until one is allocated). Raises ImportRowError.
+    `departments` maps DepartmentID and lower-cased department name to the ID.
+    """
+    if isinstance(record, ImportRowError):
+        raise record
+    record = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+
+    name = _field(record, 'name')
+    if not name:
+        raise ImportRowError("Name is required")
+    name = str(name)
+    if len(name) > 100:
+        raise ImportRowError("Name is longer than 100 characters")
+
+    description = _field(record, 'description')
+    if description is not None and len(str(description)) > 4000:
+        raise ImportRowError("Description is longer than 4000 characters")
+
+    price = _field(record, 'price')
+    if price is None:
+        raise ImportRowError("Price is required")
+    try:
+        price = Decimal(str(price))
+        if not price.is_finite():
+            raise InvalidOperation
+    except InvalidOperation:
+        raise ImportRowError("Price must be a number")
+    if not 0 <= price < MAX_PRICE:
+        raise ImportRowError(f"Price must be between 0 and {MAX_PRICE}")
+    price = price.quantize(Decimal('0.01'))
+
+    department = _field(record, 'departmentid')
+    if department is None:
+        department = _field(record, 'department')
+        department_id = departments.get(str(department).lower()) if department is not None else None
+    else:
+        try:
+            department_id = departments.get(int(department))
+        except (TypeError, ValueError):
+            department_id = None
+    if department_id is None:
+        raise ImportRowError("DepartmentID (or Department name) must name an existing department")
+
+    barcode = _field(record, 'barcode')
+    if barcode is not None:
+        barcode = str(barcode)
+        if len(barcode) > 50:
+            raise ImportRowError("Barcode is longer than 50 characters")
+
+    image_url = _field(record, 'imageurl')
+    if image_url is not None and len(str(image_url)) > 500:
+        raise ImportRowError("ImageURL is longer than 500 characters")
+
+    return (row_no, barcode, name, None if description is None else str(description), price, department_id,
+            _int_field(record, 'quantityinstock', "QuantityInStock"),
+            _int_field(record, 'reorderlevel', "ReorderLevel"),
+            None if image_url is None else str(image_url),
+            _bool_field(record, 'isactive'))
+
+# ---- applying ----
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row_no, message):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({"row": row_no, "error": message})
+
+    def to_dict(self):
+        return {
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e["row"]),
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+def _stage_input_sizes():
+    # The driver can't describe parameters of a #temp table insert; without
+    # explicit sizes fast_executemany guesses from the first row
+    return [(pyodbc.SQL_INTEGER, 0, 0), (pyodbc.SQL_WVARCHAR, 50, 0), (pyodbc.SQL_WVARCHAR, 100, 0),
+            (pyodbc.SQL_WVARCHAR, 4000, 0), (pyodbc.SQL_DECIMAL, 10, 2), (pyodbc.SQL_INTEGER, 0, 0),
+            (pyodbc.SQL_INTEGER, 0, 0), (pyodbc.SQL_INTEGER, 0, 0), (pyodbc.SQL_WVARCHAR, 500, 0),
+            (pyodbc.SQL_BIT, 0, 0)]
+
+def _apply_chunk(cursor, conn, staged):
+    """Stage and apply rows in one transaction. Returns the RowNos that updated an existing product."""
+    cursor.execute("DELETE FROM #ProductImport")
+    cursor.fast_executemany = True
+    cursor.setinputsizes(_stage_input_sizes())
+    try:
+        cursor.executemany(_STAGE_INSERT_SQL, staged)
+    finally:
+        cursor.fast_executemany = False
+    match, update, insert, add_inventory, set_reorder = _APPLY_SQL
+    cursor.execute(match)
+    cursor.execute("SELECT RowNo FROM #ProductImport WHERE ProductID IS NOT NULL")
+    updated = {row[0] for row in cursor.fetchall()}
+    cursor.execute(update)
+    cursor.execute(insert)
+    cursor.execute(add_inventory, (DEFAULT_REORDER_LEVEL,))
+    cursor.execute(set_reorder, (DEFAULT_REORDER_LEVEL,))
+    conn.commit()
+    return updated
+
+def _apply(cursor, conn, staged, result):
+    try:
+        updated = _apply_chunk(cursor, conn, staged)
+    except Exception:
+        conn.rollback()
+        if len(staged) == 1:
+            raise
+        # Find the offending rows; the rest still go in
+        for row in staged:
+            try:
+                _apply(cursor, conn, [row], result)
+            except Exception as e:
+                conn.rollback()
+                result.error(row[0], f"Database error: {e}")
+        return
+    result.updated += len(updated)
+    result.inserted += len(staged) - len(updated)
+
+def import_products(cursor, conn, stream, fmt, chunk_size=IMPORT_CHUNK_SIZE):
+    """Import products from a text stream of CSV or JSON Lines. Returns an ImportResult."""
+    result = ImportResult()
+
+    cursor.execute("SELECT DepartmentID, Name FROM Department")
+    departments = {}
+    for department_id, name in cursor.fetchall():
+        departments[department_id] = department_id
+        if name:
+            departments[name.strip().lower()] = department_id
+
+    autocommit_backup = conn.autocommit
+    conn.autocommit = False
+    try:
+        cursor.execute(_CREATE_STAGE_SQL)
+        conn.commit()
+
+        seen_barcodes = {}
+        rows = parse_rows(stream, fmt)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            result.rows += len(chunk)
+
+            staged = []
+            for row_no, record in chunk:
+                try:
+                    row = validate_row(row_no, record, departments)
+                    if row[1] is not None:
+                        first = seen_barcodes.setdefault(row[1], row_no)
+                        if first != row_no:
+                            raise ImportRowError(f"Barcode {row[1]} already appears on row {first}")
+                except ImportRowError as e:
+                    result.error(row_no, str(e))
+                else:
+                    staged.append(row)
+
+            # New products: one sequence reservation for the whole chunk
+            missing = [i for i, row in enumerate(staged) if row[1] is None]
+            for i, barcode in zip(missing, barcode_allocator.reserve(cursor, len(missing), seen_barcodes)):
+                staged[i] = (staged[i][0], barcode) + staged[i][2:]
+
+            if staged:
+                _apply(cursor, conn, staged, result)
+
+        cursor.execute("DROP TABLE #ProductImport")
+        conn.commit()
+    finally:
+        conn.autocommit = autocommit_backup
+
+    # This only refreshes the current process's catalog and search index;
+    # other processes pick the changes up within CATALOG_MAX_AGE and
+    # SEARCH_INDEX_MAX_AGE seconds
+    if result.inserted or result.updated:
+        bump_catalog_version()
+        product_index.invalidate()
+    return result
+
+def text_stream(binary, encoding='utf-8-sig'):
+    """Wrap a binary stream (request body, open file) for parse_rows()."""
+    return io.TextIOWrapper(binary, encoding=encoding, newline='')
+
+# ---- command line ----
+
+@with_db
+def _import_file(cursor, conn, path, fmt, chunk_size):
+    with open(path, 'rb') as fh:
+        return import_products(cursor, conn, text_stream(fh), fmt, chunk_size)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Create or update products from a CSV or JSON Lines file.")
+    parser.add_argument('path', help="file to import; CSV needs a header row")
+    parser.add_argument('--format', choices=IMPORT_FORMATS,
+                        help="input format (default: from the file extension)")
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help="rows per batch")
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ('jsonl' if args.path.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    result = _import_file(args.path, fmt, args.chunk_size)
+    if not isinstance(result, ImportResult):
+        sys.exit("Product import failed")
+    for error in result.errors:
+        print(f"row {error['row']}: {error['error']}")
+    print(f"{result.rows} row(s): {result.inserted} inserted, {result.updated} updated, "
+          f"{result.failed} failed", flush=True)
+    if result.inserted or result.updated:
+        print(f"A running server shows these changes once its catalog (up to {CATALOG_MAX_AGE}s) "
+              f"and search index (up to {SEARCH_INDEX_MAX_AGE}s) refresh", flush=True)
+    if result.failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
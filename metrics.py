@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import bisect
+import threading
+from flask import g, has_app_context, request, Response, jsonify, before_render_template, template_rendered
+from db import add_query_observer, pool
+
+# -----------------------------
+# Request metrics
+# -----------------------------
+
+# Requests slower than this are written to the slow-request log
+METRICS_SLOW_REQUEST_MS = float(os.environ.get('METRICS_SLOW_REQUEST_MS', 1000))
+# Optional file for slow-request lines (JSON, one per line); stdout otherwise
+METRICS_SLOW_LOG = os.environ.get('METRICS_SLOW_LOG')
+# /metrics only answers loopback clients unless this is set
+METRICS_ALLOW_REMOTE = os.environ.get('METRICS_ALLOW_REMOTE', '0') == '1'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class RequestTiming:
+    """Per-request accumulator, kept on flask.g while the request runs."""
+
+    __slots__ = ('start', 'db_seconds', 'db_queries', 'db_calls', 'template_seconds',
+                 '_template_start', '_template_db_start', 'response_bytes')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.db_calls = 0
+        self.template_seconds = 0.0
+        self._template_start = None
+        self._template_db_start = 0.0
+        self.response_bytes = 0
+
+class RouteStats:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)   # last slot is +Inf
+        self.count = 0
+        self.seconds = 0.0
+        self.db_seconds = 0.0
+        self.db_queries = 0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+        self.statuses = {}
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}   # (endpoint, method) -> RouteStats
+
+    def record(self, endpoint, method, status, seconds, timing):
+        with self._lock:
+            stats = self._routes.get((endpoint, method))
+            if stats is None:
+                stats = self._routes[(endpoint, method)] = RouteStats()
+            stats.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            stats.count += 1
+            stats.seconds += seconds
+            stats.db_seconds += timing.db_seconds
+            stats.db_queries += timing.db_queries
+            stats.template_seconds += timing.template_seconds
+            stats.response_bytes += timing.response_bytes
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            lines = [
+                "# HELP pos_http_request_duration_seconds Request latency by endpoint.",
+                "# TYPE pos_http_request_duration_seconds histogram",
+            ]
+            for (endpoint, method), s in routes:
+                labels = f'endpoint="{_escape(endpoint)}",method="{method}"'
+                cumulative = 0
+                for bound, n in zip(LATENCY_BUCKETS + ('+Inf',), s.buckets):
+                    cumulative += n
+                    lines.append(f'pos_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"pos_http_request_duration_seconds_sum{{{labels}}} {s.seconds:.6f}")
+                lines.append(f"pos_http_request_duration_seconds_count{{{labels}}} {s.count}")
+
+            counters = [
+                ("pos_http_requests_total", "Requests by endpoint and status.", None),
+                ("pos_http_request_db_seconds_total", "Time spent in database calls.", "db_seconds"),
+                ("pos_http_request_db_queries_total", "Statements executed.", "db_queries"),
+                ("pos_http_request_template_seconds_total", "Time spent rendering templates.", "template_seconds"),
+                ("pos_http_response_bytes_total", "Response body bytes sent.", "response_bytes"),
+            ]
+            for name, help_text, attr in counters:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for (endpoint, method), s in routes:
+                    labels = f'endpoint="{_escape(endpoint)}",method="{method}"'
+                    if attr is None:
+                        for status, n in sorted(s.statuses.items()):
+                            lines.append(f'{name}{{{labels},status="{status}"}} {n}')
+                    else:
+                        lines.append(f"{name}{{{labels}}} {getattr(s, attr)}")
+
+        pool_stats = pool.stats()
+        lines.append("# HELP pos_db_pool_connections Database pool connections.")
+        lines.append("# TYPE pos_db_pool_connections gauge")
+        lines.append(f'pos_db_pool_connections{{state="open"}} {pool_stats["size"]}')
+        lines.append(f'pos_db_pool_connections{{state="idle"}} {pool_stats["idle"]}')
+        lines.append(f'pos_db_pool_connections{{state="max"}} {pool_stats["max_size"]}')
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+_slow_log_lock = threading.Lock()
+
+def _log_slow_request(entry):
+    line = json.dumps(entry)
+    if METRICS_SLOW_LOG:
+        with _slow_log_lock, open(METRICS_SLOW_LOG, 'a') as fh:
+            fh.write(line + "\n")
+    else:
+        print(line, flush=True)
+
+# ---- hooks ----
+
+def _on_query(seconds, executed, sql, rows, error):
+    if not has_app_context():
+        return   # CLI scripts and worker threads
+    timing = g.get('_timing')
+    if timing is not None:
+        timing.db_seconds += seconds
+        timing.db_calls += 1
+        timing.db_queries += executed
+
+def _before_render(app, template, context, **extra):
+    timing = g.get('_timing')
+    if timing is not None:
+        timing._template_start = time.perf_counter()
+        timing._template_db_start = timing.db_seconds
+
+def _after_render(app, template, context, **extra):
+    timing = g.get('_timing')
+    if timing is not None and timing._template_start is not None:
+        # Queries run by context processors / template code count as db time only
+        db_seconds = timing.db_seconds - timing._template_db_start
+        timing.template_seconds += time.perf_counter() - timing._template_start - db_seconds
+        timing._template_start = None
+
+def _start_request():
+    g._timing = RequestTiming()
+
+_END = object()
+
+def _counted(body, timing, renders_template):
+    # Streamed bodies: count bytes as they go out. Streamed templates render
+    # while the body is produced, which the render signals don't see, so
+    # that time (less the queries run meanwhile) is counted here instead.
+    body = iter(body)
+    while True:
+        start = time.perf_counter()
+        db_start = timing.db_seconds
+        chunk = next(body, _END)
+        if renders_template:
+            timing.template_seconds += time.perf_counter() - start - (timing.db_seconds - db_start)
+        if chunk is _END:
+            return
+        timing.response_bytes += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode())
+        yield chunk
+
+def _finish_request(response):
+    timing = g.get('_timing')
+    if timing is None:
+        return response
+    endpoint = request.endpoint or 'unmatched'
+    method = request.method
+    path = request.path
+    status = response.status_code
+
+    if response.is_streamed:
+        response.response = _counted(response.response, timing,
+                                     getattr(response, 'renders_template', False))
+    else:
+        timing.response_bytes = response.calculate_content_length() or 0
+
+    def done():
+        # Runs once the body has been sent, so streamed responses count in full
+        seconds = time.perf_counter() - timing.start
+        metrics.record(endpoint, method, status, seconds, timing)
+        if seconds * 1000 >= METRICS_SLOW_REQUEST_MS:
+            _log_slow_request({
+                "event": "slow_request",
+                "method": method,
+                "path": path,
+                "endpoint": endpoint,
+                "status": status,
+                "total_ms": round(seconds * 1000, 1),
+                "db_ms": round(timing.db_seconds * 1000, 1),
+                "db_queries": timing.db_queries,
+                "db_calls": timing.db_calls,
+                "template_ms": round(timing.template_seconds * 1000, 1),
+                "python_ms": round((seconds - timing.db_seconds - timing.template_seconds) * 1000, 1),
+                "response_bytes": timing.response_bytes,
+            })
+
+    response.call_on_close(done)
+    return response
+
+def metrics_endpoint():
+    if not METRICS_ALLOW_REMOTE and request.remote_addr not in ('127.0.0.1', '::1'):
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+def init_app(app):
+    """Time every request: total, database, template and response size."""
+    add_query_observer(_on_query)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
@@ -0,0 +1,87 @@
+from flask import Response, request, jsonify, current_app, stream_with_context, get_template_attribute
+from db import rows_to_dict_list, rows_to_columnar, iter_rows, iter_batches
+
+# -----------------------------
+# Columnar JSON responses
+# -----------------------------
+
+# Opt-in columnar wire format: ?format=rows|columns, or one of these in Accept
+COLUMNAR_MEDIA_TYPES = {
+    'application/vnd.pos.rows+json': 'rows',
+    'application/vnd.pos.columns+json': 'columns',
+}
+
+def columnar_orient():
+    """Return 'rows' or 'columns' if the client asked for columnar JSON, else None."""
+    fmt = request.args.get('format')
+    if fmt in ('rows', 'columns'):
+        return fmt
+    if fmt == 'json':
+        # Report tables: ?format=json predates the orient choice
+        return 'columns'
+    for mimetype, quality in request.accept_mimetypes:
+        if quality and mimetype in COLUMNAR_MEDIA_TYPES:
+            return COLUMNAR_MEDIA_TYPES[mimetype]
+    return None
+
+def columnar_response(description, rows, orient, **extra):
+    response = jsonify({**rows_to_columnar(description, rows, orient), **extra})
+    response.vary.add('Accept')
+    return response
+
+def rows_response(cursor):
+    """JSON for an executed query: a list of dicts, or columnar if negotiated."""
+    orient = columnar_orient()
+    if orient:
+        return columnar_response(cursor.description, cursor.fetchall(), orient)
+    response = jsonify(rows_to_dict_list(cursor))
+    response.vary.add('Accept')
+    return response
+
+# -----------------------------
+# Report table rendering
+# -----------------------------
+
+def report_response(cursor, kinds, missing=''):
+    """
+    Respond with the rows of an executed report query.
+
+    By default the rows are streamed as <tr> HTML through the report_rows
+    macro, one DB_FETCH_SIZE batch at a time. With ?format=json (or any
+    columnar format, see columnar_orient) the rows come back as columnar
+    JSON for client-side rendering, with the cell kinds alongside.
+    """
+    if len(kinds) != len(cursor.description):
+        raise ValueError(f"expected {len(cursor.description)} cell kinds, got {len(kinds)}")
+
+    orient = columnar_orient()
+    if orient:
+        return columnar_response(cursor.description, cursor.fetchall(), orient, kinds=list(kinds))
+
+    # Macros are compiled once and cached by the Jinja environment
+    report_rows = get_template_attribute('partials/report_table.html', 'report_rows')
+
+    def generate():
+        for rows in iter_batches(cursor):
+            yield str(report_rows(rows, kinds, missing))
+
+    return template_stream(generate())
+
+def stream_rows_template(template_name, rows_name, cursor, sql, params=(), **context):
+    """
+    Render a report page whose main table is fed by iter_rows() straight off
+    the cursor while the response streams. Context processors run before the
+    query, as they may use the request's connection themselves.
+    """
+    app = current_app._get_current_object()
+    template = app.jinja_env.get_template(template_name)
+    app.update_template_context(context)
+    cursor.execute(sql, params)
+    context[rows_name] = iter_rows(cursor)
+    return template_stream(template.generate(context))
+
+def template_stream(chunks):
+    """Streamed HTML response; metrics.py counts producing it as template time."""
+    response = Response(stream_with_context(chunks), mimetype='text/html')
+    response.renders_template = True
+    return response
@@ -0,0 +1,203 @@
+import os
+import re
+import time
+import heapq
+import bisect
+import threading
+from db import with_db, iter_rows, fetch_row
+
+# -----------------------------
+# Product search index
+# -----------------------------
+
+# Full rebuild interval; picks up edits made by other processes
+SEARCH_INDEX_MAX_AGE = int(os.environ.get('SEARCH_INDEX_MAX_AGE', 900))
+# After a failed load, wait this long before querying the database again
+SEARCH_INDEX_RETRY = int(os.environ.get('SEARCH_INDEX_RETRY', 30))
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+_INDEX_QUERY = """
+    SELECT p.ProductID, p.Name, p.Description, p.Barcode, p.DepartmentID, d.Name AS DepartmentName
+    FROM Product p
+    LEFT JOIN Department d ON p.DepartmentID = d.DepartmentID
+    WHERE p.IsActive = 1
+"""
+
+class SearchIndexUnavailable(RuntimeError):
+    """The index has never loaded and the database could not provide it."""
+
+def _index_product(p, postings, docs, barcodes):
+    """Add one product to the given index maps; returns its tokens."""
+    pid = p['ProductID']
+    barcode = (p.get('Barcode') or '').strip()
+    tokens = set(tokenize(p.get('Name')))
+    tokens.update(tokenize(p.get('Description')))
+    tokens.update(tokenize(p.get('DepartmentName')))
+    tokens.update(tokenize(barcode))
+    for token in tokens:
+        postings.setdefault(token, set()).add(pid)
+    if barcode:
+        barcodes[barcode] = pid
+    docs[pid] = ((p.get('Name') or '').lower(), p.get('DepartmentID'), tokens, barcode)
+    return tokens
+
+class ProductSearchIndex:
+    """
+    In-process inverted index over active products.
+    Name, description, department name and barcode are tokenized; every query
+    term must match the start of some token of a product (prefix AND search).
+    Barcodes also get an exact hash lookup.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()   # one database load at a time; searches don't wait on it
+        self._postings = {}        # token -> set(ProductID)
+        self._tokens = []          # sorted distinct tokens, for prefix scans
+        self._docs = {}            # ProductID -> (sort name, DepartmentID, tokens, barcode)
+        self._barcodes = {}        # barcode -> ProductID
+        self._loaded_at = None
+        self._retry_at = 0.0       # monotonic time before which a failed load is not retried
+
+    # ---- maintenance ----
+
+    def rebuild(self, products):
+        """
+        Replace the index with `products`. The new index is built aside and
+        swapped in at the end, so searches keep using the old one while
+        rows arrive, and a failure part way through leaves it untouched.
+        """
+        postings, docs, barcodes = {}, {}, {}
+        for p in products:
+            _index_product(p, postings, docs, barcodes)
+        tokens = sorted(postings)
+        with self._lock:
+            self._postings, self._tokens, self._docs, self._barcodes = postings, tokens, docs, barcodes
+            self._loaded_at = time.monotonic()
+
+    def upsert(self, product):
+        with self._lock:
+            self._remove(product['ProductID'])
+            for token in self._add(product):
+                if len(self._postings[token]) == 1:
+                    bisect.insort(self._tokens, token)
+
+    def remove(self, product_id):
+        with self._lock:
+            self._remove(product_id)
+
+    def invalidate(self):
+        """Drop the index; the next search reloads it (after bulk changes)."""
+        with self._lock:
+            self._loaded_at = None
+            self._retry_at = 0.0
+
+    def refresh(self, cursor, product_id):
+        """Re-read one product and update (or drop) its index entry."""
+        if self._loaded_at is None:
+            return
+        cursor.execute(_INDEX_QUERY + " AND p.ProductID = ?", (product_id,))
+        row = fetch_row(cursor)
+        if row:
+            self.upsert(row)
+        else:
+            self.remove(product_id)
+
+    def _is_fresh(self):
+        loaded_at = self._loaded_at
+        return loaded_at is not None and time.monotonic() - loaded_at <= SEARCH_INDEX_MAX_AGE
+
+    def ensure_loaded(self):
+        """
+        Load the index, or reload it once it is older than SEARCH_INDEX_MAX_AGE.
+        If a reload fails the previous index keeps serving; if there is none,
+        raises SearchIndexUnavailable.
+        """
+        if self._is_fresh():
+            return
+        with self._load_lock:
+            # Another request may have loaded it while we waited
+            if self._is_fresh():
+                return
+            if time.monotonic() >= self._retry_at:
+                if _load_index(self) is True:
+                    return
+                self._retry_at = time.monotonic() + SEARCH_INDEX_RETRY
+                print("Search index load failed", flush=True)
+            if self._loaded_at is None:
+                raise SearchIndexUnavailable("Search index is unavailable")
+
+    def _add(self, p):
+        return _index_product(p, self._postings, self._docs, self._barcodes)
+
+    def _remove(self, pid):
+        doc = self._docs.pop(pid, None)
+        if doc is None:
+            return
+        _, _, tokens, barcode = doc
+        for token in tokens:
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(pid)
+            if not ids:
+                del self._postings[token]
+                i = bisect.bisect_left(self._tokens, token)
+                if i < len(self._tokens) and self._tokens[i] == token:
+                    del self._tokens[i]
+        if barcode and self._barcodes.get(barcode) == pid:
+            del self._barcodes[barcode]
+
+    # ---- queries ----
+
+    def lookup_barcode(self, barcode):
+        return self._barcodes.get((barcode or '').strip())
+
+    def search(self, query, department_id=None, limit=None):
+        """Return matching ProductIDs ordered by name."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            exact = self._barcodes.get(query.strip())
+            matches = None
+            # Narrowest term first keeps the intersections small
+            for term in sorted(set(terms), key=len, reverse=True):
+                ids = self._prefix_ids(term)
+                matches = ids if matches is None else matches & ids
+                if not matches:
+                    break
+            matches = set(matches or ())
+            if exact is not None:
+                matches.add(exact)
+
+            if department_id is not None:
+                matches = {pid for pid in matches if self._docs[pid][1] == department_id}
+            sort_key = lambda pid: (self._docs[pid][0], pid)
+            if limit:
+                return heapq.nsmallest(limit, matches, key=sort_key)
+            return sorted(matches, key=sort_key)
+
+    def _prefix_ids(self, term):
+        ids = set()
+        i = bisect.bisect_left(self._tokens, term)
+        while i < len(self._tokens) and self._tokens[i].startswith(term):
+            ids |= self._postings[self._tokens[i]]
+            i += 1
+        return ids
+
+    def __len__(self):
+        return len(self._docs)
+
+@with_db
+def _load_index(cursor, conn, index):
+    cursor.execute(_INDEX_QUERY)
+    index.rebuild(iter_rows(cursor))
+    return True
+
+product_index = ProductSearchIndex()
@@ -0,0 +1,388 @@
+import re
+import time
+import sqlite3
+import threading
+
+# -----------------------------
+# Local SQL Server stand-in
+# -----------------------------
+#
+# A pyodbc-shaped module backed by SQLite, for driving the app without an
+# Azure SQL instance (see bench_checkout.py). It covers the schema and the
+# T-SQL used on the storefront, bag and checkout paths; anything else is
+# passed to SQLite unchanged and will fail loudly if SQLite can't run it.
+#
+# Locking is emulated with SQLite's single writer: every write, and every
+# read that asks for UPDLOCK, runs inside BEGIN IMMEDIATE. A statement that
+# finds the lock held counts as one lock conflict, and its wait is timed.
+
+LOCK_WAIT_TIMEOUT = 10.0    # seconds before a blocked statement gives up
+LOCK_RETRY_DELAY = 0.0005
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS Department (
+    DepartmentID INTEGER PRIMARY KEY,
+    Name TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Customer (
+    CustomerID INTEGER PRIMARY KEY,
+    Name TEXT NOT NULL,
+    Email TEXT,
+    Username TEXT,
+    Password TEXT
+);
+CREATE TABLE IF NOT EXISTS Product (
+    ProductID INTEGER PRIMARY KEY,
+    Name TEXT NOT NULL,
+    Description TEXT,
+    Price NUMERIC NOT NULL,
+    Barcode TEXT UNIQUE,
+    DepartmentID INTEGER,
+    QuantityInStock INTEGER,
+    SalePrice NUMERIC,
+    OnSale INTEGER,
+    ImageURL TEXT,
+    IsActive INTEGER DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS Holiday_Sales (
+    SaleID INTEGER PRIMARY KEY,
+    SaleName TEXT,
+    StartDate TEXT,
+    EndDate TEXT,
+    DiscountPercent NUMERIC,
+    DepartmentID INTEGER,
+    IsActive INTEGER
+);
+CREATE TABLE IF NOT EXISTS Bag (
+    BagID INTEGER PRIMARY KEY,
+    CustomerID INTEGER,
+    EmployeeID INTEGER,
+    ProductID INTEGER NOT NULL,
+    Quantity INTEGER NOT NULL,
+    AddedAt TEXT DEFAULT CURRENT_TIMESTAMP,
+    CHECK ((CustomerID IS NULL) <> (EmployeeID IS NULL))
+);
+CREATE INDEX IF NOT EXISTS IX_Bag_Customer ON Bag (CustomerID, ProductID);
+CREATE INDEX IF NOT EXISTS IX_Bag_Employee ON Bag (EmployeeID, ProductID);
+CREATE TABLE IF NOT EXISTS SalesTransaction (
+    TransactionID INTEGER PRIMARY KEY,
+    TransactionDate TEXT,
+    TotalAmount NUMERIC,
+    CustomerID INTEGER,
+    PaymentMethod TEXT,
+    OrderStatus TEXT,
+    OrderDiscount NUMERIC,
+    ShippingAddress TEXT
+);
+CREATE TABLE IF NOT EXISTS Transaction_Details (
+    TransactionID INTEGER NOT NULL,
+    ProductID INTEGER NOT NULL,
+    Quantity INTEGER NOT NULL,
+    Price NUMERIC NOT NULL,
+    datetime TEXT,
+    inventoryid INTEGER,
+    Status TEXT,
+    Discount NUMERIC,
+    Subtotal NUMERIC,
+    EmployeeID INTEGER,
+    PRIMARY KEY (TransactionID, ProductID)
+);
+CREATE TABLE IF NOT EXISTS Customer_Summary (
+    CustomerID INTEGER PRIMARY KEY,
+    TotalPurchases INTEGER NOT NULL DEFAULT 0,
+    TotalSpent NUMERIC NOT NULL DEFAULT 0,
+    FavoriteProduct TEXT,
+    RecentPurchaseDate TEXT,
+    LargestSingleOrder NUMERIC NOT NULL DEFAULT 0,
+    MostPurchasedCategory TEXT,
+    UpdatedAt TEXT
+);
+CREATE TABLE IF NOT EXISTS Customer_Product_Summary (
+    CustomerID INTEGER NOT NULL,
+    ProductID INTEGER NOT NULL,
+    Quantity INTEGER NOT NULL,
+    PRIMARY KEY (CustomerID, ProductID)
+);
+CREATE TABLE IF NOT EXISTS Daily_Sales_Rollup (
+    SaleDate TEXT NOT NULL,
+    DepartmentID INTEGER NOT NULL,
+    EmployeeID INTEGER NOT NULL,
+    PaymentMethod TEXT NOT NULL,
+    OrderStatus TEXT NOT NULL,
+    Revenue NUMERIC NOT NULL,
+    Quantity INTEGER NOT NULL,
+    LineItems INTEGER NOT NULL,
+    PRIMARY KEY (SaleDate, DepartmentID, EmployeeID, PaymentMethod, OrderStatus)
+);
+CREATE TABLE IF NOT EXISTS Daily_Order_Rollup (
+    SaleDate TEXT NOT NULL,
+    PaymentMethod TEXT NOT NULL,
+    OrderStatus TEXT NOT NULL,
+    Orders INTEGER NOT NULL,
+    Revenue NUMERIC NOT NULL,
+    PRIMARY KEY (SaleDate, PaymentMethod, OrderStatus)
+);
+CREATE TABLE IF NOT EXISTS Sales_Rollup_Pending (
+    TransactionID INTEGER PRIMARY KEY
+);
+CREATE TRIGGER IF NOT EXISTS trg_UpdateSubtotal
+AFTER INSERT ON Transaction_Details
+BEGIN
+    UPDATE Transaction_Details SET Subtotal = NEW.Quantity * NEW.Price
+    WHERE TransactionID = NEW.TransactionID AND ProductID = NEW.ProductID;
+END;
+"""
+
+def create_schema(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    conn.commit()
+    return conn
+
+# ---- pyodbc surface ----
+
+class Error(Exception):
+    pass
+
+_path = None
+_stats_lock = threading.Lock()
+_stats = {"lock_conflicts": 0, "lock_wait_seconds": 0.0, "statements": 0}
+
+def configure(path):
+    """Point every later connect() at the SQLite database file `path`."""
+    global _path
+    _path = path
+
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+def reset_stats():
+    with _stats_lock:
+        for key in _stats:
+            _stats[key] = 0
+
+def drivers():
+    return ['ODBC Driver 18 for SQL Server']
+
+def connect(conn_str=None, **kwargs):
+    if _path is None:
+        raise Error("sql_standin.configure() has not been called")
+    return Connection(sqlite3.connect(_path, timeout=0, isolation_level=None,
+                                      check_same_thread=False))
+
+class Connection:
+    def __init__(self, db):
+        self._db = db
+        self._db.execute("PRAGMA busy_timeout=0")
+        self.autocommit = False
+        self.timeout = 0
+
+    def cursor(self):
+        return Cursor(self)
+
+    def commit(self):
+        if self._db.in_transaction:
+            self._db.execute("COMMIT")
+
+    def rollback(self):
+        if self._db.in_transaction:
+            self._db.execute("ROLLBACK")
+
+    def close(self):
+        self.rollback()
+        self._db.close()
+
+    def _begin_write(self):
+        # SQLite's single writer lock stands in for SQL Server's row locks
+        start = None
+        while True:
+            try:
+                self._db.execute("BEGIN IMMEDIATE")
+                break
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise Error(str(e))
+                if start is None:
+                    start = time.perf_counter()
+                    with _stats_lock:
+                        _stats["lock_conflicts"] += 1
+                elif time.perf_counter() - start > LOCK_WAIT_TIMEOUT:
+                    raise Error("Lock request time out period exceeded.")
+                time.sleep(LOCK_RETRY_DELAY)
+        if start is not None:
+            with _stats_lock:
+                _stats["lock_wait_seconds"] += time.perf_counter() - start
+
+class Cursor:
+    def __init__(self, conn):
+        self.connection = conn
+        self.description = None
+        self.rowcount = -1
+        self._rows = []
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (tuple, list)):
+            params = tuple(params[0])
+        conn = self.connection
+        with _stats_lock:
+            _stats["statements"] += 1
+
+        writes = _is_write(sql)
+        if writes and not conn.autocommit and not conn._db.in_transaction:
+            conn._begin_write()
+
+        try:
+            merge = _MERGE_RE.search(sql)
+            if merge:
+                self._run_merge(merge, params)
+            else:
+                self._run(translate(sql), params)
+        except sqlite3.Error as e:
+            raise Error(str(e))
+
+        if writes and conn.autocommit:
+            conn.commit()
+        return self
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size=1):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self):
+        self._rows = []
+
+    def _run(self, sql, params):
+        cur = self.connection._db.execute(sql, params)
+        self.description = cur.description
+        self._rows = cur.fetchall() if cur.description else []
+        self.rowcount = cur.rowcount
+
+    def _run_merge(self, m, params):
+        # MERGE t AS target USING (<select>) AS src ON <cond>
+        #   WHEN MATCHED THEN UPDATE SET ... WHEN NOT MATCHED THEN INSERT (...) VALUES (...)
+        # runs as an UPDATE ... FROM followed by an INSERT ... WHERE NOT EXISTS
+        table = _strip_schema(m.group('table'))
+        parts = {}
+        rest = list(params)
+        for name in ('src', 'on', 'set', 'vals'):
+            n = m.group(name).count('?')
+            parts[name], rest = tuple(rest[:n]), rest[n:]
+
+        src = translate(m.group('src'))
+        on = translate(m.group('on'))
+        self._run(f"UPDATE {table} AS target SET {translate(m.group('set'))} "
+                  f"FROM ({src}) AS src WHERE {on}",
+                  parts['set'] + parts['src'] + parts['on'])
+        updated = self.rowcount
+        self._run(f"INSERT INTO {table} ({m.group('cols')}) "
+                  f"SELECT {translate(m.group('vals'))} FROM ({src}) AS src "
+                  f"WHERE NOT EXISTS (SELECT 1 FROM {table} AS target WHERE {on})",
+                  parts['vals'] + parts['src'] + parts['on'])
+        self.rowcount += max(updated, 0)
+
+# ---- T-SQL translation ----
+
+_WRITE_RE = re.compile(r"^\s*(INSERT|UPDATE|DELETE|MERGE)\b|UPDLOCK", re.I)
+_HINT_RE = re.compile(r"WITH\s*\(\s*(?:UPDLOCK|ROWLOCK|NOLOCK|HOLDLOCK|READPAST)(?:\s*,\s*\w+)*\s*\)", re.I)
+_OPENJSON_WITH_RE = re.compile(r"OPENJSON\(\?\)\s*WITH\s*\(([^()]*)\)", re.I)
+_OPENJSON_RE = re.compile(r"OPENJSON\(\?\)", re.I)
+_OUTPUT_RE = re.compile(r"OUTPUT\s+INSERTED\.(\w+)", re.I)
+_CAST_DATE_RE = re.compile(r"CAST\(((?:[^()]|\([^()]*\))*?)\s+AS\s+DATE\)", re.I)
+_DATEADD_DAY_RE = re.compile(r"DATEADD\(\s*day\s*,\s*(-?\d+)\s*,\s*((?:[^()]|\([^()]*\))*?)\)", re.I)
+_TOP_RE = re.compile(r"\bTOP\s*\(?\s*(\d+)\s*\)?\s+", re.I)
+_UPDATE_ALIAS_RE = re.compile(r"^\s*UPDATE\s+(?P<alias>\w+)\s+SET\s+", re.I)
+_MERGE_RE = re.compile(
+    r"MERGE\s+(?P<table>[\w.]+)(?:\s+WITH\s*\(\w+\))?\s+AS\s+target\s+"
+    r"USING\s+\((?P<src>.*)\)\s+AS\s+src\s+ON\s+(?P<on>.*?)\s+"
+    r"WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(?P<set>.*?)\s+"
+    r"WHEN\s+NOT\s+MATCHED\s+THEN\s+INSERT\s*\((?P<cols>[^)]*)\)\s*VALUES\s*\((?P<vals>.*)\)\s*;?\s*$",
+    re.I | re.S)
+
+def _is_write(sql):
+    return bool(_WRITE_RE.search(sql))
+
+def _strip_schema(name):
+    return re.sub(r"^(dbo\.|\[dbo\]\.)", "", name, flags=re.I)
+
+def _openjson_columns(m):
+    cols = []
+    for spec in m.group(1).split(','):
+        name, _type, path = spec.split(None, 2)
+        cols.append(f"json_extract(value, {path.strip()}) AS {name}")
+    return f"(SELECT {', '.join(cols)} FROM json_each(?))"
+
+def _find_top_level(sql, keyword, start=0):
+    """Index of `keyword` outside any parentheses, or -1."""
+    depth = 0
+    pattern = re.compile(rf"\(|\)|\b{keyword}\b", re.I)
+    for tok in pattern.finditer(sql, start):
+        if tok.group() == '(':
+            depth += 1
+        elif tok.group() == ')':
+            depth -= 1
+        elif depth == 0:
+            return tok.start()
+    return -1
+
+def _rewrite_update_from(sql, m):
+    # UPDATE a SET a.x = ... FROM T a [JOIN src b ON cond] [WHERE ...]
+    #   -> UPDATE T AS a SET x = ... [FROM src AS b] WHERE cond [AND ...]
+    alias = m.group('alias')
+    from_at = _find_top_level(sql, 'FROM', m.end())
+    if from_at < 0:
+        return sql
+    assignments = re.sub(rf"\b{alias}\.(\w+)\s*=(?!=)", r"\1 =", sql[m.end():from_at].strip())
+    tail = sql[from_at + 4:].strip().rstrip(';')
+    table_m = re.match(rf"([\w.]+)\s+(?:AS\s+)?{alias}\b", tail, re.I)
+    if not table_m:
+        return sql
+    tail = tail[table_m.end():].strip()
+
+    source, conditions = "", []
+    if re.match(r"JOIN\b", tail, re.I):
+        on_at = _find_top_level(tail, 'ON')
+        where_at = _find_top_level(tail, 'WHERE')
+        source = " FROM " + tail[4:on_at].strip()
+        conditions.append(tail[on_at + 2:where_at if where_at >= 0 else None].strip())
+        tail = tail[where_at:] if where_at >= 0 else ""
+    if re.match(r"WHERE\b", tail, re.I):
+        conditions.append(tail[5:].strip())
+
+    where = f" WHERE {' AND '.join(f'({c})' for c in conditions)}" if conditions else ""
+    return f"UPDATE {table_m.group(1)} AS {alias} SET {assignments}{source}{where}"
+
+def translate(sql):
+    """Rewrite the T-SQL used by the app into SQLite."""
+    sql = re.sub(r"\bdbo\.", "", sql)
+    sql = _HINT_RE.sub("", sql)
+    sql = re.sub(r"GETDATE\(\)", "datetime('now', 'localtime')", sql, flags=re.I)
+    sql = re.sub(r"\bISNULL\(", "IFNULL(", sql, flags=re.I)
+    sql = _CAST_DATE_RE.sub(r"date(\1)", sql)
+    sql = _DATEADD_DAY_RE.sub(r"datetime(\2, '\1 day')", sql)
+    sql = _OPENJSON_WITH_RE.sub(_openjson_columns, sql)
+    sql = _OPENJSON_RE.sub("json_each(?)", sql)
+
+    output = _OUTPUT_RE.search(sql)
+    if output:
+        sql = _OUTPUT_RE.sub("", sql).rstrip().rstrip(';') + f" RETURNING {output.group(1)}"
+
+    # SELECT TOP n: a LIMIT on the outer statement; inside a scalar subquery
+    # SQLite already takes the first row, so the clause can just go
+    top = _TOP_RE.search(sql)
+    if top and re.match(r"\s*SELECT\s+TOP\b", sql, re.I):
+        sql = _TOP_RE.sub("", sql, count=1).rstrip().rstrip(';') + f" LIMIT {top.group(1)}"
+    sql = _TOP_RE.sub("", sql)
+
+    m = _UPDATE_ALIAS_RE.match(sql)
+    if m:
+        sql = _rewrite_update_from(sql, m)
+    return sql
@@ -0,0 +1,169 @@
+import os
+import time
+import threading
+from db import fetch_rows, add_query_observer, TimedCursor
+
+# -----------------------------
+# Statement registry
+# -----------------------------
+
+# Queries are declared once by name and reused with the same SQL text, so
+# SQL Server sees one text (and caches one plan) per query shape. Every
+# query run on a with_db cursor is timed, including the rows fetched after
+# execute(); inline cursor.execute() calls are grouped by their SQL text.
+# /api/admin/statements shows the totals so the queries that dominate
+# database time stand out.
+
+# Distinct inline SQL texts tracked; any further ones are pooled as "(other)"
+STATEMENT_STATS_MAX = int(os.environ.get('STATEMENT_STATS_MAX', 500))
+
+class Statement:
+    """A named SQL statement with execution stats."""
+
+    def __init__(self, name, sql):
+        self.name = name
+        self.sql = sql
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+            self.errors = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+            self.rows = 0
+
+    def _record(self, seconds, rows, executed=True, error=False):
+        with self._lock:
+            self.count += executed
+            self.errors += error
+            self.total_seconds += seconds
+            if seconds > self.max_seconds:
+                self.max_seconds = seconds
+            self.rows += rows
+
+    def _run(self, cursor, params, fetch):
+        if isinstance(cursor, TimedCursor):
+            # The query observer records execute and every later fetch
+            cursor.execute(self.sql, params)
+            return fetch(cursor)
+        start = time.perf_counter()
+        try:
+            cursor.execute(self.sql, params)
+            result = fetch(cursor)
+        except Exception:
+            self._record(time.perf_counter() - start, 0, error=True)
+            raise
+        if isinstance(result, list):
+            rows = len(result)
+        elif result is cursor:
+            rows = max(cursor.rowcount, 0)   # affected rows for DML, -1 for SELECT
+        else:
+            rows = int(result is not None)
+        self._record(time.perf_counter() - start, rows)
+        return result
+
+    def execute(self, cursor, params=()):
+        """
+        Execute and return the cursor. On a with_db cursor the rows fetched
+        from it afterwards count towards this statement too.
+        """
+        return self._run(cursor, params, lambda c: c)
+
+    def fetchall(self, cursor, params=()):
+        return self._run(cursor, params, lambda c: c.fetchall())
+
+    def fetchone(self, cursor, params=()):
+        return self._run(cursor, params, lambda c: c.fetchone())
+
+    def fetch_rows(self, cursor, params=()):
+        return self._run(cursor, params, fetch_rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "count": self.count,
+                "errors": self.errors,
+                "total_ms": round(self.total_seconds * 1000, 3),
+                "avg_ms": round(self.total_seconds * 1000 / self.count, 3) if self.count else 0,
+                "max_ms": round(self.max_seconds * 1000, 3),
+                "rows": self.rows,
+                "sql": self.sql,
+            }
+
+def _normalize(sql):
+    return " ".join(sql.split())
+
+class StatementRegistry:
+    def __init__(self):
+        self._statements = {}
+        self._inline = {}      # normalized SQL -> Statement for undeclared queries
+        self._by_sql = {}      # SQL text as executed -> Statement
+        self._other = Statement("(other)", None)
+        self._lock = threading.Lock()
+
+    def declare(self, name, sql):
+        """Register a statement, or return the one already registered under `name`."""
+        with self._lock:
+            stmt = self._statements.get(name)
+            if stmt is None:
+                stmt = self._statements[name] = Statement(name, sql)
+                self._by_sql[sql] = stmt
+            elif stmt.sql != sql:
+                raise ValueError(f"statement {name!r} is already declared with different SQL")
+            return stmt
+
+    def variant(self, name, key, build):
+        """
+        One shape of a dynamically assembled query. `key` names the shape
+        (e.g. which filters are present); build() is only called the first
+        time a shape is seen, and its text is reused after that.
+        """
+        full_name = f"{name}[{key}]" if key else name
+        stmt = self._statements.get(full_name)
+        if stmt is None:
+            stmt = self.declare(full_name, build())
+        return stmt
+
+    def for_sql(self, sql):
+        """The statement that `sql` belongs to, tracking it as "(inline)" if undeclared."""
+        stmt = self._by_sql.get(sql)
+        if stmt is not None:
+            return stmt
+        with self._lock:
+            text = _normalize(sql)
+            stmt = self._inline.get(text)
+            if stmt is None:
+                if len(self._inline) >= STATEMENT_STATS_MAX:
+                    return self._other
+                stmt = self._inline[text] = Statement("(inline)", text)
+            # Texts built with f-strings could grow this without bound
+            if len(self._by_sql) < 4 * STATEMENT_STATS_MAX:
+                self._by_sql[sql] = stmt
+            return stmt
+
+    def _on_query(self, seconds, executed, sql, rows, error):
+        if sql is not None:
+            self.for_sql(sql)._record(seconds, rows, executed=executed, error=error)
+
+    def stats(self):
+        """Per-statement stats, busiest (by total time) first."""
+        with self._lock:
+            statements = list(self._statements.values()) + list(self._inline.values())
+        if self._other.count:
+            statements.append(self._other)
+        return sorted((s.stats() for s in statements), key=lambda s: s["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            statements = list(self._statements.values()) + list(self._inline.values())
+        for stmt in statements + [self._other]:
+            stmt.reset()
+
+    def __len__(self):
+        return len(self._statements)
+
+statements = StatementRegistry()
+add_query_observer(statements._on_query)
@@ -51,9 +51,9 @@
       return window.PRODUCTS;
     }
     try {
-      const res = await fetch(`${API_BASE}/products`);
+      const res = await fetch(`${API_BASE}/api/products?limit=200`);
       if (!res.ok) throw new Error('Failed to fetch products');
-      const products = (await res.json()).map(normalizeProduct);
+      const products = (await res.json()).products.map(normalizeProduct);
       window.PRODUCTS = products;
       return products;
     } catch (err) {
@@ -67,6 +67,26 @@
     return products.find(p => Number(p.product_id) === Number(id)) || null;
   }
 
+  // Remember products loaded page by page so addToCart can find them
+  function rememberProducts(rows) {
+    const known = window.PRODUCTS || [];
+    const seen = new Set(known.map(p => Number(p.product_id ?? p.ProductID)));
+    rows.forEach(row => {
+      if (!seen.has(Number(row.ProductID))) known.push(normalizeProduct(row));
+    });
+    window.PRODUCTS = known;
+  }
+
+  async function fetchProductPage(params) {
+    const qs = new URLSearchParams();
+    Object.entries(params).forEach(([k, v]) => { if (v != null && v !== '') qs.set(k, v); });
+    const res = await fetch(`${API_BASE}/api/products?${qs}`, { credentials: 'same-origin' });
+    if (!res.ok) throw new Error('Failed to fetch products');
+    const page = await res.json();
+    rememberProducts(page.products);
+    return page;
+  }
+
   // -------------------- Cart operations (per-user) --------------------
   function getCartKey() {
     const id = (window.CURRENT_USER && window.CURRENT_USER.id != null) ? String(window.CURRENT_USER.id) : 'guest';
@@ -553,53 +573,79 @@
     });
   }
 
-  function filterProducts(query) {
+  // Only the first page of products is in the DOM, so search runs server-side
+  let searchSeq = 0;
+  async function filterProducts(query) {
     const grid = document.getElementById('productGrid');
     if (!grid) return;
 
-    const cards = Array.from(grid.querySelectorAll('.product-card'));
-    if (!query) {
-      cards.forEach(c => { c.style.display = ''; c.style.animation = 'fadeIn 0.3s ease'; });
+    const seq = ++searchSeq;
+    let page;
+    try {
+      if (query) {
+        const qs = new URLSearchParams({ q: query });
+        if (productListing.department) qs.set('department', productListing.department);
+        const res = await fetch(`${API_BASE}/api/products/search?${qs}`, { credentials: 'same-origin' });
+        if (!res.ok) throw new Error('Search failed');
+        page = await res.json();
+        rememberProducts(page.products);
+      } else {
+        page = await fetchProductPage({ department: productListing.department });
+      }
+    } catch (err) {
+      console.error('Error searching products:', err);
       return;
     }
+    if (seq !== searchSeq) return; // a newer keystroke already answered
 
-    cards.forEach(card => {
-      const name = (card.getAttribute('data-name') || '').toLowerCase();
-      const desc = (card.getAttribute('data-description') || '').toLowerCase();
-      const matches = name.includes(query) || desc.includes(query);
-      if (matches) { card.style.display = ''; card.style.animation = 'fadeIn 0.3s ease'; }
-      else { card.style.display = 'none'; }
-    });
-
-    const visibleCards = cards.filter(c => c.style.display !== 'none');
-    let noResults = document.querySelector('.no-results-message');
+    productListing.cursor = query ? null : page.next_cursor;
+    updateLoadMore();
 
-    if (visibleCards.length === 0) {
-      if (!noResults) {
-        noResults = document.createElement('div');
-        noResults.className = 'no-results-message';
-        noResults.style.cssText = 'grid-column: 1/-1; text-align: center; padding: 3rem; color: var(--text-light);';
-        noResults.innerHTML = `
+    if (query && !page.products.length) {
+      grid.innerHTML = `
+        <div class="no-results-message" style="grid-column: 1/-1; text-align: center; padding: 3rem; color: var(--text-light);">
           <div style="font-size: 3rem; opacity: 0.5; margin-bottom: 1rem;">🔍</div>
           <h3>No products found</h3>
           <p>Try searching with different keywords</p>
-        `;
-        grid.appendChild(noResults);
-      }
-    } else if (noResults) {
-      noResults.remove();
+        </div>
+      `;
+      return;
     }
+    renderProducts(page.products);
   }
 
   // -------------------- Category filters --------------------
   const productGrid = document.getElementById('productGrid');
   const allProducts = window.PRODUCTS || [];
 
+  // Current storefront listing: department filter plus the keyset cursor
+  // for the next page (null once the last page has been loaded)
+  const productListing = { department: null, cursor: window.PRODUCTS_NEXT_CURSOR || null };
+
+  function updateLoadMore() {
+    const btn = document.getElementById('loadMoreBtn');
+    if (btn) btn.hidden = !productListing.cursor;
+  }
+
+  async function loadMoreProducts() {
+    if (!productListing.cursor) return;
+    try {
+      const page = await fetchProductPage({ department: productListing.department, cursor: productListing.cursor });
+      productListing.cursor = page.next_cursor;
+      renderProducts(page.products, true);
+    } catch (err) {
+      console.error('Error loading products:', err);
+      showNotification('Could not load more products', 'error');
+    }
+    updateLoadMore();
+  }
+
   /**
-  * Renders products inside the grid
+  * Renders products inside the grid (appending when `append` is set)
   */
-  function renderProducts(products) {
+  function renderProducts(products, append = false) {
     if (!productGrid) return;
+    if (append && !products.length) return;
 
     if (!products.length) {
       productGrid.innerHTML = `<p style="grid-column:1/-1;text-align:center;color:var(--text-light)">
@@ -620,7 +666,7 @@
       'snacks & candy': '🍿'
     };
 
-    productGrid.innerHTML = products.map(p => {
+    const html = products.map(p => {
       const stockClass = p.QuantityInStock > 10 ? 'in-stock' : 'low-stock';
     
       // Use DepartmentName first, fallback to Category, lowercase for lookup
@@ -660,6 +706,9 @@
         </div>
       `;
     }).join('');
+
+    if (append) productGrid.insertAdjacentHTML('beforeend', html);
+    else productGrid.innerHTML = html;
   }
 
   /**
@@ -669,24 +718,24 @@
     const categoryCards = document.querySelectorAll('.category-card');
 
     categoryCards.forEach(card => {
-      card.addEventListener('click', () => {
+      card.addEventListener('click', async () => {
         const selectedDeptId = card.dataset.deptId;
-        const selectedDeptName = card.dataset.category; // lowercase name
 
         // Highlight active card
         categoryCards.forEach(c => c.classList.remove('active'));
         card.classList.add('active');
 
-        // Filter by DepartmentID OR DepartmentName (case-insensitive)
-        const filtered = (!selectedDeptId || selectedDeptId === 'all')
-          ? allProducts
-          : allProducts.filter(p => {
-              const deptIdMatch = p.DepartmentID && parseInt(p.DepartmentID) === parseInt(selectedDeptId);
-              const deptNameMatch = p.DepartmentName && p.DepartmentName.trim().toLowerCase() === selectedDeptName.trim().toLowerCase();
-              return deptIdMatch || deptNameMatch;
-            });
-
-        renderProducts(filtered);
+        // Only the first page is on the client, so ask the server for the department
+        productListing.department = (!selectedDeptId || selectedDeptId === 'all') ? null : selectedDeptId;
+        try {
+          const page = await fetchProductPage({ department: productListing.department });
+          productListing.cursor = page.next_cursor;
+          renderProducts(page.products);
+        } catch (err) {
+          console.error('Error filtering products:', err);
+          showNotification('Could not load products', 'error');
+        }
+        updateLoadMore();
       });
     });
   }
@@ -694,7 +743,8 @@
   // Initialize
   document.addEventListener('DOMContentLoaded', () => {
     renderProducts(allProducts);
-    setupCategoryFilters();
+    const loadMoreBtn = document.getElementById('loadMoreBtn');
+    if (loadMoreBtn) loadMoreBtn.addEventListener('click', loadMoreProducts);
   });
 
   // -------------------- Login --------------------
@@ -930,8 +980,8 @@
                   body: JSON.stringify(payload)
               });
               if (!res.ok) throw new Error(`HTTP ${res.status}`);
-              const data = await res.json();
-              tableBody.innerHTML = data.html || '<tr><td colspan="8">No results found</td></tr>';
+              const html = await res.text();
+              tableBody.innerHTML = html || '<tr><td colspan="8">No results found</td></tr>';
           } catch (err) {
               console.error(err);
               tableBody.innerHTML = '<tr><td colspan="8">Error loading report</td></tr>';
@@ -1056,8 +1106,8 @@
 
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
 
-        const data = await res.json();
-        tableBody.innerHTML = data.html || '<tr><td colspan="12">No results found</td></tr>';
+        const html = await res.text();
+        tableBody.innerHTML = html || '<tr><td colspan="12">No results found</td></tr>';
       } catch (err) {
         console.error(err);
         tableBody.innerHTML = '<tr><td colspan="12">Error loading report</td></tr>';
@@ -1182,8 +1232,8 @@
 
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
 
-        const data = await res.json();
-        tableBody.innerHTML = data.html || '<tr><td colspan="9">No results found</td></tr>';
+        const html = await res.text();
+        tableBody.innerHTML = html || '<tr><td colspan="9">No results found</td></tr>';
       } catch (err) {
         console.error(err);
         tableBody.innerHTML = '<tr><td colspan="9">Error loading report</td></tr>';
@@ -0,0 +1,159 @@
+import os
+import json
+import sqlite3
+import threading
+from types import SimpleNamespace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+# db.py refuses to import without credentials; nothing here connects
+for _name in ('DB_HOST', 'DB_USER', 'DB_PASSWORD', 'DB_NAME'):
+    os.environ.setdefault(_name, 'test')
+
+import images
+
+# -----------------------------
+# Stub image API
+# -----------------------------
+
+class StubImageAPI:
+    """
+    Stands in for the Unsplash random-photo endpoint. Queries containing
+    "missing" get a 404; everything else gets a URL derived from the query.
+    Clear `gate` to hold responses until it is set again.
+    """
+
+    def __init__(self):
+        self.queries = []
+        self.gate = threading.Event()
+        self.gate.set()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query).get("query", [""])[0]
+                api.queries.append(query)
+                api.gate.wait(5)
+                if "missing" in query:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = json.dumps({"urls": {"regular": api.url_for(query)}}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/photos/random"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @staticmethod
+    def url_for(query):
+        return "https://images.example/" + query.replace(" ", "-")
+
+    def close(self):
+        self.gate.set()
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    stub = StubImageAPI()
+    monkeypatch.setattr(images, "UNSPLASH_ACCESS_KEY", "test-key")
+    monkeypatch.setattr(images, "UNSPLASH_API_URL", stub.url)
+    monkeypatch.setattr(images, "image_cache", images.ImageCache(str(tmp_path / "image_cache.json")))
+    yield stub
+    stub.close()
+
+@pytest.fixture
+def products(monkeypatch):
+    """A Product table in SQLite, used by the background image update."""
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("CREATE TABLE Product (ProductID INTEGER PRIMARY KEY, Name TEXT, ImageURL TEXT)")
+    conn.commit()
+    lock = threading.Lock()
+    bumps = []
+    update = images._apply_image.__wrapped__   # the query, minus with_db
+
+    def apply_image(product_id, url):
+        with lock:
+            return update(conn.cursor(), conn, product_id, url)
+
+    monkeypatch.setattr(images, "_apply_image", apply_image)
+    monkeypatch.setattr(images, "bump_catalog_version", lambda: bumps.append(True))
+    monkeypatch.setattr(images.product_index, "refresh", lambda cursor, product_id: None)
+
+    def add(product_id, name, image_url=images.PLACEHOLDER_IMAGE_URL):
+        with lock:
+            conn.execute("INSERT INTO Product VALUES (?, ?, ?)", (product_id, name, image_url))
+            conn.commit()
+
+    def image_of(product_id):
+        with lock:
+            return conn.execute("SELECT ImageURL FROM Product WHERE ProductID = ?", (product_id,)).fetchone()[0]
+
+    yield SimpleNamespace(add=add, image_of=image_of, bumps=bumps)
+    conn.close()
+
+# -----------------------------
+# Tests
+# -----------------------------
+
+def test_placeholder_is_kept_until_the_lookup_finishes(api, products):
+    products.add(1, "Green Apple")
+    api.gate.clear()
+    future = images.schedule_image(1, "Green Apple")
+    try:
+        assert not future.done()
+        assert products.image_of(1) == images.PLACEHOLDER_IMAGE_URL
+    finally:
+        api.gate.set()
+    future.result(timeout=10)
+    assert products.image_of(1) == api.url_for("Green Apple")
+    assert products.bumps == [True]
+
+def test_image_is_only_swapped_in_over_the_placeholder(api, products):
+    products.add(1, "Green Apple", "https://cdn.example/chosen-by-hand.jpg")
+    images.schedule_image(1, "Green Apple").result(timeout=10)
+    assert products.image_of(1) == "https://cdn.example/chosen-by-hand.jpg"
+    assert products.bumps == []
+
+def test_hits_and_misses_are_persisted(api):
+    assert images.resolve_image("Green Apple") == api.url_for("Green Apple")
+    assert images.resolve_image("missing item") is None
+    assert images.resolve_image("green  APPLE") == api.url_for("Green Apple")
+    assert images.resolve_image("missing item") is None
+    assert api.queries == ["Green Apple", "missing item"]
+
+    reloaded = images.ImageCache(images.image_cache.path)
+    assert reloaded.lookup("Green Apple") == (True, api.url_for("Green Apple"))
+    assert reloaded.lookup("missing item") == (True, None)
+    assert reloaded.lookup("Red Apple") == (False, None)
+
+def test_cached_miss_expires_after_negative_ttl(api, monkeypatch):
+    monkeypatch.setattr(images, "IMAGE_NEGATIVE_TTL", 60)
+    now = [1_000_000.0]
+    monkeypatch.setattr(images, "time", SimpleNamespace(time=lambda: now[0]))
+
+    assert images.resolve_image("missing item") is None
+    now[0] += 59
+    assert images.resolve_image("missing item") is None
+    assert api.queries == ["missing item"]
+
+    now[0] += 2
+    assert images.cached_image("missing item") is None
+    assert images.image_cache.lookup("missing item") == (False, None)
+    assert images.resolve_image("missing item") is None
+    assert api.queries == ["missing item", "missing item"]
+
+def test_no_lookup_without_an_access_key(api, monkeypatch):
+    monkeypatch.setattr(images, "UNSPLASH_ACCESS_KEY", "")
+    assert images.fetch_stock_image("Green Apple") is None
+    assert api.queries == []